@@ -2,4 +2,6 @@
 
 from .bot import main
 
-main()
+# Guarded so that spawned worker processes do not start another bot
+if __name__ == '__main__':
+    main()
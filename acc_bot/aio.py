@@ -0,0 +1,119 @@
+"""Asyncio runtime processing updates concurrently with per-user ordering."""
+
+import asyncio
+import concurrent.futures
+import functools
+import logging
+from typing import Hashable, Optional
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import CallbackContext, Dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: Update) -> Optional[Hashable]:
+    """Return the key updates are ordered by: the user, or the chat if there is no user."""
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class AsyncRuntime:
+    """Run handlers registered in the dispatcher from an asyncio event loop.
+
+    Updates of different users are processed concurrently, while updates of
+    the same user are processed strictly in arrival order, so multi-step
+    scenarios like ``/add`` are kept intact. Coroutine handlers are awaited in
+    the loop, blocking ones, which all the bot handlers are, run in a pool of
+    ``concurrency`` threads. At most ``concurrency`` updates are scheduled at
+    a time, ``submit`` waits for one of them to finish before taking more.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, concurrency: int = 32, poll_timeout: int = 10):
+        """Prepare runtime for the dispatcher."""
+        self.dispatcher = dispatcher
+        self.concurrency = concurrency
+        self.poll_timeout = poll_timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(concurrency, thread_name_prefix='acc_bot handler')
+        self._tails: dict[Optional[Hashable], asyncio.Task] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def dispatch(self, update: Update) -> None:
+        """Pass the update to the first matching handler of every group."""
+        loop = asyncio.get_running_loop()
+        context = None
+        for group in self.dispatcher.groups:
+            for handler in self.dispatcher.handlers[group]:
+                check = handler.check_update(update)
+                if check is None or check is False:
+                    continue
+                if context is None:
+                    context = CallbackContext.from_update(update, self.dispatcher)
+                try:
+                    if asyncio.iscoroutinefunction(handler.callback):
+                        handler.collect_additional_context(context, update, self.dispatcher, check)
+                        await handler.callback(update, context)
+                    else:
+                        await loop.run_in_executor(self._executor, functools.partial(
+                            handler.handle_update, update, self.dispatcher, check, context))
+                except Exception as exc:  # pylint: disable=broad-except
+                    await loop.run_in_executor(self._executor, self.dispatcher.dispatch_error, update, exc)
+                break
+
+    async def _process_after(self, previous: Optional[asyncio.Task], update: Update) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.dispatch(update)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('Failed to process update %s', update.update_id)
+
+    def _finished(self, key: Optional[Hashable], task: asyncio.Task) -> None:
+        self._slots.release()
+        if self._tails.get(key) is task:
+            del self._tails[key]
+
+    async def submit(self, update: Update) -> asyncio.Task:
+        """Schedule the update after all earlier updates of the same user, once fewer are scheduled than allowed."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        await self._slots.acquire()
+        key = update_key(update)
+        task = asyncio.create_task(self._process_after(self._tails.get(key), update))
+        self._tails[key] = task
+        task.add_done_callback(functools.partial(self._finished, key))
+        return task
+
+    async def drain(self) -> None:
+        """Wait until all scheduled updates are processed."""
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+    async def poll(self) -> None:
+        """Fetch updates with long polling and schedule them forever."""
+        loop = asyncio.get_running_loop()
+        offset = 0
+        while True:
+            try:
+                updates = await loop.run_in_executor(None, functools.partial(
+                    self.dispatcher.bot.get_updates, offset=offset, timeout=self.poll_timeout))
+            except TelegramError:
+                logger.exception('Failed to fetch updates')
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.submit(update)
+
+    def run(self) -> None:
+        """Serve updates until interrupted."""
+        try:
+            asyncio.run(self.poll())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,89 @@
+"""Vectorized spending analytics over array-backed history.
+
+Functions work on NumPy views of the ledger columns. A view locks the
+underlying ``array.array`` against resizing, so views are never stored and
+results are returned as plain Python values.
+"""
+
+import numpy as np
+
+
+def columns(ledger) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return zero-copy ``(ts, codes, amounts)`` views of the ledger columns."""
+    return (np.frombuffer(ledger.ts, dtype=np.int64),
+            np.frombuffer(ledger.codes, dtype=np.uint8),
+            np.frombuffer(ledger.amounts, dtype=np.int64))
+
+
+def category_stats(codes: np.ndarray, amounts: np.ndarray) -> dict[int, tuple[int, int]]:
+    """Return ``(sum, count)`` of amounts by category code for codes present in the data."""
+    counts = np.bincount(codes)
+    sums = np.bincount(codes, weights=amounts, minlength=len(counts))
+    return {code: (int(sums[code]), int(counts[code])) for code in np.flatnonzero(counts).tolist()}
+
+
+def bucket_sums(ts: np.ndarray, codes: np.ndarray, amounts: np.ndarray, width: int) -> dict[int, dict[int, int]]:
+    """Sum amounts by category code within time buckets of the given width in ticks.
+
+    Timestamps must be sorted, as they are in a ledger.
+    """
+    if not len(ts):
+        return {}
+    categories = int(codes.max()) + 1
+    buckets = ts // width
+    starts = np.empty(len(buckets), dtype=bool)
+    starts[0] = True
+    np.not_equal(buckets[1:], buckets[:-1], out=starts[1:])
+    keys, inverse = buckets[starts], np.cumsum(starts) - 1
+    cells = inverse * categories + codes
+    size = len(keys) * categories
+    counts = np.bincount(cells, minlength=size).reshape(len(keys), categories)
+    sums = np.bincount(cells, weights=amounts, minlength=size).reshape(len(keys), categories)
+    return {key: {code: int(sums[row, code]) for code in np.flatnonzero(counts[row]).tolist()}
+            for row, key in enumerate(keys.tolist())}
+
+
+def category_prefix_sums(ts: np.ndarray, codes: np.ndarray,
+                         amounts: np.ndarray) -> dict[int, tuple[np.ndarray, np.ndarray]]:
+    """Return timestamps and running amount sums of each category code present in the data."""
+    return {code: (ts[mask], np.cumsum(amounts[mask]))
+            for code in np.unique(codes).tolist() for mask in [codes == code]}
+
+
+def grouped_totals(groups: np.ndarray, codes: np.ndarray,
+                   amounts: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sum amounts by group number and category code in 64-bit integers.
+
+    Returns group numbers, codes and sums of the cells present in the data,
+    sorted by group and code, so the result grows with the data and not with
+    the number of groups times categories.
+    """
+    # Codes are unsigned bytes
+    cells = groups.astype(np.int64) * 256 + codes
+    order = np.argsort(cells, kind='stable')
+    cells = cells[order]
+    starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1]))) if len(cells) else cells
+    sums = np.add.reduceat(amounts[order].astype(np.int64), starts) if len(cells) else cells
+    return cells[starts] // 256, (cells[starts] % 256).astype(np.uint8), sums
+
+
+def span_totals(ts: np.ndarray, amounts: np.ndarray, now: int, step: int) -> list[int]:
+    """Total spendings in spans of ``step`` ticks going back from ``now``, oldest first.
+
+    The newest span also includes spendings after ``now``; spans are added
+    until the oldest spending is covered.
+    """
+    if not len(ts):
+        return []
+    count = max(1, -(-(now - int(ts[0])) // step))
+    lowers = now - step * np.arange(count, 0, -1, dtype=np.int64)
+    prefix = np.concatenate(([0], np.cumsum(amounts)))
+    edges = np.append(np.searchsorted(ts, lowers), len(ts))
+    return np.diff(prefix[edges]).tolist()
+
+
+def trend_prediction(totals: list[int]) -> int:
+    """Predict the next value of the series with a least squares linear trend."""
+    x_data = np.c_[np.ones(len(totals)), np.arange(len(totals))]
+    weights = np.linalg.lstsq(x_data, np.asarray(totals, dtype=np.float64), rcond=None)[0]
+    return int(weights[0] + weights[1] * len(totals))
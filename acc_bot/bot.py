@@ -4,21 +4,28 @@ Simple Bot to reply to Telegram messages.
 First, a few handler functions are defined. Then, those functions are passed to
 the Application and registered at their respective places.
 Then, the bot is started and runs until we press Ctrl-C on the command line.
+
+Modules needed only by some commands or runtimes, like the plotting stack,
+NumPy or the test data, are imported on first use to keep startup fast.
 """
 
 import sys
 import os
+import io
+import argparse
+import tempfile
 import datetime
-import gettext
 import locale
+import signal
+import logging
+from typing import Callable, Optional, Sequence
 
-from telegram import (
-    Update,
-    ReplyKeyboardMarkup
-)
+from telegram import Message, Update
 from telegram.ext import (
     Updater,
+    Dispatcher,
     Filters,
+    MessageFilter,
     MessageHandler,
     CommandHandler,
     CallbackContext,
@@ -34,45 +41,95 @@ from acc_bot.util import (  # noqa: E402
     check_limit,
     gater_week,
     make_spending_prediction,
-    make_pie
+    render_pie
 )
-from acc_bot.test_data import load_test_data_1, load_test_data_2  # noqa: E402
-
-gettext.install("bot", os.path.dirname(__file__), names=("ngettext",))
-
-CATEGORIES = [
-    [_('restaurants'), _('transport')],
-    [_('supermarkets'), _('pharmacy')],
-    [_('entertainment'), _('other')]
-]
-CATEGORIES_FLAT = [
-    _('restaurants'), _('transport'), _('supermarkets'),
-    _('pharmacy'), _('entertainment'), _('other')
-]
-CATEGORIES_FILTER = Filters.regex('^' + '|'.join(CATEGORIES_FLAT) + '$')
-NUMBERS_FILTER = Filters.regex('^[0-9]+$')
+from acc_bot.config import parse_config  # noqa: E402
+from acc_bot.entry import is_batch  # noqa: E402
+from acc_bot.exchange import FORMATS, SpendingReader, format_of, write_spendings  # noqa: E402
+from acc_bot.forecast import Forecaster  # noqa: E402
+from acc_bot.i18n import (  # noqa: E402
+    CATEGORIES_FLAT,
+    DEFAULT_LOCALE,
+    LOCALES,
+    N_,
+    Catalog,
+    category_pattern,
+    choose_locale,
+    get_catalog
+)
+from acc_bot.ledger import MAX_AMOUNT, Ledger, to_ticks  # noqa: E402
+from acc_bot.metrics import REGISTRY, Registry, instrument, serve  # noqa: E402
+from acc_bot.profiling import MODES, PROFILER  # noqa: E402
+from acc_bot.report import KEYWORDS, parse_report  # noqa: E402
+from acc_bot.session import AMOUNT_STEP, State, get_session  # noqa: E402
+from acc_bot.storage import Storage, UserStore, WriteBehind  # noqa: E402
+from acc_bot.throttle import Coalescer, RateLimiter  # noqa: E402
+from acc_bot.workers import PoolBusy, RenderPool  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN = '5337419761:AAFahgNMGQNpzyRvFFlS3_N_-9DyfNB5bfQ'
+# Requests per second and burst of the expensive commands, the others share the default
+RATE_LIMITS = {
+    'weeks': (0.2, 3),
+    'chart': (0.2, 3),
+    'forecast': (0.2, 3),
+    'export': (0.1, 2),
+    'import_document': (0.05, 2),
+}
+LIMITER = RateLimiter(RATE_LIMITS)
+COALESCER = Coalescer()
+ADMINS = frozenset(int(user_id) for user_id in os.environ.get('ACC_BOT_ADMINS', '').split(',') if user_id)
 AGGRESSION_LEVEL = [
-    _('Sorry, I dont understand.'),
-    _('I dont understand🧐'),
-    _('I dont understand!🤬'),
-    _('STOP!✋')
+    N_('Sorry, I dont understand.'),
+    N_('I dont understand🧐'),
+    N_('I dont understand!🤬'),
+    N_('STOP!✋')
 ]
+HELP = (
+    N_("This is a help message\n"),
+    N_("/add - add spending for specific category.\n"),
+    N_("You can also just type '120 restaurants' or several such lines at once.\n"),
+    N_("/set_limit - set the limit for the category.\n"),
+    N_("/week show stats for the last week.\n"),
+    N_("/weeks show accumulated stats for the whole history."),
+    N_("\n/report [from] [to] [category] show spendings of a period, like /report 2022-05 or /report week transport."),
+    N_("\n/forecast forecast next week spendings by category."),
+    N_("\n/import import spendings from CSV or JSON lines document."),
+    N_("\n/export [csv|jsonl] export all spendings."),
+    N_("\n/lang [en|ru] choose the language.")
+)
+
+
+def get_users(context: CallbackContext) -> UserStore:
+    """Return the store of user ledgers, creating an in-memory one if none is configured."""
+    if 'users' not in context.bot_data:
+        context.bot_data['users'] = UserStore()
+    return context.bot_data['users']
+
+
+def get_user(update: Update, context: CallbackContext) -> dict:
+    """Return ledger & limits record of the user who sent the update."""
+    return get_users(context).get(update.effective_user.id)
+
+
+def user_catalog(update: Update, context: CallbackContext) -> Catalog:
+    """Return translation catalog of the user, guessing the locale from Telegram on first use."""
+    session = get_session(context.user_data)
+    if session.lang is None:
+        session.lang = choose_locale(update.effective_user.language_code)
+    return get_catalog(session.lang)
 
 
 def reset_context(context: dict) -> None:
     """Reset context of a specific user."""
-    context.pop('to_add', None)
-    if 'data' not in context:
-        context['data'] = {}
-    if 'limits' not in context:
-        context['limits'] = {}
-    context['aggression_lvl'] = 0
-    context['context'] = 'free'
+    get_session(context).reset()
 
 
 def start(update: Update, context: CallbackContext) -> None:
     """Send a message when the command /start is issued."""
     reset_context(context.user_data)
+    _ = user_catalog(update, context).gettext
     welcome_txt = _('Hey! Im an accountant bot.\nIll help u managing ur finances!')
     update.message.reply_text(text=welcome_txt)
 
@@ -80,61 +137,140 @@ def start(update: Update, context: CallbackContext) -> None:
 def unknown_cmd(update: Update, context: CallbackContext) -> None:
     """Reply to an unknown command."""
     reset_context(context.user_data)
+    _ = user_catalog(update, context).gettext
     update.message.reply_text(_('Unknown cmd 🥵'))
 
 
+def rate_limited(update: Update, context: CallbackContext, denied: int) -> None:
+    """Warn the user flooding the bot, once per flood."""
+    if denied == 1:
+        update.message.reply_text(user_catalog(update, context).gettext('Too many requests, please wait a bit ⏳'))
+
+
 def dont_understand(update: Update, context: CallbackContext) -> None:
     """Reply to meaningless input. Supports different levels of annoyance."""
-    if context.user_data['context'] == 'free':
+    _ = user_catalog(update, context).gettext
+    session = get_session(context.user_data)
+    if session.state is State.FREE:
         update.message.reply_text(
-            AGGRESSION_LEVEL[min(
+            _(AGGRESSION_LEVEL[min(
                 len(AGGRESSION_LEVEL) - 1,
-                context.user_data['aggression_lvl']
-            )]
+                session.aggression
+            )])
         )
-        context.user_data['aggression_lvl'] += 1
+        session.aggression += 1
         return
     reset_context(context.user_data)
     update.message.reply_text(_('Wrong input'))
     return
 
 
+def limit_warning(catalog: Catalog, record: dict, cat: str) -> str:
+    """Describe how this week spendings of the category compare to its limit."""
+    _ = catalog.gettext
+    cat_spent, cat_lim = check_limit(record, cat)
+    if not cat_lim:
+        return ''
+    if cat_spent > cat_lim:
+        return _('\nYouve exceeded your weekly limit for the category {} 😱').format(cat_lim)
+    return _('\nYouve already spent {} of you limit {} for this week').format(cat_spent, cat_lim)
+
+
+def add_entries(update: Update, context: CallbackContext, text: str) -> bool:
+    """Record spendings typed one per line as 'amount category' or 'category amount'.
+
+    Replies with the result and returns False if no spending was recognized.
+    """
+    catalog = user_catalog(update, context)
+    _, ngettext = catalog.gettext, catalog.ngettext
+    entries, rejected = catalog.parser.parse(text)
+    if not entries:
+        return False
+
+    users = get_users(context)
+    user_id = update.effective_user.id
+    now = to_ticks(datetime.datetime.now())
+    users.extend(user_id, [(now, cat, val) for cat, val in entries])
+
+    rep_txt = [ngettext('Added {} spending:', 'Added {} spendings:', len(entries)).format(len(entries))]
+    rep_txt.extend(f'\n - {catalog.name(cat)}: {val}' for cat, val in entries)
+    record = users.get(user_id)
+    rep_txt.extend(limit_warning(catalog, record, cat) for cat in dict.fromkeys(entry[0] for entry in entries))
+    if rejected:
+        rep_txt.append(_('\nNot understood: {}').format('; '.join(rejected)))
+    update.message.reply_text(''.join(rep_txt))
+    return True
+
+
+def quick_add(update: Update, context: CallbackContext) -> None:
+    """Handle spendings typed in one message without the /add scenario."""
+    reset_context(context.user_data)
+    if not add_entries(update, context, update.message.text):
+        catalog = user_catalog(update, context)
+        lines = [catalog.parser.split_line(line) for line in update.message.text.splitlines()]
+        if any(parts is not None and parts[1] > MAX_AMOUNT and catalog.parser.category(parts[0])
+               for parts in lines):
+            update.message.reply_text(catalog.gettext('The amount is too large, at most {} is allowed').format(
+                MAX_AMOUNT))
+            return
+        update.message.reply_text(catalog.gettext('Unknown category, choose one of: {}').format(
+            ', '.join(catalog.names.values())))
+
+
+class BatchFilter(MessageFilter):
+    """Messages of one or several spending lines."""
+
+    def filter(self, message: Message) -> bool:
+        """Check the message text is a batch of spendings."""
+        return bool(message.text) and is_batch(message.text)
+
+
 def add(update: Update, context: CallbackContext) -> None:
-    """Handle add spending scenario. Switches the context & provides interactive keyboard."""
+    """Handle add spending scenario. Switches the context & provides interactive keyboard.
+
+    Spendings given right after the command, like '/add transport 45', are recorded at once.
+    """
     reset_context(context.user_data)
-    context.user_data['context'] = 'cat_chooser_add'
+    parts = update.message.text.split(maxsplit=1)
+    if len(parts) > 1 and add_entries(update, context, parts[1]):
+        return
+    get_session(context.user_data).state = State.CHOOSE_SPENDING
+    catalog = user_catalog(update, context)
     update.message.reply_text(
-        text=_('Please, choose category:'),
-        reply_markup=ReplyKeyboardMarkup(CATEGORIES, one_time_keyboard=True)
+        text=catalog.gettext('Please, choose category:'),
+        reply_markup=catalog.keyboard
     )
 
 
 def set_limit(update: Update, context: CallbackContext) -> None:
     """Handle set limit scenario. Switches the context & provides interactive keyboard."""
     reset_context(context.user_data)
-    context.user_data['context'] = 'cat_chooser_lim'
+    get_session(context.user_data).state = State.CHOOSE_LIMIT
+    catalog = user_catalog(update, context)
     update.message.reply_text(
-        text=_('Please, choose category:'),
-        reply_markup=ReplyKeyboardMarkup(CATEGORIES, one_time_keyboard=True)
+        text=catalog.gettext('Please, choose category:'),
+        reply_markup=catalog.keyboard
     )
 
 
 def category_chooser(update: Update, context: CallbackContext) -> None:
     """Interactive keyboard input handler. Saves chosen result and switches the context."""
-    if context.user_data['context'] != 'cat_chooser_add' and \
-            context.user_data['context'] != 'cat_chooser_lim':
+    catalog = user_catalog(update, context)
+    _ = catalog.gettext
+    category = catalog.category(update.message.text)
+    session = get_session(context.user_data)
+    if session.state not in AMOUNT_STEP or category is None:
         reset_context(context.user_data)
         update.message.reply_text(_('Wrong input'))
         return
 
-    context.user_data['curr_category'] = update.message.text
+    session.category = category
+    session.state = AMOUNT_STEP[session.state]
 
     rep_txt = ''
-    if context.user_data['context'] == 'cat_chooser_lim':
-        context.user_data['context'] = 'cat_upd_lim'
+    if session.state is State.LIMIT_AMOUNT:
         rep_txt = _('Type new limit')
     else:
-        context.user_data['context'] = 'cat_upd_add'
         rep_txt = _('Type the amount spent')
 
     update.message.reply_text(rep_txt)
@@ -143,37 +279,32 @@ def category_chooser(update: Update, context: CallbackContext) -> None:
 def category_upd(update: Update, context: CallbackContext) -> None:
     """Handle 'add category spending' and 'set category limit' scanarios.
 
-    Saves the result to 'context.user_data' and replies with success message.
+    Saves the result to the user store and replies with success message.
     Resets the context.
     """
-    if context.user_data['context'] != 'cat_upd_add' and \
-            context.user_data['context'] != 'cat_upd_lim':
+    catalog = user_catalog(update, context)
+    _ = catalog.gettext
+    session = get_session(context.user_data)
+    val = int(update.message.text)
+    if session.state not in (State.SPENDING_AMOUNT, State.LIMIT_AMOUNT) or val > MAX_AMOUNT:
         reset_context(context.user_data)
         update.message.reply_text(_('Wrong input'))
         return
 
     rep_txt = ''
-    cat = context.user_data['curr_category']
-    val = int(update.message.text)
+    cat = session.category
 
-    if context.user_data['context'] == 'cat_upd_add':
-        if 'data' not in context.user_data:
-            context.user_data['data'] = {}
-        cur_time = datetime.datetime.now()
-        context.user_data['data'][cur_time] = (cat, val)
-        rep_txt = _('Category {} was updated!').format(cat)
+    users = get_users(context)
+    user_id = update.effective_user.id
+
+    if session.state is State.SPENDING_AMOUNT:
+        users.add_spending(user_id, datetime.datetime.now(), cat, val)
+        rep_txt = _('Category {} was updated!').format(catalog.name(cat))
         # Check if exceeds limit
-        cat_spent, cat_lim = check_limit(context.user_data, cat)
-        if cat_lim:
-            if cat_spent > cat_lim:
-                rep_txt += _('\nYouve exceeded your weekly limit for the category {} 😱').format(cat_lim)
-            else:
-                rep_txt += _('\nYouve already spent {} of you limit {} for this week').format(cat_spent, cat_lim)
+        rep_txt += limit_warning(catalog, users.get(user_id), cat)
     else:
-        if 'limits' not in context.user_data:
-            context.user_data['limits'] = {}
-        context.user_data['limits'][cat] = val
-        rep_txt = _('Limit for {} category was updated!').format(cat)
+        users.set_limit(user_id, cat, val)
+        rep_txt = _('Limit for {} category was updated!').format(catalog.name(cat))
 
     update.message.reply_text(rep_txt)
     reset_context(context.user_data)
@@ -182,12 +313,15 @@ def category_upd(update: Update, context: CallbackContext) -> None:
 def week(update: Update, context: CallbackContext) -> None:
     """Show the user spendings for the last week."""
     reset_context(context.user_data)
+    catalog = user_catalog(update, context)
+    _, ngettext = catalog.gettext, catalog.ngettext
+    ledger = get_user(update, context)['data']
 
-    if 'data' not in context.user_data or len(context.user_data['data']) == 0:
+    if len(ledger) == 0:
         update.message.reply_text(_('You havent spent any money this week 😢'))
         return
 
-    week_spendings = gater_week(context.user_data['data'])
+    week_spendings = gater_week(ledger)
     total = 0
     for val in week_spendings.values():
         total += val
@@ -196,97 +330,377 @@ def week(update: Update, context: CallbackContext) -> None:
         update.message.reply_text(_('You havent spent any money this week 😢'))
         return
 
-    res_msg = _('Wow!🤩 Heres your top spenings of this week:\n\n')
+    res_msg = [_('Wow!🤩 Heres your top spenings of this week:\n\n')]
     for num, item in enumerate(sorted(week_spendings.items(), key=lambda x: -x[1])):
-        res_msg += f'{num+1}. {item[0]}: {item[1]}\n'
-    res_msg += _('\nAnd the total is: {} moneys!💸').format(total)
-    res_msg += ngettext('\nOnly {} category present',
-                        '\n{} categories present!', len(week_spendings)).format(len(week_spendings))
-    update.message.reply_text(res_msg)
+        res_msg.append(f'{num+1}. {catalog.name(item[0])}: {item[1]}\n')
+    res_msg.append(_('\nAnd the total is: {} moneys!💸').format(total))
+    res_msg.append(ngettext('\nOnly {} category present',
+                            '\n{} categories present!', len(week_spendings)).format(len(week_spendings)))
+    update.message.reply_text(''.join(res_msg))
+
+
+def weeks_report(catalog: Catalog, ledger: Ledger) -> str:
+    """Describe week totals of the whole history and the prediction for the next week."""
+    _ = catalog.gettext
+    if len(ledger) == 0:
+        return _('You havent spent any money this week 😢')
+
+    week_totals = accumulate_by_span(ledger, datetime.timedelta(days=7))
+
+    if len(week_totals) < 2:
+        return _('Too few data 😔')
+
+    res_msg = [_('Your week totals:\n\n')]
+    res_msg.extend(f' - {i}\n' for i in reversed(week_totals))
+    res_msg.append(_('\nBy the way, we predict you to spend {} next week!').format(
+        make_spending_prediction(ledger, week_totals)))
+    return ''.join(res_msg)[:-1]
 
 
 def weeks(update: Update, context: CallbackContext) -> None:
-    """Collect spending statistics throughout the whole history."""
+    """Collect spending statistics throughout the whole history.
+
+    Repeated requests for unchanged history share one computation.
+    """
     reset_context(context.user_data)
+    catalog = user_catalog(update, context)
+    ledger = get_user(update, context)['data']
+    update.message.reply_text(COALESCER.run(('weeks', catalog.code, ledger, ledger.version),
+                                            weeks_report, catalog, ledger))
 
-    if 'data' not in context.user_data or len(context.user_data['data']) == 0:
-        update.message.reply_text(_('You havent spent any money this week 😢'))
+
+def report(update: Update, context: CallbackContext) -> None:
+    """Show the user spendings within a period by category, or of one category.
+
+    '/report 2022-05-01 2022-05-15 transport' reports the range, periods are
+    also months like 2022-05, ISO weeks like 2022-W20 or the current today,
+    week, month or year. With no period the current month is reported.
+    """
+    reset_context(context.user_data)
+    catalog = user_catalog(update, context)
+    _ = catalog.gettext
+    try:
+        start, end, category = parse_report(context.args, datetime.datetime.now(), catalog.parser)
+    except ValueError:
+        update.message.reply_text(_('Usage: /report [from] [to] [category], periods are dates like 2022-05-16, '
+                                    'months like 2022-05, weeks like 2022-W20 or one of: {}').format(
+            ', '.join(KEYWORDS)))
         return
 
-    week_totals = accumulate_by_span(context.user_data['data'], datetime.timedelta(days=7))
+    ledger = get_user(update, context)['data']
+    last = (end - datetime.timedelta(days=1)).date()
+    if category is not None:
+        update.message.reply_text(_('{} from {} to {}: {} moneys').format(
+            catalog.name(category), start.date(), last, ledger.total(start, end, category)))
+        return
 
-    if len(week_totals) < 2:
-        update.message.reply_text(_('Too few data 😔'))
+    totals = ledger.totals(start, end)
+    if not totals:
+        update.message.reply_text(_('No spendings from {} to {} 😢').format(start.date(), last))
         return
+    res_msg = [_('Spendings from {} to {}:\n\n').format(start.date(), last)]
+    for num, (cat, val) in enumerate(sorted(totals.items(), key=lambda x: -x[1])):
+        res_msg.append(f'{num+1}. {catalog.name(cat)}: {val}\n')
+    res_msg.append(_('\nAnd the total is: {} moneys!💸').format(sum(totals.values())))
+    update.message.reply_text(''.join(res_msg))
 
-    res_msg = _('Your week totals:\n\n')
-    for i in reversed(week_totals):
-        res_msg += f' - {i}\n'
 
-    res_msg += _('\nBy the way, we predict you to spend {} next week!').format(
-        make_spending_prediction(context.user_data['data']))
-    update.message.reply_text(res_msg[:-1])
+def forecast(update: Update, context: CallbackContext) -> None:
+    """Forecast next week spendings by category from the cached models."""
+    reset_context(context.user_data)
+    catalog = user_catalog(update, context)
+    _ = catalog.gettext
+    record = get_user(update, context)
+    forecaster = record.get('forecaster')
+    if forecaster is None or forecaster.ledger is not record['data']:
+        forecaster = record['forecaster'] = Forecaster(record['data'])
+    forecasts = forecaster.forecasts(datetime.datetime.now())
+
+    if not forecasts:
+        update.message.reply_text(_('Too few data 😔'))
+        return
+
+    res_msg = [_('Next week forecast (trend with 95% band, 4 week average, smoothed):\n\n')]
+    for cat, models in forecasts.items():
+        trend = models['trend']
+        res_msg.append(f'{catalog.name(cat)}: {trend.value} ({trend.low}-{trend.high}), '
+                       f'{models["moving_average"].value}, {models["smoothing"].value}\n')
+    update.message.reply_text(''.join(res_msg)[:-1])
 
 
 def chart(update: Update, context: CallbackContext) -> None:
-    """Plot a pie char with weekly spendings."""
-    make_pie(context.user_data['data'])
-    with open('tmp.png', 'rb') as photo:
-        update.message.reply_photo(photo=photo)
-    os.remove('tmp.png')
+    """Plot a pie char with weekly spendings.
+
+    Rendering runs in the render pool if one is configured, the photo is sent once it is ready.
+    """
+    catalog = user_catalog(update, context)
+    _ = catalog.gettext
+    ledger = get_user(update, context)['data']
+    week_spendings = tuple((catalog.name(cat), val) for cat, val in gater_week(ledger).items())
+    pool = context.bot_data.get('render_pool')
+    if pool is None:
+        update.message.reply_photo(photo=COALESCER.run(('chart', week_spendings), render_pie, week_spendings))
+        return
+
+    def send(photo: bytes, error: Exception) -> None:
+        if error is None:
+            update.message.reply_photo(photo=photo)
+        elif isinstance(error, TimeoutError):
+            update.message.reply_text(_('Drawing takes too long, please try again later ⏳'))
+        else:
+            update.message.reply_text(_('Could not draw the chart 😔'))
+
+    try:
+        pool.submit(send, render_pie, week_spendings)
+    except PoolBusy:
+        update.message.reply_text(_('Too many charts are being drawn, please try again later ⏳'))
+
+
+def import_help(update: Update, context: CallbackContext) -> None:
+    """Explain how to import spendings."""
+    reset_context(context.user_data)
+    _ = user_catalog(update, context).gettext
+    update.message.reply_text(_('Send a CSV document with columns time,category,amount '
+                                'or a JSON lines document with the same keys.\n'
+                                'Time is in ISO format like 2022-05-16T15:58, categories are: {}').format(
+        ', '.join(CATEGORIES_FLAT)))
+
+
+def import_document(update: Update, context: CallbackContext) -> None:
+    """Import spendings from the sent document, merging them into the history at once."""
+    reset_context(context.user_data)
+    _ = user_catalog(update, context).gettext
+    document = update.message.document
+    fmt = format_of(document.file_name)
+    if fmt is None:
+        update.message.reply_text(_('Only .csv and .jsonl documents can be imported'))
+        return
+
+    # SpooledTemporaryFile of Python 3.9 cannot be wrapped into a text stream
+    with tempfile.TemporaryFile() as buffer:
+        context.bot.get_file(document.file_id).download(out=buffer)
+        buffer.seek(0)
+        reader = SpendingReader(io.TextIOWrapper(buffer, encoding='utf-8-sig'), fmt, CATEGORIES_FLAT)
+        # Merging every chunk would rebuild the indexes each time the rows are not newer than the history
+        rows = [row for chunk in reader.chunks() for row in chunk]
+    get_users(context).extend(update.effective_user.id, rows)
+
+    rep_txt = _('Imported {} spendings').format(len(rows))
+    if reader.skipped:
+        rep_txt += _('\nSkipped {} invalid rows:\n').format(reader.skipped) + '\n'.join(reader.errors)
+    update.message.reply_text(rep_txt)
+
+
+def export(update: Update, context: CallbackContext) -> None:
+    """Send the whole spending history as a CSV or JSON lines document."""
+    reset_context(context.user_data)
+    _ = user_catalog(update, context).gettext
+    fmt = context.args[0].lower() if context.args else 'csv'
+    if fmt not in FORMATS:
+        update.message.reply_text(_('Format should be one of: {}').format(', '.join(FORMATS)))
+        return
+
+    with tempfile.SpooledTemporaryFile(max_size=1 << 20) as buffer:
+        write_spendings(buffer, get_user(update, context)['data'], fmt)
+        buffer.seek(0)
+        update.message.reply_document(document=buffer, filename=f'spendings.{fmt}')
 
 
 def bot_help(update: Update, context: CallbackContext) -> None:
     """Reply with the help message."""
     reset_context(context.user_data)
-    help_msg = _("This is a help message\n")
-    help_msg += _("/add - add spending for specific category.\n")
-    help_msg += _("/set_limit - set the limit for the category.\n")
-    help_msg += _("/week show stats for the last week.\n")
-    help_msg += _("/weeks show accumulated stats for the whole history.")
-    update.message.reply_text(help_msg)
+    update.message.reply_text(user_catalog(update, context).join(*HELP))
+
+
+def lang(update: Update, context: CallbackContext) -> None:
+    """Switch the user language or show the current one."""
+    reset_context(context.user_data)
+    session = get_session(context.user_data)
+    if context.args and context.args[0].lower() in LOCALES:
+        session.lang = context.args[0].lower()
+    _ = user_catalog(update, context).gettext
+    update.message.reply_text(_('Language: {}, available: {}').format(session.lang, ', '.join(LOCALES)))
+
+
+def profile(update: Update, context: CallbackContext) -> None:
+    """Switch handler profiling, for admins only.
+
+    '/profile 0.05' profiles 5% of updates, '/profile user 42' all updates of the user,
+    a trailing 'sampling' writes sampled stacks instead of pstats, '/profile off' stops.
+    """
+    reset_context(context.user_data)
+    if update.effective_user.id not in ADMINS:
+        unknown_cmd(update, context)
+        return
+    args = [arg.lower() for arg in context.args]
+    mode = args.pop() if args and args[-1] in MODES else MODES[0]
+    try:
+        if args == ['off']:
+            PROFILER.disable()
+        elif len(args) == 2 and args[0] == 'user':
+            PROFILER.enable(user_id=int(args[1]), mode=mode)
+        elif len(args) == 1:
+            PROFILER.enable(float(args[0]), mode=mode)
+        elif args:
+            raise ValueError('Usage: /profile [off | <fraction> | user <id>] [sampling]')
+    except ValueError as exc:
+        update.message.reply_text(str(exc))
+        return
+    update.message.reply_text(PROFILER.status())
 
 
 def load_test_1(update: Update, context: CallbackContext) -> None:
-    """Load prepared testing data to context.user_data['data']."""
+    """Load prepared testing data as the user spendings."""
     reset_context(context.user_data)
-    context.user_data['data'] = load_test_data_1()
+    from acc_bot.test_data import load_test_data_1  # pylint: disable=import-outside-toplevel
+    get_users(context).replace(update.effective_user.id, Ledger.from_dict(load_test_data_1()))
     update.message.reply_text('Test data 1 loaded')
 
 
 def load_test_2(update: Update, context: CallbackContext) -> None:
-    """Load prepared testing data to context.user_data['data']."""
+    """Load prepared testing data as the user spendings."""
     reset_context(context.user_data)
-    context.user_data['data'] = load_test_data_2()
+    from acc_bot.test_data import load_test_data_2  # pylint: disable=import-outside-toplevel
+    get_users(context).replace(update.effective_user.id, Ledger.from_dict(load_test_data_2()))
     update.message.reply_text('Test data 2 loaded')
 
 
-def main():
-    """Call main application."""
+def register_handlers(dispatcher: Dispatcher, registry: Registry = REGISTRY) -> None:
+    """Register all the bot handlers in the dispatcher, instrumented with the metrics registry."""
+    # Category names of every locale are known only once all catalogs are loaded
+    categories_filter = Filters.regex(category_pattern())
+    handlers = [
+        CommandHandler('start', start),
+        CommandHandler('add', add),
+        CommandHandler('set_limit', set_limit),
+        CommandHandler('help', bot_help),
+        CommandHandler('week', week),
+        CommandHandler('weeks', weeks),
+        CommandHandler('report', report),
+        CommandHandler('chart', chart),
+        CommandHandler('forecast', forecast),
+        CommandHandler('import', import_help),
+        CommandHandler('export', export),
+        CommandHandler('lang', lang),
+        CommandHandler('profile', profile),
+        MessageHandler(Filters.document, import_document),
+        CommandHandler('load_test_1', load_test_1),
+        CommandHandler('load_test_2', load_test_2),
+        MessageHandler(categories_filter, category_chooser),
+        MessageHandler(Filters.regex('^[0-9]+$'), category_upd),
+        MessageHandler(BatchFilter(), quick_add),
+        MessageHandler(Filters.command, unknown_cmd),
+        MessageHandler(Filters.text, dont_understand),
+    ]
+    for handler in handlers:
+        handler.callback = instrument(LIMITER.wrap(PROFILER.wrap(handler.callback), rate_limited), registry)
+        dispatcher.add_handler(handler)
+
+
+def start_services(updater: Updater, config: argparse.Namespace, shard: Optional[int] = None) -> Callable[[], None]:
+    """Attach storage, the user store and periodic jobs to the updater, return the function closing them.
+
+    A shard worker process draws charts itself, starts no metrics server and
+    only the first shard writes snapshots of the shared database.
+    """
+    dispatcher = updater.dispatcher
+    storage = Storage(config.db)
+    snapshot = snapshots = None
+    if config.snapshot:
+        from acc_bot.snapshot import Snapshot, SnapshotWriter  # pylint: disable=import-outside-toplevel
+        if os.path.exists(config.snapshot):
+            snapshot = Snapshot(config.snapshot)
+            logger.info('restoring %d users from snapshot %s', len(snapshot), config.snapshot)
+        if not shard:
+            snapshots = SnapshotWriter(storage, config.snapshot, config.snapshot_interval)
+    users = UserStore(storage, writer=WriteBehind(storage), snapshot=snapshot)
+    dispatcher.bot_data['users'] = users
+    if shard is None:
+        dispatcher.bot_data['render_pool'] = RenderPool()
+    updater.job_queue.run_repeating(lambda _: users.evict_idle(), interval=600)
+    updater.job_queue.run_repeating(lambda _: logger.info('write-behind: %s', users.writer.stats()), interval=60)
+    updater.job_queue.run_repeating(lambda _: logger.info('metrics:\n%s', REGISTRY.summary()),
+                                    interval=config.metrics_interval)
+    if config.metrics_port is not None and shard is None:
+        serve(config.host, config.metrics_port)
+    outbox = None
+    if config.digest_time or config.alert_interval:
+        from acc_bot.digest import Digests, Outbox  # pylint: disable=import-outside-toplevel
+        shards = 1 if shard is None else config.shards
+        outbox = Outbox(updater.bot, rate=config.send_rate / shards)
+        digests = Digests(dispatcher, users, outbox, shard or 0, shards)
+        if config.digest_time:
+            # The job queue runs in UTC, Monday of the local time may fall on Sunday there
+            local = datetime.datetime.combine(datetime.date.today(),
+                                              datetime.time.fromisoformat(config.digest_time)).astimezone()
+            moment = local.astimezone(datetime.timezone.utc)
+            updater.job_queue.run_daily(lambda _: logger.info('digests queued: %d', digests.send_digests()),
+                                        moment.time(), days=((moment.date() - local.date()).days % 7,))
+        if config.alert_interval:
+            updater.job_queue.run_repeating(lambda _: logger.info('alerts queued: %d', digests.send_alerts()),
+                                            interval=config.alert_interval)
+
+    def close() -> None:
+        if outbox is not None:
+            outbox.close()
+        if 'render_pool' in dispatcher.bot_data:
+            dispatcher.bot_data['render_pool'].shutdown()
+        users.close()
+        if snapshots is not None:
+            snapshots.close()
+            snapshots.write()
+        storage.close()
+    return close
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Call main application.
+
+    Settings come from the command line or the environment, see ``python -m acc_bot --help``.
+    The token is asked for only if it is not configured and stdin is a terminal.
+    With ``--shards`` the handlers run in worker processes and this process only routes updates.
+    """
+    config = parse_config(argv)
+    _ = get_catalog(DEFAULT_LOCALE).gettext
     locale.setlocale(locale.LC_ALL, locale.getdefaultlocale())
 
-    token = input(_("Please, provide telegram-bot token or left blank to use default:\n"))
-    default_token = '5337419761:AAFahgNMGQNpzyRvFFlS3_N_-9DyfNB5bfQ'
-    updater = Updater(token=token if token else default_token, use_context=True)
+    if not config.token and sys.stdin.isatty():
+        config.token = input(_("Please, provide telegram-bot token or left blank to use default:\n"))
+    config.token = config.token or DEFAULT_TOKEN
+    updater = Updater(token=config.token, use_context=True)
     dispatcher = updater.dispatcher
+    # pylint: disable=import-outside-toplevel
+    if config.shards > 1:
+        from acc_bot.shards import ShardPool
+        pool = ShardPool(config.shards, config)
+        pool.start()
+        pool.register(dispatcher)
+        close = pool.stop
+    else:
+        close = start_services(updater, config)
+        register_handlers(dispatcher)
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda *_: PROFILER.toggle(config.profile_fraction))
     print(_('The bot is ready!'))
 
-    dispatcher.add_handler(CommandHandler('start', start))
-    dispatcher.add_handler(CommandHandler('add', add))
-    dispatcher.add_handler(CommandHandler('set_limit', set_limit))
-    dispatcher.add_handler(CommandHandler('help', bot_help))
-    dispatcher.add_handler(CommandHandler('week', week))
-    dispatcher.add_handler(CommandHandler('weeks', weeks))
-    dispatcher.add_handler(CommandHandler('chart', chart))
-    dispatcher.add_handler(CommandHandler('load_test_1', load_test_1))
-    dispatcher.add_handler(CommandHandler('load_test_2', load_test_2))
-    dispatcher.add_handler(MessageHandler(CATEGORIES_FILTER, category_chooser))
-    dispatcher.add_handler(MessageHandler(NUMBERS_FILTER, category_upd))
-    dispatcher.add_handler(MessageHandler(Filters.command, unknown_cmd))
-    dispatcher.add_handler(MessageHandler(Filters.text, dont_understand))
-
-    updater.start_polling()
-    updater.idle()
+    if config.runtime == 'asyncio':
+        from acc_bot.aio import AsyncRuntime
+        updater.job_queue.start()
+        AsyncRuntime(dispatcher, concurrency=config.concurrency).run()
+        updater.job_queue.stop()
+    elif config.runtime == 'webhook':
+        from acc_bot.webhook import WebhookServer
+        server = WebhookServer(dispatcher, host=config.host, port=config.port, workers=config.workers,
+                               secret=config.webhook_secret)
+        if config.webhook_url:
+            updater.bot.set_webhook(config.webhook_url, secret_token=server.secret)
+        updater.job_queue.start()
+        server.run()
+        updater.job_queue.stop()
+    else:
+        updater.start_polling()
+        updater.idle()
+    close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+"""Bot settings given on the command line, falling back to ``ACC_BOT_*`` environment variables."""
+
+import os
+import argparse
+from typing import Mapping, Optional, Sequence
+
+RUNTIMES = ('polling', 'asyncio', 'webhook')
+
+
+def parse_config(argv: Optional[Sequence[str]] = None,
+                 environ: Mapping[str, str] = os.environ) -> argparse.Namespace:
+    """Parse bot settings, every option defaults to its environment variable."""
+    parser = argparse.ArgumentParser(prog='acc_bot', description='Accountant telegram bot.')
+    parser.add_argument('--token', default=environ.get('ACC_BOT_TOKEN'),
+                        help='bot token (ACC_BOT_TOKEN), asked for when missing and stdin is a terminal')
+    parser.add_argument('--runtime', choices=RUNTIMES, default=environ.get('ACC_BOT_RUNTIME', 'polling'),
+                        help='how updates are received (ACC_BOT_RUNTIME)')
+    parser.add_argument('--db', default=environ.get('ACC_BOT_DB', 'acc_bot.db'),
+                        help='SQLite database of the users (ACC_BOT_DB)')
+    parser.add_argument('--snapshot', default=environ.get('ACC_BOT_SNAPSHOT'),
+                        help='binary snapshot users are restored from and periodically saved to (ACC_BOT_SNAPSHOT)')
+    parser.add_argument('--snapshot-interval', type=float,
+                        default=float(environ.get('ACC_BOT_SNAPSHOT_INTERVAL', '3600')),
+                        help='seconds between snapshots (ACC_BOT_SNAPSHOT_INTERVAL)')
+    parser.add_argument('--shards', type=int, default=int(environ.get('ACC_BOT_SHARDS', '0')),
+                        help='worker processes the users are spread over, 0 runs handlers in this process '
+                             '(ACC_BOT_SHARDS)')
+    parser.add_argument('--digest-time', default=environ.get('ACC_BOT_DIGEST_TIME', '09:00'),
+                        help='local time of the weekly digests sent on Mondays, empty disables them '
+                             '(ACC_BOT_DIGEST_TIME)')
+    parser.add_argument('--alert-interval', type=float,
+                        default=float(environ.get('ACC_BOT_ALERT_INTERVAL', '3600')),
+                        help='seconds between checks of spendings near the limits, 0 disables them '
+                             '(ACC_BOT_ALERT_INTERVAL)')
+    parser.add_argument('--send-rate', type=float, default=float(environ.get('ACC_BOT_SEND_RATE', '25')),
+                        help='messages per second the digests and alerts are sent at, shared by the shards '
+                             '(ACC_BOT_SEND_RATE)')
+    parser.add_argument('--host', default=environ.get('ACC_BOT_HOST', '127.0.0.1'),
+                        help='address the webhook and metrics servers listen on (ACC_BOT_HOST)')
+    parser.add_argument('--port', type=int, default=int(environ.get('ACC_BOT_PORT', '8080')),
+                        help='webhook server port (ACC_BOT_PORT)')
+    parser.add_argument('--workers', type=int, default=int(environ.get('ACC_BOT_WORKERS', '4')),
+                        help='webhook worker threads (ACC_BOT_WORKERS)')
+    parser.add_argument('--concurrency', type=int, default=int(environ.get('ACC_BOT_CONCURRENCY', '32')),
+                        help='updates processed at a time by the asyncio runtime (ACC_BOT_CONCURRENCY)')
+    parser.add_argument('--webhook-url', default=environ.get('ACC_BOT_WEBHOOK_URL'),
+                        help='public URL registered as the webhook (ACC_BOT_WEBHOOK_URL)')
+    parser.add_argument('--webhook-secret', default=environ.get('ACC_BOT_WEBHOOK_SECRET'),
+                        help='secret token expected from Telegram (ACC_BOT_WEBHOOK_SECRET)')
+    metrics_port = environ.get('ACC_BOT_METRICS_PORT')
+    parser.add_argument('--metrics-port', type=int, default=int(metrics_port) if metrics_port else None,
+                        help='port of a separate metrics server (ACC_BOT_METRICS_PORT)')
+    parser.add_argument('--metrics-interval', type=int,
+                        default=int(environ.get('ACC_BOT_METRICS_INTERVAL', '300')),
+                        help='seconds between metric summaries in the log (ACC_BOT_METRICS_INTERVAL)')
+    parser.add_argument('--profile-fraction', type=float,
+                        default=float(environ.get('ACC_BOT_PROFILE_FRACTION', '0.01')),
+                        help='fraction of updates profiled after SIGUSR1 (ACC_BOT_PROFILE_FRACTION)')
+    return parser.parse_args(argv)
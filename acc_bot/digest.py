@@ -0,0 +1,297 @@
+"""Weekly digests and near-limit alerts computed for all users at once.
+
+Category totals of every user are summed in one pass: users in memory
+contribute the slices of their ledgers within the period, located by
+bisection, users only in the database one grouped query, and all of them are
+added up in one sort of their ``(user, category)`` cells. Messages are queued to the outbox, which
+sends them no faster than the Bot API allows.
+"""
+
+import sys
+import time
+import bisect
+import logging
+import datetime
+import threading
+import collections
+from typing import NamedTuple, Optional, Sequence
+
+import numpy as np
+from telegram import Bot
+from telegram.error import RetryAfter, TelegramError
+from telegram.ext import Dispatcher
+
+from acc_bot.analytics import grouped_totals
+from acc_bot.i18n import DEFAULT_LOCALE, Catalog, get_catalog
+from acc_bot.ledger import CATEGORY_TABLE, WEEK, Ledger, to_ticks
+from acc_bot.report import period
+from acc_bot.storage import UserStore
+from acc_bot.throttle import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Share of the weekly limit at which users are warned
+ALERT_SHARE = 0.8
+# The Bot API lets a bot send about 30 messages per second to different chats
+SEND_RATE = 25.0
+# Alert levels of a category: under the alert share, near the limit, over the limit
+CLEAR, NEAR, EXCEEDED = range(3)
+
+
+class Cells(NamedTuple):
+    """Amounts of users by category, one entry per user and category present, sorted by user and code."""
+
+    # Rows of the users in the batch
+    rows: np.ndarray
+    codes: np.ndarray
+    amounts: np.ndarray
+
+
+class Batch(NamedTuple):
+    """Category totals and limits of many users over the same periods."""
+
+    # Sorted user IDs the rows refer to
+    user_ids: np.ndarray
+    # Totals of every period
+    totals: list[Cells]
+    limits: Cells
+
+
+def ledger_slices(ledgers: Sequence[Ledger], low: int, high: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return ledger numbers, codes and amounts of the spendings within ticks [low, high) of all the ledgers.
+
+    Ledgers must not change meanwhile, see ``UserStore.frozen``.
+    """
+    numbers, counts, codes, amounts = [], [], [], []
+    for number, ledger in enumerate(ledgers):
+        first = bisect.bisect_left(ledger.ts, low)
+        last = bisect.bisect_left(ledger.ts, high, first)
+        if last > first:
+            numbers.append(number)
+            counts.append(last - first)
+            codes.append(ledger.codes[first:last])
+            amounts.append(ledger.amounts[first:last])
+    groups = np.repeat(np.array(numbers, dtype=np.int64), counts)
+    return groups, np.frombuffer(b''.join(codes), np.uint8), np.frombuffer(b''.join(amounts), np.int64)
+
+
+def _rows(rows: list[tuple], column: int, dtype: type) -> np.ndarray:
+    return np.array([row[column] for row in rows], dtype=dtype)
+
+
+def collect(users: UserStore, periods: Sequence[tuple[int, int]], shard: int = 0, shards: int = 1,
+            limited: bool = False) -> Batch:
+    """Sum spendings of all users of the shard within every ``(low, high)`` ticks period by category.
+
+    Users in memory are summed from their ledgers, the others from the
+    database, after the queued writes are committed. Eviction is suspended
+    meanwhile, so every user is read either from memory or from a database
+    state holding all of their writes. With ``limited`` only users having
+    limits are collected.
+    """
+    with users.pinned():
+        if users.writer is not None:
+            users.writer.flush()
+        stored_limits = [] if users.storage is None else users.storage.limit_rows(shard, shards)
+        stored_totals = [[] if users.storage is None else users.storage.period_totals(low, high, shard, shards,
+                                                                                      limited)
+                         for low, high in periods]
+        with users.frozen() as records:
+            if limited:
+                records = [(user_id, record) for user_id, record in records if record['limits']]
+            loaded = [user_id for user_id, _ in records]
+            limit_rows = [(user_id, category, amount) for user_id, record in records
+                          for category, amount in record['limits'].items()]
+            slices = [ledger_slices([record['data'] for _, record in records], low, high) for low, high in periods]
+    known = set(loaded)
+    limit_rows.extend(row for row in stored_limits if row[0] not in known)
+    stored = [[row for row in rows if row[0] not in known] for rows in stored_totals]
+    user_ids = np.unique(np.array(loaded + [row[0] for rows in stored for row in rows], dtype=np.int64))
+    codes = {category: CATEGORY_TABLE.code(category)
+             for category in {row[1] for rows in stored + [limit_rows] for row in rows}}
+    loaded_rows = np.searchsorted(user_ids, np.array(loaded, dtype=np.int64))
+    totals = []
+    for (groups, slice_codes, amounts), rows in zip(slices, stored):
+        totals.append(Cells(*grouped_totals(
+            np.concatenate((loaded_rows[groups], np.searchsorted(user_ids, _rows(rows, 0, np.int64)))),
+            np.concatenate((slice_codes, np.array([codes[row[1]] for row in rows], dtype=np.uint8))),
+            np.concatenate((amounts, _rows(rows, 2, np.int64))))))
+    present = set(user_ids.tolist())
+    limit_rows = [row for row in limit_rows if row[0] in present]
+    limits = Cells(*grouped_totals(np.searchsorted(user_ids, _rows(limit_rows, 0, np.int64)),
+                                   np.array([codes[row[1]] for row in limit_rows], dtype=np.uint8),
+                                   _rows(limit_rows, 2, np.int64)))
+    return Batch(user_ids, totals, limits)
+
+
+def digest_text(catalog: Catalog, totals: dict[str, int], previous: int) -> str:
+    """Describe spendings of the week by category and compare their total to the week before."""
+    _ = catalog.gettext
+    message = [_('Your spendings of the last week:\n\n')]
+    message.extend(f' - {catalog.name(category)}: {amount}\n'
+                   for category, amount in sorted(totals.items(), key=lambda item: -item[1]))
+    message.append(_('\nTotal: {} (the week before: {})').format(sum(totals.values()), previous))
+    return ''.join(message)
+
+
+def alert_text(catalog: Catalog, category: str, spent: int, limit: int) -> str:
+    """Warn that spendings of the category for the last 7 days approach or exceed its weekly limit."""
+    _ = catalog.gettext
+    if spent > limit:
+        return _('😱 You have exceeded your weekly limit {} for the category {}: {} spent').format(
+            limit, catalog.name(category), spent)
+    return _('⚠️ You have already spent {} of your weekly limit {} for the category {}').format(
+        spent, limit, catalog.name(category))
+
+
+class Outbox:
+    """Background thread sending queued messages at most ``rate`` per second, with bursts of ``burst``.
+
+    Messages the Bot API asks to retry later are sent again after the delay it
+    names, those failing otherwise are dropped and counted.
+    """
+
+    def __init__(self, bot: Bot, rate: float = SEND_RATE, burst: int = 1):
+        """Start the sender thread."""
+        self.bot = bot
+        self.sent = 0
+        self.failed = 0
+        self._bucket = TokenBucket(rate, burst, time.monotonic())
+        self._queue: collections.deque = collections.deque()
+        self._sending = False
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='acc_bot outbox', daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        """Return number of messages waiting to be sent."""
+        return len(self._queue)
+
+    def put(self, chat_id: int, text: str) -> None:
+        """Queue the message to the chat."""
+        with self._cond:
+            self._queue.append((chat_id, text))
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._sending = False
+                self._cond.notify_all()
+                while not self._queue and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                chat_id, text = self._queue.popleft()
+                self._sending = True
+            while not self._bucket.take(time.monotonic()):
+                time.sleep((1 - self._bucket.tokens) / self._bucket.rate)
+            try:
+                self.bot.send_message(chat_id, text)
+            except RetryAfter as exc:
+                with self._cond:
+                    self._queue.appendleft((chat_id, text))
+                time.sleep(exc.retry_after)
+            except TelegramError:
+                logger.warning('Failed to send message to %s', chat_id, exc_info=True)
+                self.failed += 1
+            else:
+                self.sent += 1
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued messages are sent, return False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queue and not self._sending, timeout)
+
+    def close(self) -> int:
+        """Stop sending and return number of messages dropped unsent."""
+        with self._cond:
+            self._stopped = True
+            dropped = len(self._queue)
+            self._queue.clear()
+            self._cond.notify_all()
+        self._thread.join()
+        if dropped:
+            logger.warning('%d queued messages dropped', dropped)
+        return dropped
+
+
+class Digests:
+    """Weekly digests and near-limit alerts of the users of one store, sent through the outbox.
+
+    Alerts of a category are sent once when its spendings of the last 7 days
+    reach ``share`` of the weekly limit and once more when they exceed it,
+    the category is warned about again only after it falls below the share.
+    The levels reached are kept in the storage, if the store has one, so
+    alerts are not repeated after a restart.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, users: UserStore, outbox: Outbox, shard: int = 0, shards: int = 1,
+                 share: float = ALERT_SHARE):
+        """Create scheduler with no alerts sent."""
+        self.dispatcher = dispatcher
+        self.users = users
+        self.outbox = outbox
+        self.shard = shard
+        self.shards = shards
+        self.share = share
+        self.levels: dict[tuple[int, int], int] = {}
+
+    def catalog(self, user_id: int) -> Catalog:
+        """Return catalog of the language the user chose, the default one for users not seen since start."""
+        session = self.dispatcher.user_data.get(user_id, {}).get('session')
+        return get_catalog(session.lang if session is not None and session.lang else DEFAULT_LOCALE)
+
+    def send_digests(self, now: Optional[datetime.datetime] = None) -> int:
+        """Queue digests of the last calendar week to every user who spent anything, return their number."""
+        now = now or datetime.datetime.now()
+        start, end = period('week', now - WEEK)
+        batch = collect(self.users, [(to_ticks(start), to_ticks(end)), (to_ticks(start - WEEK), to_ticks(start))],
+                        self.shard, self.shards)
+        week, previous = batch.totals
+        before = np.zeros(len(batch.user_ids), dtype=np.int64)
+        np.add.at(before, previous.rows, previous.amounts)
+        names = CATEGORY_TABLE.names
+        # Cells of every user are contiguous, split them where the row changes
+        bounds = np.flatnonzero(np.diff(week.rows)) + 1
+        rows = week.rows[np.concatenate(([0], bounds))] if len(week.rows) else week.rows
+        for row, codes, amounts in zip(rows.tolist(), np.split(week.codes, bounds), np.split(week.amounts, bounds)):
+            user_id = int(batch.user_ids[row])
+            totals = {names[code]: amount for code, amount in zip(codes.tolist(), amounts.tolist())}
+            self.outbox.put(user_id, digest_text(self.catalog(user_id), totals, int(before[row])))
+        return len(rows)
+
+    def send_alerts(self, now: Optional[datetime.datetime] = None) -> int:
+        """Queue alerts of the categories whose level rose since the last check, return their number."""
+        now = now or datetime.datetime.now()
+        batch = collect(self.users, [(to_ticks(now - WEEK), sys.maxsize)], self.shard, self.shards, limited=True)
+        spent, limits = batch.totals[0], batch.limits
+        # Spendings of every limited category, both cell lists are sorted by the same keys
+        keys = spent.rows * 256 + spent.codes
+        wanted = limits.rows * 256 + limits.codes
+        amounts = np.zeros(len(wanted), dtype=np.int64)
+        if len(keys):
+            found = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+            hit = keys[found] == wanted
+            amounts[hit] = spent.amounts[found[hit]]
+        levels = np.where(limits.amounts > 0,
+                          (amounts >= limits.amounts * self.share).astype(np.int64) + (amounts > limits.amounts), CLEAR)
+        previous, self.levels = self.levels, {}
+        if self.users.storage is not None:
+            previous = {(user_id, CATEGORY_TABLE.code(category)): level
+                        for user_id, category, level in self.users.storage.alert_levels(self.shard, self.shards)}
+        sent = 0
+        names = CATEGORY_TABLE.names
+        for cell in np.flatnonzero(levels).tolist():
+            user_id, code, level = int(batch.user_ids[limits.rows[cell]]), int(limits.codes[cell]), int(levels[cell])
+            self.levels[user_id, code] = level
+            if level > previous.get((user_id, code), CLEAR):
+                self.outbox.put(user_id, alert_text(self.catalog(user_id), names[code],
+                                                    int(amounts[cell]), int(limits.amounts[cell])))
+                sent += 1
+        if self.users.storage is not None:
+            self.users.storage.set_alert_levels([(user_id, names[code], level)
+                                                 for (user_id, code), level in self.levels.items()],
+                                                self.shard, self.shards)
+        return sent
@@ -0,0 +1,80 @@
+"""One-shot parser of spendings typed as ``120 restaurants`` or ``transport 45``."""
+
+import re
+from typing import Iterable, Mapping, Optional, Union
+
+from acc_bot.ledger import MAX_AMOUNT
+
+# Stripped spending line, its repetitions do not overlap, so it is matched in linear time
+LINE_PATTERN = re.compile(r'(?P<lead>\d+)\s+(?P<tail_cat>[^\d\s].*)|(?P<lead_cat>[^\d\s](?:.*\S)?)\s+(?P<tail>\d+)')
+
+
+def is_batch(text: str) -> bool:
+    """Check the text consists of one or several spending lines, blank lines aside."""
+    lines = [line.strip() for line in text.splitlines()]
+    return any(lines) and all(LINE_PATTERN.fullmatch(line) for line in lines if line)
+
+
+class EntryParser:
+    """Resolver of category names and their unambiguous prefixes to categories.
+
+    Categories are given either as names or as a mapping of names, like
+    translated ones, to the categories they stand for.
+    """
+
+    def __init__(self, categories: Union[Iterable[str], Mapping[str, str]]):
+        """Precompute lookup of every prefix of every category name."""
+        if not isinstance(categories, Mapping):
+            categories = {category: category for category in categories}
+        self.categories = list(dict.fromkeys(categories.values()))
+        self._lookup: dict[str, Optional[str]] = {}
+        for name, category in categories.items():
+            name = name.lower()
+            for size in range(1, len(name) + 1):
+                prefix = name[:size]
+                if prefix in self._lookup and self._lookup[prefix] != category:
+                    self._lookup[prefix] = None
+                else:
+                    self._lookup[prefix] = category
+        for name, category in categories.items():
+            self._lookup[name.lower()] = category
+
+    def category(self, word: str) -> Optional[str]:
+        """Return category named by the word or its unambiguous prefix."""
+        return self._lookup.get(word.strip().lower())
+
+    @staticmethod
+    def split_line(line: str) -> Optional[tuple[str, int]]:
+        """Split ``amount category`` or ``category amount`` into the category word and the amount."""
+        match = LINE_PATTERN.fullmatch(line.strip())
+        if match is None:
+            return None
+        if match['lead']:
+            return match['tail_cat'], int(match['lead'])
+        return match['lead_cat'], int(match['tail'])
+
+    def parse_line(self, line: str) -> Optional[tuple[str, int]]:
+        """Parse ``amount category`` or ``category amount`` into ``(category, amount)``.
+
+        Amounts above ``MAX_AMOUNT`` are not understood.
+        """
+        parts = self.split_line(line)
+        if parts is None:
+            return None
+        category = self.category(parts[0])
+        if category is None or parts[1] > MAX_AMOUNT:
+            return None
+        return category, parts[1]
+
+    def parse(self, text: str) -> tuple[list[tuple[str, int]], list[str]]:
+        """Parse every non-empty line, returning spendings and the lines not understood."""
+        entries, rejected = [], []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            entry = self.parse_line(line)
+            if entry is None:
+                rejected.append(line.strip())
+            else:
+                entries.append(entry)
+        return entries, rejected
@@ -0,0 +1,118 @@
+"""Streaming import and export of spending history in CSV and JSON lines."""
+
+import csv
+import json
+import datetime
+from typing import IO, Iterable, Iterator, Optional
+
+from acc_bot.ledger import MAX_AMOUNT, Ledger, from_ticks, to_ticks
+
+FORMATS = ('csv', 'jsonl')
+FIELDS = ('time', 'category', 'amount')
+CHUNK = 10000
+# Number of invalid rows remembered for the report
+MAX_ERRORS = 20
+
+
+def format_of(file_name: Optional[str]) -> Optional[str]:
+    """Guess document format from the file name."""
+    if not file_name:
+        return None
+    extension = file_name.rsplit('.', 1)[-1].lower()
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'json', 'ndjson'):
+        return 'jsonl'
+    return None
+
+
+class SpendingReader:
+    """Parser of spending documents yielding validated rows in bounded chunks.
+
+    Rows are ``(ticks, category, amount)`` tuples. Invalid rows are skipped and
+    counted in ``skipped``, the first of them are described in ``errors``.
+    """
+
+    def __init__(self, stream: IO[str], fmt: str, categories: Iterable[str], chunk: int = CHUNK):
+        """Wrap text stream of the document."""
+        if fmt not in FORMATS:
+            raise ValueError(f'Unknown format {fmt}')
+        self.stream = stream
+        self.fmt = fmt
+        self.categories = frozenset(categories)
+        self.chunk = chunk
+        self.skipped = 0
+        self.errors: list[str] = []
+
+    def _records(self) -> Iterator[tuple[int, object]]:
+        if self.fmt == 'csv':
+            for line, record in enumerate(csv.reader(self.stream), 1):
+                if line == 1 and record and record[0].strip().lower() == FIELDS[0]:
+                    continue
+                if record:
+                    yield line, record
+        else:
+            for line, text in enumerate(self.stream, 1):
+                if text.strip():
+                    try:
+                        record = json.loads(text)
+                        yield line, [record[field] for field in FIELDS]
+                    except (ValueError, TypeError, KeyError) as exc:
+                        yield line, exc
+
+    def _parse(self, record: object) -> tuple[int, str, int]:
+        if isinstance(record, Exception):
+            raise ValueError(f'malformed record: {record}')
+        if len(record) != len(FIELDS):
+            raise ValueError(f'expected {len(FIELDS)} fields')
+        moment, category, amount = record
+        category = str(category).strip()
+        if category not in self.categories:
+            raise ValueError(f'unknown category {category}')
+        amount = int(amount)
+        if amount < 0:
+            raise ValueError('negative amount')
+        if amount > MAX_AMOUNT:
+            raise ValueError('amount too large')
+        moment = datetime.datetime.fromisoformat(str(moment).strip())
+        if moment.tzinfo is not None:
+            # Spendings are kept in naive local time
+            moment = moment.astimezone().replace(tzinfo=None)
+        return to_ticks(moment), category, amount
+
+    def chunks(self) -> Iterator[list[tuple[int, str, int]]]:
+        """Yield valid rows in chunks of at most ``chunk`` rows."""
+        rows = []
+        for line, record in self._records():
+            try:
+                rows.append(self._parse(record))
+            except ValueError as exc:
+                self.skipped += 1
+                if len(self.errors) < MAX_ERRORS:
+                    self.errors.append(f'{line}: {exc}')
+                continue
+            if len(rows) >= self.chunk:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+def write_spendings(stream: IO[bytes], ledger: Ledger, fmt: str, chunk: int = CHUNK) -> None:
+    """Write the whole ledger to the binary stream, formatting ``chunk`` rows at a time."""
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt}')
+    if fmt == 'csv':
+        stream.write((','.join(FIELDS) + '\n').encode())
+    for low in range(0, len(ledger), chunk):
+        high = min(low + chunk, len(ledger))
+        stamps, codes, amounts = ledger.ts[low:high], ledger.codes[low:high], ledger.amounts[low:high]
+        lines = []
+        for ticks, code, amount in zip(stamps, codes, amounts):
+            moment, category = from_ticks(ticks).isoformat(), ledger.categories[code]
+            if fmt == 'csv':
+                lines.append(f'{moment},{category},{amount}\n')
+            else:
+                lines.append(json.dumps({'time': moment, 'category': category, 'amount': amount},
+                                        ensure_ascii=False) + '\n')
+        stream.write(''.join(lines).encode())
@@ -0,0 +1,125 @@
+"""Stand-ins for the Telegram objects the handlers talk to, shared by the tests and the load test."""
+
+import time
+import queue
+import threading
+import collections
+from types import SimpleNamespace
+from typing import IO
+
+from telegram import Bot, Update, User
+
+
+class FakeMessage:
+    """Message remembering the replies instead of sending them."""
+
+    def __init__(self, text: str):
+        """Wrap message text."""
+        self.text = text
+        self.replies: list = []
+
+    def reply_text(self, text: str, **_kwargs) -> None:
+        """Record text reply."""
+        self.replies.append(text)
+
+    def reply_photo(self, photo: bytes, **_kwargs) -> None:
+        """Record photo reply."""
+        self.replies.append(photo)
+
+    def reply_document(self, document: IO[bytes], **_kwargs) -> None:
+        """Record document reply content."""
+        self.replies.append(document.read())
+
+
+class FakeContext:
+    """Callback context of a single user sharing bot data with all the others."""
+
+    def __init__(self, bot_data: dict):
+        """Create empty user context."""
+        self.bot_data = bot_data
+        self.user_data: dict = {}
+        self.chat_data: dict = {}
+        self.args: list[str] = []
+
+
+def make_update(user_id: int, text: str) -> SimpleNamespace:
+    """Build update carrying the text message of the user."""
+    user = SimpleNamespace(id=user_id, language_code=None)
+    return SimpleNamespace(message=FakeMessage(text), effective_user=user, effective_chat=user)
+
+
+def update_json(update_id: int, user_id: int, text: str) -> dict:
+    """Build update JSON of the text message as the Bot API sends it."""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': update_id, 'message': message}
+
+
+class SilentBot(Bot):
+    """Bot dropping replies instead of calling the Bot API."""
+
+    def __init__(self):
+        """Create bot with a made up token."""
+        super().__init__('123:test')
+
+    def send_message(self, *_args, **_kwargs) -> None:  # pylint: disable=arguments-differ
+        """Drop the reply."""
+
+    def get_me(self, *_args, **_kwargs) -> User:  # pylint: disable=arguments-differ
+        """Describe the bot without asking the Bot API."""
+        self._bot = User(123, 'test', True, username='test_bot')
+        return self._bot
+
+    def delete_webhook(self, *_args, **_kwargs) -> bool:  # pylint: disable=arguments-differ
+        """Pretend there is no webhook to delete."""
+        return True
+
+
+class RecordingBot(SilentBot):
+    """Bot serving queued updates to polling and timing replies instead of calling the Bot API.
+
+    Every message is expected to get exactly one reply, the latency of a
+    message is the time from its ``sent`` call to the reply in its chat.
+    """
+
+    def __init__(self):
+        """Create bot with no pending updates."""
+        super().__init__()
+        self.incoming: queue.Queue = queue.Queue()
+        self.latencies: list[float] = []
+        self._sent: dict[int, collections.deque] = collections.defaultdict(collections.deque)
+        self._lock = threading.Condition()
+
+    def sent(self, chat_id: int) -> None:
+        """Remember when a message to the chat was sent."""
+        with self._lock:
+            self._sent[chat_id].append(time.perf_counter())
+
+    def wait(self, count: int, timeout: float = 60) -> bool:
+        """Wait until the given number of replies is sent."""
+        with self._lock:
+            return self._lock.wait_for(lambda: len(self.latencies) >= count, timeout)
+
+    def send_message(self, chat_id, text, *_args, **_kwargs) -> None:  # pylint: disable=arguments-differ
+        """Record the reply latency."""
+        with self._lock:
+            self.latencies.append(time.perf_counter() - self._sent[chat_id].popleft())
+            self._lock.notify_all()
+
+    def get_updates(self, offset=None, limit=100, timeout=0, *_args, **_kwargs) -> list:  # pylint: disable=W0221
+        """Return queued updates, waiting for the first one at most the timeout."""
+        updates = []
+        try:
+            updates.append(self.incoming.get(timeout=timeout or None))
+            while len(updates) < limit:
+                updates.append(self.incoming.get_nowait())
+        except queue.Empty:
+            pass
+        return [Update.de_json(data, self) for data in updates]
@@ -0,0 +1,141 @@
+"""Per-category spending forecasts cached per user."""
+
+import bisect
+import collections
+import datetime
+import math
+from typing import NamedTuple
+
+from acc_bot.ledger import TICK, WEEK, Ledger, to_ticks
+
+# Two-sided 95% normal quantile used for the bands
+Z_95 = 1.96
+
+
+class Forecast(NamedTuple):
+    """Next week forecast with its confidence band."""
+
+    value: int
+    low: int
+    high: int
+
+
+def _band(value: float, sigma: float) -> Forecast:
+    return Forecast(round(value), max(0, round(value - Z_95 * sigma)), round(value + Z_95 * sigma))
+
+
+class CategoryModel:
+    """Linear trend, moving average and exponential smoothing of one weekly series.
+
+    All three models are kept as running statistics, so a newly closed week
+    is accounted for in constant time.
+    """
+
+    def __init__(self, window: int = 4, alpha: float = 0.3):
+        """Create models with no observations."""
+        self.alpha = alpha
+        self.count = 0
+        self.sum_x = self.sum_xx = self.sum_y = self.sum_xy = self.sum_yy = 0.0
+        self.recent: collections.deque = collections.deque(maxlen=window)
+        self.level = 0.0
+        self.sse = 0.0
+
+    def update(self, value: int) -> None:
+        """Add spendings of the next closed week."""
+        x_val = self.count
+        self.sum_x += x_val
+        self.sum_xx += x_val * x_val
+        self.sum_y += value
+        self.sum_xy += x_val * value
+        self.sum_yy += value * value
+        self.recent.append(value)
+        if self.count == 0:
+            self.level = value
+        else:
+            error = value - self.level
+            self.sse += error * error
+            self.level += self.alpha * error
+        self.count += 1
+
+    def trend(self) -> Forecast:
+        """Forecast with the least squares line through all weeks."""
+        if self.count < 2:
+            return _band(self.sum_y, 0)
+        # Centered sums keep the solution stable for long series
+        mean_x, mean_y = self.sum_x / self.count, self.sum_y / self.count
+        s_xx = self.sum_xx - self.count * mean_x * mean_x
+        s_xy = self.sum_xy - self.count * mean_x * mean_y
+        s_yy = self.sum_yy - self.count * mean_y * mean_y
+        slope = s_xy / s_xx
+        residual = max(0.0, s_yy - slope * s_xy)
+        sigma = math.sqrt(residual / (self.count - 2)) if self.count > 2 else 0.0
+        return _band(mean_y + slope * (self.count - mean_x), sigma)
+
+    def moving_average(self) -> Forecast:
+        """Forecast with the mean of the last weeks."""
+        size = len(self.recent)
+        mean = sum(self.recent) / size
+        sigma = math.sqrt(sum((val - mean) ** 2 for val in self.recent) / (size - 1)) if size > 1 else 0.0
+        return _band(mean, sigma)
+
+    def smoothing(self) -> Forecast:
+        """Forecast with simple exponential smoothing."""
+        sigma = math.sqrt(self.sse / (self.count - 1)) if self.count > 1 else 0.0
+        return _band(self.level, sigma)
+
+
+class Forecaster:
+    """Cached per-category next week forecasts for one ledger.
+
+    Models are fitted on closed weeks of the ledger week rollup. They are
+    updated only when new weeks close, and refitted from scratch only if a
+    spending was recorded back into an already closed week.
+    """
+
+    MODELS = ('trend', 'moving_average', 'smoothing')
+
+    def __init__(self, ledger: Ledger, window: int = 4, alpha: float = 0.3):
+        """Create empty cache for the ledger."""
+        self.ledger = ledger
+        self.window = window
+        self.alpha = alpha
+        self.models: dict[int, CategoryModel] = {}
+        self.first = None
+        self.current = None
+        self.settled = 0
+        self.refits = 0
+
+    def _settled_before(self, week: int) -> int:
+        return bisect.bisect_left(self.ledger.ts, week * (WEEK // TICK))
+
+    def _feed(self, weeks: range) -> None:
+        index = self.ledger.buckets()
+        for week in weeks:
+            totals = index.bucket(WEEK, week)
+            for code in totals.keys() - self.models.keys():
+                self.models[code] = CategoryModel(self.window, self.alpha)
+                for _ in range(self.first, week):
+                    self.models[code].update(0)
+            for code, model in self.models.items():
+                model.update(totals.get(code, 0))
+
+    def refresh(self, now: datetime.datetime) -> None:
+        """Bring models up to date with the weeks closed before now."""
+        current = to_ticks(now) // (WEEK // TICK)
+        if self.first is not None and current >= self.current \
+                and self._settled_before(self.current) == self.settled:
+            self._feed(range(self.current, current))
+        else:
+            self.refits += 1
+            self.models = {}
+            self.first = self.ledger.buckets().first_bucket(WEEK)
+            if self.first is not None:
+                self._feed(range(self.first, current))
+        self.current = current
+        self.settled = self._settled_before(current)
+
+    def forecasts(self, now: datetime.datetime) -> dict[str, dict[str, Forecast]]:
+        """Return forecasts of every model for every category with closed weeks."""
+        self.refresh(now)
+        return {self.ledger.categories[code]: {name: getattr(model, name)() for name in self.MODELS}
+                for code, model in sorted(self.models.items())}
@@ -0,0 +1,109 @@
+"""Per-locale translation catalogs with the keyboards and patterns built from them.
+
+Spendings and limits are kept under canonical category keys, which are the
+untranslated message ids. Catalogs translate them only for display and map
+typed names of any supported locale back to the keys.
+"""
+
+import os
+import re
+import gettext
+import functools
+from typing import Mapping, Optional
+
+from telegram import ReplyKeyboardMarkup
+
+from acc_bot.entry import EntryParser
+
+LOCALEDIR = os.path.dirname(__file__)
+LOCALES = ('en', 'ru')
+# Variables naming the default locale, by priority, the same the system ones have for gettext
+LOCALE_VARIABLES = ('ACC_BOT_LANG', 'LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG')
+
+
+def _supported(code: Optional[str]) -> Optional[str]:
+    """Return supported locale of the language code, like 'ru' for 'ru-RU' or 'ru_RU.UTF-8'."""
+    if code:
+        code = code.replace('-', '_').split(':')[0].split('.')[0].split('_')[0].lower()
+        if code in LOCALES:
+            return code
+    return None
+
+
+def default_locale(environ: Mapping[str, str] = os.environ) -> str:
+    """Return locale of the first set variable of ``LOCALE_VARIABLES``, English if it is not supported."""
+    for name in LOCALE_VARIABLES:
+        if environ.get(name):
+            return _supported(environ[name]) or 'en'
+    return 'en'
+
+
+DEFAULT_LOCALE = default_locale()
+
+
+def N_(message: str) -> str:
+    """Mark the message for extraction, it is translated later by a catalog."""
+    return message
+
+
+CATEGORIES = [
+    [N_('restaurants'), N_('transport')],
+    [N_('supermarkets'), N_('pharmacy')],
+    [N_('entertainment'), N_('other')]
+]
+CATEGORIES_FLAT = [key for row in CATEGORIES for key in row]
+
+
+class Catalog:
+    """Translations of one locale and the reply objects prebuilt with them."""
+
+    def __init__(self, code: str, translations: Optional[gettext.NullTranslations] = None):
+        """Load translations of the locale, untranslated messages are used if there are none."""
+        self.code = code
+        if translations is None:
+            translations = gettext.translation('bot', LOCALEDIR, languages=[code], fallback=True)
+        self.gettext = translations.gettext
+        self.ngettext = translations.ngettext
+        self.names = {key: self.gettext(key) for key in CATEGORIES_FLAT}
+        self.keys = {key: key for key in CATEGORIES_FLAT}
+        self.keys.update((name, key) for key, name in self.names.items())
+        self.keyboard = ReplyKeyboardMarkup([[self.names[key] for key in row] for row in CATEGORIES],
+                                            one_time_keyboard=True)
+        self.category_pattern = re.compile('^(?:' + '|'.join(map(re.escape, self.keys)) + ')$')
+        self.parser = EntryParser(self.keys)
+        self._joined: dict[tuple[str, ...], str] = {}
+
+    def category(self, text: str) -> Optional[str]:
+        """Return key of the category named exactly by the text."""
+        return self.keys.get(text)
+
+    def name(self, key: str) -> str:
+        """Return displayed name of the category key."""
+        return self.names.get(key, key)
+
+    def join(self, *messages: str) -> str:
+        """Return concatenation of the translated messages, computed once per locale."""
+        if messages not in self._joined:
+            self._joined[messages] = ''.join(map(self.gettext, messages))
+        return self._joined[messages]
+
+
+def choose_locale(code: Optional[str]) -> str:
+    """Return supported locale closest to the language code, like 'ru' for 'ru-RU'."""
+    return _supported(code) or DEFAULT_LOCALE
+
+
+@functools.lru_cache(maxsize=None)
+def _load(code: str) -> Catalog:
+    return Catalog(code)
+
+
+def get_catalog(code: Optional[str]) -> Catalog:
+    """Return cached catalog of the supported locale closest to the language code."""
+    return _load(choose_locale(code))
+
+
+def category_pattern() -> str:
+    """Return pattern matching category names of every supported locale."""
+    keys = dict.fromkeys(key for code in LOCALES for key in get_catalog(code).keys)
+    return '^(?:' + '|'.join(map(re.escape, keys)) + ')$'
@@ -0,0 +1,493 @@
+"""Time-sorted columnar storage of user spendings.
+
+NumPy backed analytics are imported on first bulk operation, keeping bot startup fast.
+"""
+
+import array
+import bisect
+import sys
+import datetime
+import threading
+from typing import Iterable, Iterator, Optional, Sequence, Union
+
+EPOCH = datetime.datetime(1970, 1, 1)
+TICK = datetime.timedelta(microseconds=1)
+DAY = datetime.timedelta(days=1)
+WEEK = datetime.timedelta(days=7)
+# Slices longer than this are summed with NumPy
+BULK = 256
+# Amounts are stored as signed 64-bit integers
+AMOUNT_RANGE = range(-2 ** 63, 2 ** 63)
+# Largest amount taken from users, sums of millions of such spendings still fit into 64 bits
+MAX_AMOUNT = 10 ** 12
+
+
+def to_ticks(moment: datetime.datetime) -> int:
+    """Convert naive datetime to integer microseconds since epoch."""
+    return (moment - EPOCH) // TICK
+
+
+def from_ticks(ticks: int) -> datetime.datetime:
+    """Convert integer microseconds since epoch back to naive datetime."""
+    return EPOCH + datetime.timedelta(microseconds=ticks)
+
+
+class CategoryTable:
+    """Interned category names with their small integer codes, shared by all ledgers."""
+
+    # Codes are stored as unsigned bytes
+    SIZE = 256
+
+    def __init__(self):
+        """Create empty table."""
+        self.names: list[str] = []
+        self._codes: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def code(self, name: str) -> int:
+        """Return code of the category, registering it on first use."""
+        code = self._codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(name)
+                if code is None:
+                    if len(self.names) >= self.SIZE:
+                        raise ValueError(f'More than {self.SIZE} categories')
+                    code = len(self.names)
+                    self.names.append(sys.intern(name))
+                    self._codes[self.names[code]] = code
+        return code
+
+    def find(self, name: str) -> Optional[int]:
+        """Return code of the category if it is registered."""
+        return self._codes.get(name)
+
+
+CATEGORY_TABLE = CategoryTable()
+
+
+class Ledger:
+    """Spending history kept as parallel typed arrays sorted by time.
+
+    Timestamps are stored as microseconds since epoch, categories as small
+    integer codes into the shared ``categories`` table and amounts as
+    integers, about 17 bytes per spending. Appending
+    keeps the arrays sorted, so any time range is located by bisection.
+    ``version`` grows with every change, so results computed from the ledger
+    can be cached by it.
+    """
+
+    __slots__ = ('ts', 'codes', 'amounts', 'version', '_windows', '_buckets', '_prefixes')
+
+    def __init__(self):
+        """Create empty ledger."""
+        self.ts = array.array('q')
+        self.codes = array.array('B')
+        self.amounts = array.array('q')
+        self.version = 0
+        # Indexes are created on first query
+        self._windows: Optional[dict[int, RollingWindow]] = None
+        self._buckets: Optional[BucketIndex] = None
+        self._prefixes: Optional[PrefixIndex] = None
+
+    def __len__(self) -> int:
+        """Return number of recorded spendings."""
+        return len(self.ts)
+
+    @property
+    def categories(self) -> list[str]:
+        """Category names indexed by code."""
+        return CATEGORY_TABLE.names
+
+    @staticmethod
+    def code(category: str) -> int:
+        """Return code of the category, registering it on first use."""
+        return CATEGORY_TABLE.code(category)
+
+    def add(self, moment: datetime.datetime, category: str, amount: int) -> int:
+        """Record a spending and return its position in the ledger.
+
+        Raises OverflowError, leaving the ledger intact, if the amount does not fit into 64 bits.
+        """
+        ticks = to_ticks(moment)
+        code = self.code(category)
+        if amount not in AMOUNT_RANGE:
+            raise OverflowError(f'Amount {amount} does not fit into 64 bits')
+        if not self.ts or ticks >= self.ts[-1]:
+            pos = len(self.ts)
+            self.ts.append(ticks)
+            self.codes.append(code)
+            self.amounts.append(amount)
+        else:
+            pos = bisect.bisect_right(self.ts, ticks)
+            self.ts.insert(pos, ticks)
+            self.codes.insert(pos, code)
+            self.amounts.insert(pos, amount)
+        self.version += 1
+        for window in (self._windows or {}).values():
+            window.inserted(pos)
+        if self._buckets is not None:
+            self._buckets.inserted(pos)
+        if self._prefixes is not None:
+            if pos == len(self.ts) - 1:
+                self._prefixes.appended(pos, pos + 1)
+            else:
+                self._prefixes = None
+        return pos
+
+    def extend(self, rows: Iterable[tuple[int, str, int]]) -> None:
+        """Record many ``(ticks, category, amount)`` spendings in one batch.
+
+        Rows newer than the ledger are appended and the indexes updated with the
+        whole batch. Otherwise the batch is merged in and the indexes are rebuilt
+        on next use. Raises OverflowError, recording nothing, if a value does not
+        fit into its column.
+        """
+        rows = sorted(rows, key=lambda row: row[0])
+        if not rows:
+            return
+        # Columns of the batch are built first, so a value out of range leaves the ledger intact
+        batch = (array.array('q', [row[0] for row in rows]), array.array('B', [self.code(row[1]) for row in rows]),
+                 array.array('q', [row[2] for row in rows]))
+        low = len(self.ts)
+        appended = not self.ts or rows[0][0] >= self.ts[-1]
+        for column, values in zip((self.ts, self.codes, self.amounts), batch):
+            column.extend(values)
+        self.version += 1
+        if appended:
+            for window in (self._windows or {}).values():
+                window.appended(low, len(self.ts))
+            if self._buckets is not None:
+                self._buckets.appended(low, len(self.ts))
+            if self._prefixes is not None:
+                self._prefixes.appended(low, len(self.ts))
+            return
+        import numpy as np  # pylint: disable=import-outside-toplevel
+        from acc_bot import analytics  # pylint: disable=import-outside-toplevel
+        stamps, codes, amounts = analytics.columns(self)
+        order = np.argsort(stamps, kind='stable')
+        merged = [stamps[order].tobytes(), codes[order].tobytes(), amounts[order].tobytes()]
+        del stamps, codes, amounts
+        for column, values in zip((self.ts, self.codes, self.amounts), merged):
+            del column[:]
+            column.frombytes(values)
+        self._windows = None
+        self._buckets = None
+        self._prefixes = None
+
+    def slice_stats(self, low: int, high: int) -> dict[int, tuple[int, int]]:
+        """Return ``(sum, count)`` of spendings between positions [low, high) by category code."""
+        if high - low > BULK:
+            from acc_bot import analytics  # pylint: disable=import-outside-toplevel
+            _, codes, amounts = analytics.columns(self)
+            return analytics.category_stats(codes[low:high], amounts[low:high])
+        stats: dict[int, tuple[int, int]] = {}
+        for code, amount in zip(self.codes[low:high], self.amounts[low:high]):
+            total, count = stats.get(code, (0, 0))
+            stats[code] = (total + amount, count + 1)
+        return stats
+
+    def slice_totals(self, low: int, high: int) -> dict[int, int]:
+        """Sum spendings between ledger positions [low, high) by category code."""
+        return {code: total for code, (total, _) in self.slice_stats(low, high).items()}
+
+    def bounds(self, start: Optional[datetime.datetime] = None,
+               end: Optional[datetime.datetime] = None) -> tuple[int, int]:
+        """Return index range of spendings within [start, end)."""
+        low = 0 if start is None else bisect.bisect_left(self.ts, to_ticks(start))
+        high = len(self.ts) if end is None else bisect.bisect_left(self.ts, to_ticks(end), low)
+        return low, high
+
+    def total(self, start: Optional[datetime.datetime] = None,
+              end: Optional[datetime.datetime] = None, category: Optional[str] = None) -> int:
+        """Sum all spendings, or spendings of the category, within [start, end)."""
+        low = None if start is None else to_ticks(start)
+        high = None if end is None else to_ticks(end)
+        if category is None:
+            return self.prefixes().total(low, high)
+        code = CATEGORY_TABLE.find(category)
+        return 0 if code is None else self.prefixes().category_total(code, low, high)
+
+    def totals(self, start: Optional[datetime.datetime] = None,
+               end: Optional[datetime.datetime] = None) -> dict[str, int]:
+        """Sum spendings within [start, end) by category."""
+        totals = self.prefixes().totals(None if start is None else to_ticks(start),
+                                        None if end is None else to_ticks(end))
+        return {self.categories[code]: val for code, val in totals.items()}
+
+    def trailing(self, span: datetime.timedelta) -> 'RollingWindow':
+        """Return incrementally maintained sums over the trailing time span."""
+        ticks = span // TICK
+        if self._windows is None:
+            self._windows = {}
+        if ticks not in self._windows:
+            self._windows[ticks] = RollingWindow(self, span)
+        return self._windows[ticks]
+
+    def buckets(self) -> 'BucketIndex':
+        """Return day and week rollups maintained along with the ledger."""
+        if self._buckets is None:
+            self._buckets = BucketIndex(self)
+        return self._buckets
+
+    def prefixes(self) -> 'PrefixIndex':
+        """Return running sums maintained along with the ledger."""
+        if self._prefixes is None:
+            self._prefixes = PrefixIndex(self)
+        return self._prefixes
+
+    def items(self) -> Iterator[tuple[datetime.datetime, tuple[str, int]]]:
+        """Iterate over spendings in the legacy ``(time, (category, amount))`` form."""
+        for ticks, code, amount in zip(self.ts, self.codes, self.amounts):
+            yield from_ticks(ticks), (self.categories[code], amount)
+
+    def rows(self) -> Iterator[tuple[int, str, int]]:
+        """Iterate over spendings as ``(ticks, category, amount)`` rows."""
+        for ticks, code, amount in zip(self.ts, self.codes, self.amounts):
+            yield ticks, self.categories[code], amount
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple[int, str, int]]) -> 'Ledger':
+        """Build ledger from ``(ticks, category, amount)`` rows already sorted by time."""
+        ledger = cls()
+        for ticks, category, amount in rows:
+            ledger.ts.append(ticks)
+            ledger.codes.append(ledger.code(category))
+            ledger.amounts.append(amount)
+        return ledger
+
+    @classmethod
+    def from_arrays(cls, ts: Sequence[int], codes: Sequence[int], amounts: Sequence[int],
+                    categories: Sequence[str]) -> 'Ledger':
+        """Build ledger from parallel sequences already sorted by time.
+
+        Codes index into ``categories`` and are translated to the shared table
+        codes if those differ. NumPy arrays are copied as raw buffers.
+        """
+        ledger = cls()
+        mapping = [cls.code(category) for category in categories]
+        if mapping != list(range(len(mapping))):
+            if hasattr(codes, 'astype'):
+                import numpy as np  # pylint: disable=import-outside-toplevel
+                codes = np.asarray(mapping, dtype=np.uint8)[codes]
+            else:
+                codes = [mapping[code] for code in codes]
+        for column, values in ((ledger.ts, ts), (ledger.codes, codes), (ledger.amounts, amounts)):
+            if hasattr(values, 'astype'):
+                column.frombytes(values.astype(column.typecode).tobytes())
+            else:
+                column.extend(values)
+        return ledger
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Ledger':
+        """Build ledger from the legacy ``{time: (category, amount)}`` dict."""
+        return cls.from_rows((to_ticks(moment), category, amount)
+                             for moment, (category, amount) in sorted(data.items(), key=lambda x: x[0]))
+
+
+class RollingWindow:
+    """Per-category spending sums over the trailing time window of a ledger.
+
+    The window covers ledger positions ``[start, len(ledger))``. New spendings
+    are added on insertion, expired ones are evicted lazily on the next query,
+    so the cost of a query does not depend on the history length.
+    """
+
+    def __init__(self, ledger: Ledger, span: datetime.timedelta):
+        """Attach window to the ledger. Prefer ``Ledger.trailing`` to share windows."""
+        self.ledger = ledger
+        self.span = span // TICK
+        self.start = len(ledger)
+        self._sums: dict[int, int] = {}
+        self._counts: dict[int, int] = {}
+
+    def _apply(self, low: int, high: int, sign: int) -> None:
+        for code, (total, count) in self.ledger.slice_stats(low, high).items():
+            self._sums[code] = self._sums.get(code, 0) + sign * total
+            self._counts[code] = self._counts.get(code, 0) + sign * count
+
+    def appended(self, low: int, high: int) -> None:
+        """Account for the spendings just appended at positions [low, high)."""
+        self._apply(low, high, 1)
+
+    def inserted(self, pos: int) -> None:
+        """Account for the spending just inserted into the ledger at pos."""
+        if pos >= self.start:
+            self._apply(pos, pos + 1, 1)
+        else:
+            self.start += 1
+
+    def sums(self, now: datetime.datetime) -> dict[str, int]:
+        """Return category sums for spendings within the span before now."""
+        start = bisect.bisect_left(self.ledger.ts, to_ticks(now) - self.span)
+        if start > self.start:
+            self._apply(self.start, start, -1)
+        elif start < self.start:
+            self._apply(start, self.start, 1)
+        self.start = start
+        categories = self.ledger.categories
+        return {categories[code]: val for code, val in self._sums.items() if self._counts[code]}
+
+
+class BucketIndex:
+    """Per-category spending totals rolled up into week and day buckets.
+
+    Buckets are aligned to the epoch. A range total is assembled from the
+    coarsest buckets fully covered by the range, finer buckets for the edges
+    and raw ledger slices only for the parts shorter than a day.
+    """
+
+    WIDTHS = (WEEK, DAY)
+
+    def __init__(self, ledger: Ledger):
+        """Build rollups for all spendings already recorded in the ledger."""
+        self.ledger = ledger
+        self.widths = [width // TICK for width in self.WIDTHS]
+        from acc_bot import analytics  # pylint: disable=import-outside-toplevel
+        stamps, codes, amounts = analytics.columns(ledger)
+        self.levels = [analytics.bucket_sums(stamps, codes, amounts, width) for width in self.widths]
+        del stamps, codes, amounts
+
+    def inserted(self, pos: int) -> None:
+        """Account for the spending just inserted into the ledger at pos."""
+        ticks, code, amount = self.ledger.ts[pos], self.ledger.codes[pos], self.ledger.amounts[pos]
+        for width, level in zip(self.widths, self.levels):
+            bucket = level.setdefault(ticks // width, {})
+            bucket[code] = bucket.get(code, 0) + amount
+
+    def appended(self, low: int, high: int) -> None:
+        """Account for the spendings just appended at positions [low, high)."""
+        from acc_bot import analytics  # pylint: disable=import-outside-toplevel
+        stamps, codes, amounts = analytics.columns(self.ledger)
+        for width, level in zip(self.widths, self.levels):
+            for number, sums in analytics.bucket_sums(stamps[low:high], codes[low:high],
+                                                      amounts[low:high], width).items():
+                bucket = level.setdefault(number, {})
+                for code, val in sums.items():
+                    bucket[code] = bucket.get(code, 0) + val
+
+    def bucket(self, width: datetime.timedelta, number: int) -> dict[int, int]:
+        """Return category code totals of the bucket with the given width and number."""
+        return self.levels[self.widths.index(width // TICK)].get(number, {})
+
+    def first_bucket(self, width: datetime.timedelta) -> Optional[int]:
+        """Return number of the earliest non-empty bucket of the given width."""
+        level = self.levels[self.widths.index(width // TICK)]
+        return min(level) if level else None
+
+    def _collect(self, low: int, high: int, depth: int, sums: dict[int, int]) -> None:
+        if low >= high:
+            return
+        if depth == len(self.widths):
+            stamps = self.ledger.ts
+            first = bisect.bisect_left(stamps, low)
+            for code, val in self.ledger.slice_totals(first, bisect.bisect_left(stamps, high, first)).items():
+                sums[code] = sums.get(code, 0) + val
+            return
+        width, level = self.widths[depth], self.levels[depth]
+        first, last = -(-low // width), high // width
+        if first >= last:
+            self._collect(low, high, depth + 1, sums)
+            return
+        self._collect(low, first * width, depth + 1, sums)
+        for bucket in range(first, last):
+            for code, val in level.get(bucket, {}).items():
+                sums[code] = sums.get(code, 0) + val
+        self._collect(last * width, high, depth + 1, sums)
+
+    def totals(self, low: int, high: int) -> dict[int, int]:
+        """Sum spendings with timestamps in ticks within [low, high) by category code."""
+        sums: dict[int, int] = {}
+        self._collect(low, high, 0, sums)
+        return sums
+
+    def total(self, low: int, high: int) -> int:
+        """Sum spendings with timestamps in ticks within [low, high)."""
+        return sum(self.totals(low, high).values())
+
+
+class PrefixIndex:
+    """Running sums of the time-sorted spendings, overall and per category.
+
+    A range total is the difference of two running sums located by bisection,
+    so it costs the same for any range and history length. Appended spendings
+    extend the sums, spendings inserted into the past drop the index and it is
+    rebuilt on next use.
+    """
+
+    def __init__(self, ledger: Ledger):
+        """Build running sums of all spendings already recorded in the ledger."""
+        self.ledger = ledger
+        # Sum of the amounts before each ledger position
+        self.sums = array.array('q', [0])
+        # Timestamps of the spendings of each category and the sums before each of them
+        self.category_ts: dict[int, array.array] = {}
+        self.category_sums: dict[int, array.array] = {}
+        self.appended(0, len(ledger))
+
+    def _category(self, code: int) -> tuple[array.array, array.array]:
+        if code not in self.category_ts:
+            self.category_ts[code] = array.array('q')
+            self.category_sums[code] = array.array('q', [0])
+        return self.category_ts[code], self.category_sums[code]
+
+    def appended(self, low: int, high: int) -> None:
+        """Account for the spendings just appended at positions [low, high)."""
+        ledger = self.ledger
+        if high - low <= BULK:
+            running = self.sums[-1]
+            for ticks, code, amount in zip(ledger.ts[low:high], ledger.codes[low:high], ledger.amounts[low:high]):
+                running += amount
+                self.sums.append(running)
+                stamps, sums = self._category(code)
+                stamps.append(ticks)
+                sums.append(sums[-1] + amount)
+            return
+        import numpy as np  # pylint: disable=import-outside-toplevel
+        from acc_bot import analytics  # pylint: disable=import-outside-toplevel
+        stamps, codes, amounts = analytics.columns(ledger)
+        self.sums.frombytes((np.cumsum(amounts[low:high]) + self.sums[-1]).tobytes())
+        for code, (times, running) in analytics.category_prefix_sums(stamps[low:high], codes[low:high],
+                                                                     amounts[low:high]).items():
+            category_ts, category_sums = self._category(code)
+            category_ts.frombytes(times.tobytes())
+            category_sums.frombytes((running + category_sums[-1]).tobytes())
+        del stamps, codes, amounts
+
+    @staticmethod
+    def _bounds(stamps: array.array, low: Optional[int], high: Optional[int]) -> tuple[int, int]:
+        first = 0 if low is None else bisect.bisect_left(stamps, low)
+        last = len(stamps) if high is None else bisect.bisect_left(stamps, high, first)
+        return first, max(first, last)
+
+    def total(self, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        """Sum spendings with timestamps in ticks within [low, high)."""
+        first, last = self._bounds(self.ledger.ts, low, high)
+        return self.sums[last] - self.sums[first]
+
+    def category_total(self, code: int, low: Optional[int] = None, high: Optional[int] = None) -> int:
+        """Sum spendings of the category code with timestamps in ticks within [low, high)."""
+        if code not in self.category_ts:
+            return 0
+        first, last = self._bounds(self.category_ts[code], low, high)
+        return self.category_sums[code][last] - self.category_sums[code][first]
+
+    def totals(self, low: Optional[int] = None, high: Optional[int] = None) -> dict[int, int]:
+        """Sum spendings with timestamps in ticks within [low, high) by category code.
+
+        Categories with no spendings in the range are left out.
+        """
+        totals = {}
+        for code, stamps in self.category_ts.items():
+            first, last = self._bounds(stamps, low, high)
+            if last > first:
+                totals[code] = self.category_sums[code][last] - self.category_sums[code][first]
+        return totals
+
+
+def as_ledger(data: Union[Ledger, dict]) -> Ledger:
+    """Return data as ledger, converting legacy dict if needed."""
+    if isinstance(data, Ledger):
+        return data
+    return Ledger.from_dict(data)
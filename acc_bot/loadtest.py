@@ -0,0 +1,454 @@
+"""Offline load test replaying synthetic traffic through the bot handlers.
+
+Run as ``python -m acc_bot.loadtest --users 1000 --commands 20``.
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import os
+import functools
+import subprocess
+import tempfile
+import tracemalloc
+import datetime
+import collections
+import http.client
+import urllib.parse
+from types import SimpleNamespace
+from typing import Callable, Optional
+
+import numpy as np
+from telegram import Update
+from telegram.ext import Dispatcher, Updater
+
+from acc_bot import bot
+from acc_bot.config import parse_config
+from acc_bot.digest import Digests
+from acc_bot.fakes import FakeContext, RecordingBot, SilentBot, make_update, update_json
+from acc_bot.session import State, get_session
+from acc_bot.shards import ShardPool, shard_of
+from acc_bot.snapshot import Snapshot, write_snapshot
+from acc_bot.storage import Storage, UserStore
+from acc_bot.test_data import CATEGORIES_FLAT, generate_arrays, generate_ledgers
+from acc_bot.util import check_limit
+from acc_bot.webhook import WebhookServer
+
+
+def transport_run(transport: str, users: int = 100, messages: int = 10, workers: int = 4,
+                  rate: float = 2000) -> dict[str, float]:
+    """Deliver quick entry messages through polling or the webhook server and return reply latency stats.
+
+    Messages of all users are sent ``rate`` per second, interleaved. Polling
+    fetches them with the updater loop from ``RecordingBot``, the webhook
+    receives them as HTTP posts to a local ``WebhookServer``.
+    """
+    fake = RecordingBot()
+    rnd = random.Random(42)
+    plan = [(user_id, f'{rnd.randint(5, 2000)} {rnd.choice(CATEGORIES_FLAT)}')
+            for _ in range(messages) for user_id in range(users)]
+    if transport == 'polling':
+        updater = Updater(bot=fake, use_context=True, workers=workers)
+        dispatcher = updater.dispatcher
+
+        def send(update: dict) -> None:
+            fake.incoming.put(update)
+    elif transport == 'webhook':
+        dispatcher = Dispatcher(fake, None, workers=0, use_context=True)
+        server = WebhookServer(dispatcher, port=0, workers=workers, backlog=len(plan))
+        address = urllib.parse.urlsplit(server.url)
+        connection = http.client.HTTPConnection(address.hostname, address.port)
+
+        def send(update: dict) -> None:
+            connection.request('POST', address.path, json.dumps(update).encode(), {'Content-Type': 'application/json'})
+            connection.getresponse().read()
+    else:
+        raise ValueError(f'Unknown transport {transport}')
+    dispatcher.bot_data['users'] = UserStore()
+    bot.register_handlers(dispatcher)
+
+    if transport == 'polling':
+        updater.start_polling(poll_interval=0, timeout=1)
+    else:
+        server.start()
+    started = time.perf_counter()
+    for update_id, (user_id, text) in enumerate(plan, 1):
+        fake.sent(user_id)
+        send(update_json(update_id, user_id, text))
+        pause = started + update_id / rate - time.perf_counter()
+        if pause > 0:
+            time.sleep(pause)
+    fake.wait(len(plan))
+    elapsed = time.perf_counter() - started
+    if transport == 'polling':
+        updater.stop()
+    else:
+        connection.close()
+        server.stop()
+
+    samples = sorted(fake.latencies)
+    return {
+        'count': len(samples),
+        'p50': percentile(samples, 0.50),
+        'p95': percentile(samples, 0.95),
+        'p99': percentile(samples, 0.99),
+        'seconds': elapsed,
+        'throughput': len(samples) / elapsed,
+    }
+
+
+def max_rss_mb() -> float:
+    """Return peak resident memory of the process in MiB, NaN where it is not known."""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return math.nan
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def memory_run(users: int = 100000, entries: int = 50, weeks: int = 8, seed: int = 42,
+               sample: int = 1000) -> dict[str, float]:
+    """Load generated histories and sessions of all users and measure the memory they take.
+
+    Allocations are traced with tracemalloc. The legacy encoding, a
+    ``{datetime: (category, amount)}`` dict and a dict of session keys, is
+    measured on the first ``sample`` users for comparison.
+    """
+    # NumPy loads its random module on first use, which must not count as history
+    np.random.default_rng(seed)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        store = UserStore()
+        for user_id, history in enumerate(generate_ledgers(users, entries, datetime.timedelta(weeks=weeks), seed=seed)):
+            store.replace(user_id, history)
+        histories = tracemalloc.get_traced_memory()[0]
+        user_data: dict[int, dict] = collections.defaultdict(dict)
+        for user_id in range(users):
+            session = get_session(user_data[user_id])
+            session.lang, session.state = 'en', State.FREE
+        sessions = tracemalloc.get_traced_memory()[0]
+        sample = min(sample, users)
+        legacy = [(dict(store.get(user_id)['data'].items()),
+                   {'context': 'free', 'aggression_lvl': 0, 'curr_category': None, 'lang': 'en'})
+                  for user_id in range(sample)]
+        legacy_size = tracemalloc.get_traced_memory()[0] - sessions
+    finally:
+        tracemalloc.stop()
+    spendings = users * entries
+    legacy_spendings = sum(len(history) for history, _ in legacy)
+    return {
+        'users': users,
+        'spendings': spendings,
+        'history_bytes': histories - start,
+        'bytes_per_spending': (histories - start) / spendings,
+        'session_bytes_per_user': (sessions - histories) / users,
+        'legacy_bytes_per_spending': legacy_size / legacy_spendings if legacy_spendings else 0.0,
+        'max_rss_mb': max_rss_mb(),
+    }
+
+
+SCENARIOS: dict[str, Callable[[random.Random], list[tuple[Callable, str]]]] = {
+    'add': lambda rnd: [(bot.add, '/add'), (bot.category_chooser, rnd.choice(CATEGORIES_FLAT)),
+                        (bot.category_upd, str(rnd.randint(5, 2000)))],
+    'set_limit': lambda rnd: [(bot.set_limit, '/set_limit'), (bot.category_chooser, rnd.choice(CATEGORIES_FLAT)),
+                              (bot.category_upd, str(rnd.randint(1000, 20000)))],
+    'week': lambda rnd: [(bot.week, '/week')],
+    'weeks': lambda rnd: [(bot.weeks, '/weeks')],
+    'chart': lambda rnd: [(bot.chart, '/chart')],
+    'report': lambda rnd: [(bot.report, rnd.choice(('/report', '/report week', '/report year transport')))],
+}
+WEIGHTS = {'add': 60, 'set_limit': 5, 'week': 15, 'weeks': 15, 'chart': 5, 'report': 5}
+
+
+def fill_shard(dispatcher: Dispatcher, shard: int, shards: int = 1, users: int = 100, entries: int = 1000,
+               seed: int = 42) -> None:
+    """Load generated histories of the users owned by the shard."""
+    store = dispatcher.bot_data['users']
+    for user_id, ledger in enumerate(generate_ledgers(users, entries, seed=seed)):
+        if shard_of(user_id, shards) == shard:
+            store.get(user_id)['data'] = ledger
+
+
+def shard_run(shards: int = 4, users: int = 200, messages: int = 4, entries: int = 2000,
+              seed: int = 42) -> dict[str, float]:
+    """Replay spendings and ``/weeks`` requests of the users through shard worker processes.
+
+    Every user alternates quick entries with ``/weeks``, so each request
+    recomputes the history. Returns throughput after the workers warmed up.
+    """
+    config = parse_config(['--db', ':memory:', '--token', '123:test'], {})
+    pool = ShardPool(shards, config, bot_factory=SilentBot,
+                     setup=functools.partial(fill_shard, shards=shards, users=users, entries=entries, seed=seed))
+    bot_ = SilentBot()
+    pool.start()
+    try:
+        for shard in range(shards):
+            pool.submit(Update.de_json(update_json(shard, shard, '/start'), bot_))
+        while pool.done() < shards:
+            time.sleep(0.01)
+        updates = [Update.de_json(update_json(number * users + user_id, user_id,
+                                              '/weeks' if number % 2 else f'{number + 10} restaurants'), bot_)
+                   for number in range(messages) for user_id in range(users)]
+        started = time.perf_counter()
+        for update in updates:
+            pool.submit(update)
+        while pool.done() < shards + len(updates):
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - started
+    finally:
+        pool.stop()
+    return {'shards': shards, 'count': len(updates), 'seconds': elapsed, 'throughput': len(updates) / elapsed}
+
+
+def snapshot_run(users: int = 1000000, entries: int = 10, weeks: int = 8, seed: int = 42,
+                 sample: int = 10000, directory: Optional[str] = None) -> dict[str, float]:
+    """Fill a database with generated users, snapshot it and restore a sample of users.
+
+    Returns seconds taken to write the snapshot, to open it and per user
+    loaded from the snapshot and from the database rows.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        storage = Storage(os.path.join(tmp, 'bench.db'))
+        ts, codes, amounts = generate_arrays(users, entries, datetime.timedelta(weeks=weeks), seed=seed)
+        batch = max(1, 100000 // entries)
+        for low in range(0, users, batch):
+            rows = zip(np.repeat(np.arange(low, min(users, low + batch)), entries).tolist(),
+                       ts[low:low + batch].ravel().tolist(),
+                       [CATEGORIES_FLAT[code] for code in codes[low:low + batch].ravel().tolist()],
+                       amounts[low:low + batch].ravel().tolist())
+            storage.write(rows, [(user_id, 'other', 1000) for user_id in range(low, min(users, low + batch), 7)])
+        del ts, codes, amounts
+        path = os.path.join(tmp, 'bench.snapshot')
+        written = write_snapshot(storage, path)
+        begin = time.perf_counter()
+        snapshot = Snapshot(path)
+        opened = time.perf_counter() - begin
+        chosen = random.Random(seed).sample(range(users), min(sample, users))
+        begin = time.perf_counter()
+        for user_id in chosen:
+            snapshot.load(user_id, storage.version(user_id))
+        restored = time.perf_counter() - begin
+        begin = time.perf_counter()
+        for user_id in chosen:
+            storage.load(user_id)
+        loaded = time.perf_counter() - begin
+        size = os.path.getsize(path)
+        snapshot.close()
+        storage.close()
+    return {
+        'users': users,
+        'spendings': written['spendings'],
+        'snapshot_bytes': size,
+        'write_seconds': written['seconds'],
+        'open_seconds': opened,
+        'restore_user_seconds': restored / len(chosen),
+        'load_user_seconds': loaded / len(chosen),
+    }
+
+
+def digest_run(users: int = 100000, entries: int = 50, weeks: int = 8, seed: int = 42) -> dict[str, float]:
+    """Check the limits of generated users in one batch and one user at a time, queue weekly digests.
+
+    Every user has limits for two categories. Returns seconds taken by the
+    batched alert check, by ``check_limit`` called for every limit and by the
+    digests, with the numbers of messages queued.
+    """
+    store = UserStore()
+    rnd = random.Random(seed)
+    for user_id, history in enumerate(generate_ledgers(users, entries, datetime.timedelta(weeks=weeks), seed=seed)):
+        store.replace(user_id, history)
+        for category in rnd.sample(CATEGORIES_FLAT, 2):
+            store.set_limit(user_id, category, rnd.randint(500, 5000))
+    queued: list[tuple[int, str]] = []
+    outbox = SimpleNamespace(put=lambda *message: queued.append(message))
+    digests = Digests(Dispatcher(SilentBot(), None), store, outbox)
+    begin = time.perf_counter()
+    alerts = digests.send_alerts()
+    batched = time.perf_counter() - begin
+    begin = time.perf_counter()
+    for user_id in range(users):
+        record = store.get(user_id)
+        for category in record['limits']:
+            check_limit(record, category)
+    single = time.perf_counter() - begin
+    begin = time.perf_counter()
+    sent = digests.send_digests()
+    digested = time.perf_counter() - begin
+    return {
+        'users': users,
+        'alerts': alerts,
+        'alert_seconds': batched,
+        'check_limit_seconds': single,
+        'digests': sent,
+        'digest_seconds': digested,
+    }
+
+
+# Seconds the bot import may take, most of it is the telegram package, and the part of the bot modules
+IMPORT_BUDGET = 1.0
+OWN_BUDGET = 0.2
+
+
+def import_run(module: str = 'acc_bot.bot', repeat: int = 3) -> dict:
+    """Import the module in fresh interpreters and return the fastest import.
+
+    Returns the import ``seconds``, the part spent in the ``own`` bot modules
+    and the names of all ``modules`` imported along.
+    """
+    best: Optional[dict] = None
+    for _ in range(repeat):
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                capture_output=True, text=True, check=True).stderr
+        times = {}
+        own = 0
+        for line in stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            name = name.strip()
+            times[name] = int(cumulative_us) / 10 ** 6
+            if name.split('.')[0] == module.split('.')[0]:
+                own += int(self_us)
+        stats = {'seconds': times[module], 'own': own / 10 ** 6, 'modules': set(times)}
+        if best is None or stats['seconds'] < best['seconds']:
+            best = stats
+    return best
+
+
+def percentile(samples: list[float], share: float) -> float:
+    """Return the sample below which the share of sorted samples lies."""
+    return samples[min(len(samples) - 1, int(share * len(samples)))]
+
+
+def run(users: int, commands: int, entries: int = 1000, weeks: int = 8, seed: int = 42,
+        weights: Optional[dict[str, int]] = None) -> dict[str, dict[str, float]]:
+    """Replay synthetic commands of all users and return latency stats per command.
+
+    Every user starts with a generated history of ``entries`` spendings over
+    ``weeks`` weeks and then sends ``commands`` commands picked by ``weights``,
+    interleaved with the other users. Latency covers all steps of a command's scenario.
+    """
+    rnd = random.Random(seed)
+    weights = weights or WEIGHTS
+    names, chances = list(weights), list(weights.values())
+    bot_data = {'users': UserStore()}
+    histories = generate_ledgers(users, entries, datetime.timedelta(weeks=weeks), seed=seed)
+    contexts = {}
+    for user_id, history in enumerate(histories):
+        contexts[user_id] = FakeContext(bot_data)
+        bot.start(make_update(user_id, '/start'), contexts[user_id])
+        bot_data['users'].replace(user_id, history)
+
+    plan = [(user_id, name) for user_id in range(users) for name in rnd.choices(names, chances, k=commands)]
+    rnd.shuffle(plan)
+    latencies: dict[str, list[float]] = {name: [] for name in names}
+    started = time.perf_counter()
+    for user_id, name in plan:
+        steps = SCENARIOS[name](rnd)
+        begin = time.perf_counter()
+        for handler, text in steps:
+            contexts[user_id].args = text.split()[1:]
+            handler(make_update(user_id, text), contexts[user_id])
+        latencies[name].append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - started
+
+    report = {}
+    for name, samples in latencies.items():
+        if not samples:
+            continue
+        samples.sort()
+        report[name] = {
+            'count': len(samples),
+            'p50': percentile(samples, 0.50),
+            'p95': percentile(samples, 0.95),
+            'p99': percentile(samples, 0.99),
+        }
+    report['total'] = {'count': len(plan), 'seconds': elapsed, 'throughput': len(plan) / elapsed}
+    return report
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Run load test from the command line and print the report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000, help='number of simulated users')
+    parser.add_argument('--commands', type=int, default=20, help='commands sent by every user')
+    parser.add_argument('--entries', type=int, default=1000, help='spendings in the history of every user')
+    parser.add_argument('--weeks', type=int, default=8, help='weeks the history spans')
+    parser.add_argument('--seed', type=int, default=42, help='random seed')
+    parser.add_argument('--transport', choices=('polling', 'webhook'),
+                        help='measure reply latency of quick entries delivered by the transport instead')
+    parser.add_argument('--workers', type=int, default=4, help='worker threads of the transport')
+    parser.add_argument('--rate', type=float, default=2000, help='messages per second sent to the transport')
+    parser.add_argument('--memory', action='store_true',
+                        help='measure memory taken by histories and sessions of the users instead')
+    parser.add_argument('--import-time', action='store_true', help='measure import time of the bot instead')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='measure snapshot writing and restoring of the users instead')
+    parser.add_argument('--shards', type=int,
+                        help='measure throughput of /weeks requests served by this many worker processes instead')
+    parser.add_argument('--digest', action='store_true',
+                        help='measure batched limit alerts and weekly digests of the users instead')
+    args = parser.parse_args(argv)
+
+    if args.digest:
+        stats = digest_run(args.users, args.entries, args.weeks, args.seed)
+        print(f'{stats["users"]} users: {stats["alerts"]} alerts in {stats["alert_seconds"]:.2f} s '
+              f'(check_limit per limit {stats["check_limit_seconds"]:.2f} s), '
+              f'{stats["digests"]} digests in {stats["digest_seconds"]:.2f} s')
+        return
+
+    if args.shards:
+        stats = shard_run(args.shards, args.users, args.commands, args.entries, args.seed)
+        print(f'{stats["shards"]} shards: {stats["count"]} messages in {stats["seconds"]:.2f} s, '
+              f'{stats["throughput"]:.0f} messages/s')
+        return
+
+    if args.snapshot:
+        stats = snapshot_run(args.users, args.entries, args.weeks, args.seed)
+        print(f'{stats["users"]} users, {stats["spendings"]} spendings: '
+              f'snapshot of {stats["snapshot_bytes"] / 2 ** 20:.1f} MiB written in {stats["write_seconds"]:.2f} s, '
+              f'opened in {stats["open_seconds"] * 1000:.2f} ms, '
+              f'user restored in {stats["restore_user_seconds"] * 10 ** 6:.0f} us '
+              f'(loaded from rows in {stats["load_user_seconds"] * 10 ** 6:.0f} us)')
+        return
+
+    if args.import_time:
+        stats = import_run()
+        print(f'acc_bot.bot imported in {stats["seconds"] * 1000:.0f} ms, '
+              f'{stats["own"] * 1000:.0f} ms in the bot modules, {len(stats["modules"])} modules')
+        if stats['seconds'] > IMPORT_BUDGET or stats['own'] > OWN_BUDGET:
+            sys.exit(f'over the budget of {IMPORT_BUDGET * 1000:.0f} ms, {OWN_BUDGET * 1000:.0f} ms in the bot modules')
+        return
+
+    if args.memory:
+        stats = memory_run(args.users, args.entries, args.weeks, args.seed)
+        print(f'{stats["users"]} users, {stats["spendings"]} spendings: '
+              f'{stats["history_bytes"] / 2 ** 20:.1f} MiB of histories, '
+              f'{stats["bytes_per_spending"]:.1f} bytes per spending '
+              f'(legacy dict {stats["legacy_bytes_per_spending"]:.1f}), '
+              f'{stats["session_bytes_per_user"]:.1f} bytes per session, '
+              f'max RSS {stats["max_rss_mb"]:.0f} MiB')
+        return
+
+    if args.transport:
+        stats = transport_run(args.transport, args.users, args.commands, args.workers, args.rate)
+        print(f'{args.transport}: {stats["count"]} messages, p50 {stats["p50"] * 1000:.3f} ms, '
+              f'p95 {stats["p95"] * 1000:.3f} ms, p99 {stats["p99"] * 1000:.3f} ms, '
+              f'{stats["throughput"]:.0f} messages/s')
+        return
+
+    report = run(args.users, args.commands, args.entries, args.weeks, args.seed)
+    total = report.pop('total')
+    print(f'{"command":<10} {"count":>8} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for name, stats in report.items():
+        print(f'{name:<10} {stats["count"]:>8} {stats["p50"] * 1000:>9.3f} '
+              f'{stats["p95"] * 1000:>9.3f} {stats["p99"] * 1000:>9.3f}')
+    print(f'\n{total["count"]} commands in {total["seconds"]:.2f} s: {total["throughput"]:.0f} commands/s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,195 @@
+"""Handler latency, error and history size metrics in Prometheus text format."""
+
+import time
+import heapq
+import bisect
+import logging
+import threading
+import functools
+import http.server
+import collections
+from typing import Callable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+# Number of the largest and the busiest users listed by name
+TOP_USERS = 10
+# Number of users whose counts are kept to choose the top ones from, twice as many are kept between prunings
+TRACKED_USERS = 1000
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Counts of observed values falling into fixed buckets."""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        """Create histogram with no observations."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Account for the value."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def lines(self, name: str, labels: str = '') -> Iterator[str]:
+        """Yield Prometheus text lines with cumulative bucket counts."""
+        prefix = labels + ',' if labels else ''
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield f'{name}_bucket{{{prefix}le="{bound}"}} {total}'
+        yield f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}'
+        suffix = f'{{{labels}}}' if labels else ''
+        yield f'{name}_sum{suffix} {self.sum}'
+        yield f'{name}_count{suffix} {self.count}'
+
+
+class Registry:
+    """Thread safe collection of handler, util function and per-user metrics.
+
+    Per-user counts are kept for at most ``2 * tracked`` users: when there are
+    more, only the ``tracked`` largest ones are left, so a user dropped while
+    rarely seen starts counting anew.
+    """
+
+    def __init__(self, top_users: int = TOP_USERS, tracked: int = TRACKED_USERS):
+        """Create empty registry."""
+        self.top_users = top_users
+        self.tracked = max(tracked, top_users)
+        self.handlers: dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.errors: collections.Counter = collections.Counter()
+        self.functions: dict[str, Histogram] = collections.defaultdict(Histogram)
+        self.history = Histogram(SIZE_BUCKETS)
+        self.sizes: dict[int, int] = {}
+        self.updates: collections.Counter = collections.Counter()
+        self._lock = threading.Lock()
+
+    def observe_handler(self, name: str, seconds: float, failed: bool = False) -> None:
+        """Record handler latency and whether it raised."""
+        with self._lock:
+            self.handlers[name].observe(seconds)
+            if failed:
+                self.errors[name] += 1
+
+    def observe_function(self, name: str, seconds: float) -> None:
+        """Record time spent in the function."""
+        with self._lock:
+            self.functions[name].observe(seconds)
+
+    def observe_user(self, user_id: int, size: Optional[int]) -> None:
+        """Count an update of the user and account for the size of their history."""
+        with self._lock:
+            self.updates[user_id] += 1
+            if len(self.updates) > 2 * self.tracked:
+                self.updates = collections.Counter(dict(self.updates.most_common(self.tracked)))
+            if size is not None:
+                self.history.observe(size)
+                self.sizes[user_id] = size
+                if len(self.sizes) > 2 * self.tracked:
+                    self.sizes = dict(heapq.nlargest(self.tracked, self.sizes.items(), key=lambda item: item[1]))
+
+    def render(self) -> str:
+        """Return all metrics in Prometheus text exposition format."""
+        with self._lock:
+            lines = ['# TYPE acc_bot_handler_seconds histogram']
+            for name, histogram in sorted(self.handlers.items()):
+                lines.extend(histogram.lines('acc_bot_handler_seconds', f'handler="{name}"'))
+            lines.append('# TYPE acc_bot_handler_errors_total counter')
+            lines.extend(f'acc_bot_handler_errors_total{{handler="{name}"}} {self.errors[name]}'
+                         for name in sorted(self.handlers))
+            lines.append('# TYPE acc_bot_function_seconds histogram')
+            for name, histogram in sorted(self.functions.items()):
+                lines.extend(histogram.lines('acc_bot_function_seconds', f'function="{name}"'))
+            lines.append('# TYPE acc_bot_history_size histogram')
+            lines.extend(self.history.lines('acc_bot_history_size'))
+            lines.append('# TYPE acc_bot_largest_history_size gauge')
+            largest = heapq.nlargest(self.top_users, self.sizes.items(), key=lambda item: item[1])
+            lines.extend(f'acc_bot_largest_history_size{{user="{user_id}"}} {size}' for user_id, size in largest)
+            lines.append('# TYPE acc_bot_busiest_user_updates_total counter')
+            lines.extend(f'acc_bot_busiest_user_updates_total{{user="{user_id}"}} {count}'
+                         for user_id, count in self.updates.most_common(self.top_users))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """Return short per-handler and per-function report for the log."""
+        with self._lock:
+            lines = [f'{name}: {histogram.count} calls, mean {histogram.sum / histogram.count * 1000:.2f} ms, '
+                     f'{self.errors[name]} errors' for name, histogram in sorted(self.handlers.items())]
+            lines.extend(f'util.{name}: {histogram.count} calls, mean {histogram.sum / histogram.count * 1000:.2f} ms'
+                         for name, histogram in sorted(self.functions.items()))
+            if self.sizes:
+                user_id, size = max(self.sizes.items(), key=lambda item: item[1])
+                lines.append(f'largest history: user {user_id}, {size} spendings')
+        return '\n'.join(lines)
+
+
+REGISTRY = Registry()
+
+
+def instrument(callback: Callable, registry: Registry = REGISTRY) -> Callable:
+    """Wrap the handler callback to record its latency, errors and the user history size.
+
+    History size is taken from the ``users`` store in the bot data, if there is one.
+    """
+    name = callback.__name__
+
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = callback(update, context)
+            failed = False
+            return result
+        finally:
+            registry.observe_handler(name, time.perf_counter() - start, failed)
+            user = getattr(update, 'effective_user', None)
+            users = context.bot_data.get('users')
+            if user is not None and users is not None:
+                registry.observe_user(user.id, users.history_size(user.id))
+    return wrapper
+
+
+def timed(func: Callable) -> Callable:
+    """Record time spent in the function into the default registry."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            REGISTRY.observe_function(func.__name__, time.perf_counter() - start)
+    return wrapper
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    registry: Registry
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        payload = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+def serve(host: str = '127.0.0.1', port: int = 9100, registry: Registry = REGISTRY) -> http.server.HTTPServer:
+    """Serve ``GET /metrics`` from a background thread and return the server."""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='acc_bot metrics', daemon=True).start()
+    return server
@@ -0,0 +1,160 @@
+"""Opt-in profiling of handler calls for a fraction of updates or for one user.
+
+Deterministic profiles are written as pstats files readable with
+``python -m pstats``. Sampling profiles are written as collapsed stacks, one
+``frame;frame;frame count`` line per stack, ready for flame graph tools. File
+names carry the handler name, the user history size and the user ID.
+"""
+
+import os
+import sys
+import time
+import random
+import cProfile
+import threading
+import functools
+import collections
+from typing import Callable, Optional
+
+MODES = ('deterministic', 'sampling')
+
+
+class StackSampler:
+    """Sampler of the stacks of one thread running in the background."""
+
+    def __init__(self, thread_id: int, interval: float = 0.001):
+        """Prepare sampling of the thread every interval seconds."""
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: collections.Counter = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='acc_bot sampler', daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)  # pylint: disable=protected-access
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        """Start sampling."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling and wait for the sampler."""
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        """Return sampled stacks in collapsed format."""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    """Switch turning profiling of handler calls on and off at runtime.
+
+    When enabled, a call is profiled if it comes from the chosen user, or, with
+    no user chosen, with probability ``fraction``. Disabled, it costs one check per call.
+    """
+
+    def __init__(self, directory: str = 'profiles', interval: float = 0.001):
+        """Create disabled profiler writing to the directory."""
+        self.directory = directory
+        self.interval = interval
+        self.fraction = 0.0
+        self.user_id: Optional[int] = None
+        self.mode = MODES[0]
+        self.written = 0
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any calls are profiled."""
+        return self.fraction > 0 or self.user_id is not None
+
+    def enable(self, fraction: float = 1.0, user_id: Optional[int] = None, mode: str = MODES[0]) -> None:
+        """Profile the fraction of calls, or all calls of the user if one is given."""
+        if mode not in MODES:
+            raise ValueError(f'Unknown profiling mode {mode}')
+        if not 0 <= fraction <= 1:
+            raise ValueError('Fraction should be between 0 and 1')
+        self.mode = mode
+        self.user_id = user_id
+        self.fraction = 0.0 if user_id is not None else fraction
+
+    def disable(self) -> None:
+        """Stop profiling."""
+        self.fraction = 0.0
+        self.user_id = None
+
+    def toggle(self, fraction: float = 1.0) -> None:
+        """Disable profiling if it is enabled, otherwise profile the fraction of calls."""
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable(fraction)
+
+    def status(self) -> str:
+        """Describe what is profiled."""
+        if self.user_id is not None:
+            target = f'user {self.user_id}'
+        elif self.fraction > 0:
+            target = f'{self.fraction:g} of updates'
+        else:
+            return 'Profiling is off'
+        return f'Profiling {target} ({self.mode}), {self.written} profiles written to {self.directory}'
+
+    def wanted(self, user_id: Optional[int]) -> bool:
+        """Decide whether the call of the user is profiled."""
+        if self.user_id is not None:
+            return user_id == self.user_id
+        return self.fraction > 0 and self._random.random() < self.fraction
+
+    def _path(self, name: str, size: Optional[int], user_id: Optional[int], extension: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self.written += 1
+        return os.path.join(self.directory, f'{name}-{size or 0}-{user_id}-{time.time_ns()}.{extension}')
+
+    def wrap(self, callback: Callable) -> Callable:
+        """Wrap the handler callback to profile the wanted calls.
+
+        History size is taken from the ``users`` store in the bot data, if there is one.
+        """
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def wrapper(update, context):
+            user = getattr(update, 'effective_user', None)
+            user_id = None if user is None else user.id
+            if not self.enabled or not self.wanted(user_id):
+                return callback(update, context)
+            mode = self.mode
+            if mode == 'sampling':
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+            else:
+                profile = cProfile.Profile()
+                profile.enable()
+            try:
+                return callback(update, context)
+            finally:
+                users = context.bot_data.get('users')
+                size = None if users is None or user_id is None else users.history_size(user_id)
+                if mode == 'sampling':
+                    sampler.stop()
+                    with open(self._path(name, size, user_id, 'folded'), 'w', encoding='utf-8') as out:
+                        out.write(sampler.collapsed())
+                else:
+                    profile.disable()
+                    profile.dump_stats(self._path(name, size, user_id, 'prof'))
+        return wrapper
+
+
+PROFILER = Profiler(os.environ.get('ACC_BOT_PROFILE_DIR', 'profiles'))
@@ -0,0 +1,76 @@
+"""Parser of report periods like ``2022-05-01 2022-05-15``, ``2022-05``, ``2022-W20`` or ``month``."""
+
+import re
+import datetime
+from typing import Optional, Sequence
+
+from acc_bot.entry import EntryParser
+
+MONTH_PATTERN = re.compile(r'^(?P<year>\d{4})-(?P<month>\d{1,2})$')
+WEEK_PATTERN = re.compile(r'^(?P<year>\d{4})-w(?P<week>\d{1,2})$')
+KEYWORDS = ('today', 'week', 'month', 'year')
+
+
+def month_start(year: int, month: int) -> datetime.datetime:
+    """Return midnight of the first day of the month, months past December roll over to the next year."""
+    return datetime.datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def period(word: str, now: datetime.datetime) -> tuple[datetime.datetime, datetime.datetime]:
+    """Return [start, end) of the day, calendar month or ISO week named by the word.
+
+    Keywords stand for the current day, calendar week, month and year.
+    Raises ValueError if the word names no period.
+    """
+    word = word.strip().lower()
+    today = datetime.datetime.combine(now.date(), datetime.time())
+    if word == 'today':
+        return today, today + datetime.timedelta(days=1)
+    if word == 'week':
+        start = today - datetime.timedelta(days=today.weekday())
+        return start, start + datetime.timedelta(days=7)
+    if word == 'month':
+        return month_start(today.year, today.month), month_start(today.year, today.month + 1)
+    if word == 'year':
+        return datetime.datetime(today.year, 1, 1), datetime.datetime(today.year + 1, 1, 1)
+    match = MONTH_PATTERN.match(word)
+    if match:
+        year, month = int(match['year']), int(match['month'])
+        if not 1 <= month <= 12:
+            raise ValueError(f'No month {word}')
+        return month_start(year, month), month_start(year, month + 1)
+    match = WEEK_PATTERN.match(word)
+    if match:
+        start = datetime.datetime.fromisocalendar(int(match['year']), int(match['week']), 1)
+        return start, start + datetime.timedelta(days=7)
+    start = datetime.datetime.combine(datetime.date.fromisoformat(word), datetime.time())
+    return start, start + datetime.timedelta(days=1)
+
+
+def parse_report(args: Sequence[str], now: datetime.datetime,
+                 parser: EntryParser) -> tuple[datetime.datetime, datetime.datetime, Optional[str]]:
+    """Parse ``[from] [to] [category]`` arguments into ``(start, end, category)``.
+
+    The range spans from the start of the first period to the end of the
+    second one, a single period is reported alone and no period means the
+    current month. Raises ValueError if the arguments are not understood.
+    """
+    args = list(args)
+    periods = []
+    while args and len(periods) < 2:
+        try:
+            periods.append(period(args[0], now))
+        except ValueError:
+            break
+        args.pop(0)
+    if not periods:
+        periods.append(period('month', now))
+    start, end = periods[0][0], periods[-1][1]
+    if end <= start:
+        raise ValueError('Period ends before it starts')
+    category = None
+    if args:
+        category = parser.category(' '.join(args))
+        if category is None:
+            raise ValueError(f'Unknown category {" ".join(args)}')
+    return start, end, category
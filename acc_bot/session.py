@@ -0,0 +1,45 @@
+"""Compact conversation state of a user."""
+
+import enum
+from typing import Optional
+
+
+class State(enum.Enum):
+    """Step of the multi-message scenarios."""
+
+    FREE = 'free'
+    CHOOSE_SPENDING = 'cat_chooser_add'
+    CHOOSE_LIMIT = 'cat_chooser_lim'
+    SPENDING_AMOUNT = 'cat_upd_add'
+    LIMIT_AMOUNT = 'cat_upd_lim'
+
+
+# The amount step following each category choice
+AMOUNT_STEP = {State.CHOOSE_SPENDING: State.SPENDING_AMOUNT, State.CHOOSE_LIMIT: State.LIMIT_AMOUNT}
+
+
+class UserSession:
+    """Conversation state of one user: scenario step, chosen category, annoyance and language."""
+
+    __slots__ = ('state', 'category', 'aggression', 'lang')
+
+    def __init__(self, lang: Optional[str] = None):
+        """Create session in the free state."""
+        self.state = State.FREE
+        self.category: Optional[str] = None
+        self.aggression = 0
+        self.lang = lang
+
+    def reset(self) -> None:
+        """Leave any scenario, keeping the language."""
+        self.state = State.FREE
+        self.category = None
+        self.aggression = 0
+
+
+def get_session(user_data: dict) -> UserSession:
+    """Return session kept in the user data, creating it on first use."""
+    session = user_data.get('session')
+    if session is None:
+        session = user_data['session'] = UserSession()
+    return session
@@ -0,0 +1,161 @@
+"""Multi-process mode: users are spread over worker processes by their ID.
+
+The front process only receives updates and routes each one to the shard of
+its user. Every shard worker runs the usual handlers over its own user store,
+processing its updates one by one, so updates of a user keep their order and
+CPU-bound handlers of different shards run on different cores. All shards
+share the database, each writing only the users it owns.
+"""
+
+import json
+import queue
+import logging
+import argparse
+import threading
+import multiprocessing
+from typing import Callable, Hashable, Optional
+
+from telegram import Bot, Update
+from telegram.ext import CallbackContext, Dispatcher, TypeHandler, Updater
+
+from acc_bot.aio import update_key
+
+logger = logging.getLogger(__name__)
+
+# Seconds a put into a full queue waits before the worker is checked again
+PUT_TIMEOUT = 1.0
+
+
+def shard_of(key: Optional[Hashable], shards: int) -> int:
+    """Return shard of the user or chat ID, updates with neither go to the first shard."""
+    if key is None:
+        return 0
+    return key % shards if isinstance(key, int) else hash(key) % shards
+
+
+def serve_shard(shard: int, work: multiprocessing.Queue, processed, config: argparse.Namespace,
+                bot_factory: Optional[Callable[[], Bot]] = None,
+                setup: Optional[Callable[[Dispatcher, int], None]] = None) -> None:
+    """Run the bot handlers over the updates of the shard until None is received.
+
+    ``bot_factory`` replaces the Bot API client and ``setup`` prepares the
+    dispatcher before the first update, both are used by the load test.
+    """
+    # pylint: disable=import-outside-toplevel
+    from acc_bot.bot import register_handlers, start_services
+    bot = bot_factory() if bot_factory is not None else Bot(config.token)
+    updater = Updater(bot=bot, use_context=True)
+    close = start_services(updater, config, shard=shard)
+    register_handlers(updater.dispatcher)
+    if setup is not None:
+        setup(updater.dispatcher, shard)
+    updater.job_queue.start()
+    try:
+        for data in iter(work.get, None):
+            try:
+                updater.dispatcher.process_update(Update.de_json(json.loads(data), bot))
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to process update')
+            with processed.get_lock():
+                processed.value += 1
+    finally:
+        updater.job_queue.stop()
+        close()
+
+
+class ShardPool:
+    """Worker processes each owning the users whose ID falls into its shard.
+
+    Updates are passed to the workers as Bot API JSON through queues holding
+    at most ``backlog`` updates, a full queue blocks the front process. A
+    worker found dead is restarted on the same queue, one dying more than
+    ``max_restarts`` times makes ``submit`` raise RuntimeError.
+    """
+
+    def __init__(self, shards: int, config: argparse.Namespace, backlog: int = 10000,
+                 bot_factory: Optional[Callable[[], Bot]] = None,
+                 setup: Optional[Callable[[Dispatcher, int], None]] = None, max_restarts: int = 3):
+        """Prepare the workers, they run once started."""
+        self._context = multiprocessing.get_context('spawn')
+        self._args = (argparse.Namespace(**{**vars(config), 'shards': shards}), bot_factory, setup)
+        self.max_restarts = max_restarts
+        self.queues = [self._context.Queue(backlog) for _ in range(shards)]
+        self.processed = [self._context.Value('q', 0) for _ in range(shards)]
+        self.routed = [0] * shards
+        self.restarts = [0] * shards
+        self._lock = threading.Lock()
+        self._processes = [self._process(shard) for shard in range(shards)]
+
+    def _process(self, shard: int) -> multiprocessing.Process:
+        return self._context.Process(target=serve_shard, name=f'acc_bot shard {shard}', daemon=True,
+                                     args=(shard, self.queues[shard], self.processed[shard], *self._args))
+
+    def start(self) -> None:
+        """Start the worker processes."""
+        for process in self._processes:
+            process.start()
+
+    def _revive(self, shard: int) -> None:
+        with self._lock:
+            process = self._processes[shard]
+            if process.exitcode is None:
+                return
+            if self.restarts[shard] >= self.max_restarts:
+                raise RuntimeError(f'Shard {shard} worker died {self.restarts[shard] + 1} times, '
+                                   f'last exit code {process.exitcode}')
+            logger.error('Shard %d worker died with exit code %s, restarting', shard, process.exitcode)
+            self.restarts[shard] += 1
+            self._processes[shard] = self._process(shard)
+            self._processes[shard].start()
+
+    def _put(self, shard: int, item: Optional[str], revive: bool = True) -> bool:
+        """Put the item into the queue of the shard, waiting while its worker is alive."""
+        while True:
+            if self._processes[shard].exitcode is not None:
+                if not revive:
+                    return False
+                self._revive(shard)
+            try:
+                self.queues[shard].put(item, timeout=PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+
+    def submit(self, update: Update) -> int:
+        """Queue the update to the shard of its user and return the shard."""
+        shard = shard_of(update_key(update), len(self.queues))
+        self._put(shard, update.to_json())
+        with self._lock:
+            self.routed[shard] += 1
+        return shard
+
+    def route(self, update: Update, _context: CallbackContext) -> None:
+        """Pass the update to its shard, used as the handler callback."""
+        self.submit(update)
+
+    def register(self, dispatcher: Dispatcher) -> None:
+        """Make the dispatcher route all updates to the shards."""
+        dispatcher.add_handler(TypeHandler(Update, self.route))
+
+    def done(self) -> int:
+        """Return number of updates processed by all the workers."""
+        return sum(processed.value for processed in self.processed)
+
+    def health(self) -> dict:
+        """Return routed and processed update counts per shard."""
+        with self._lock:
+            routed = list(self.routed)
+        return {
+            'shards': len(self.queues),
+            'alive': [process.is_alive() for process in self._processes],
+            'routed': routed,
+            'processed': [processed.value for processed in self.processed],
+            'restarts': list(self.restarts),
+        }
+
+    def stop(self) -> None:
+        """Let the live workers process the queued updates, then stop them."""
+        for shard in range(len(self.queues)):
+            self._put(shard, None, revive=False)
+        for process in self._processes:
+            process.join()
@@ -0,0 +1,221 @@
+"""Binary snapshot of all user ledgers and limits, restored through memory mapping.
+
+A snapshot file holds the columns of all spendings grouped by user and an
+index of users sorted by ID, pointing to the slices of every user::
+
+    header | ts | amounts | limit amounts | codes | limit codes | index | categories
+
+Columns are little endian ``int64`` and ``uint8`` arrays, the index is an
+array of ``INDEX_DTYPE`` records and categories are a JSON list of the names
+codes refer to. Opening a snapshot maps the file and reads only the header,
+user data is copied out when the user is loaded. Every index record keeps the
+storage version of the user, so users changed after the snapshot are told apart.
+"""
+
+import os
+import json
+import mmap
+import time
+import struct
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+from acc_bot.ledger import Ledger
+from acc_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'ACCSNAP1'
+# Magic, number of users, spendings and limits, index and categories offsets, creation time
+HEADER = struct.Struct('<8sqqqqqd')
+INDEX_DTYPE = np.dtype([('user_id', '<i8'), ('version', '<i8'), ('start', '<i8'), ('count', '<i8'),
+                        ('limit_start', '<i8'), ('limit_count', '<i8')])
+# Rows fetched from the database at once
+CHUNK = 1 << 16
+
+
+def _align(offset: int) -> int:
+    return -(-offset // 8) * 8
+
+
+def _layout(spendings: int, limits: int) -> dict[str, int]:
+    offsets = {'ts': HEADER.size}
+    offsets['amounts'] = offsets['ts'] + 8 * spendings
+    offsets['limit_amounts'] = offsets['amounts'] + 8 * spendings
+    offsets['codes'] = offsets['limit_amounts'] + 8 * limits
+    offsets['limit_codes'] = offsets['codes'] + spendings
+    offsets['index'] = _align(offsets['limit_codes'] + limits)
+    return offsets
+
+
+def write_snapshot(storage: Storage, path: str) -> dict[str, float]:
+    """Write all users of the storage to the snapshot file, replacing it atomically.
+
+    The database is read in one transaction of a separate connection, so
+    writes go on meanwhile. Returns numbers of users and spendings and the
+    seconds taken.
+    """
+    started = time.perf_counter()
+    temp = f'{path}.{os.getpid()}.tmp'
+    categories: dict[str, int] = {}
+
+    def code(name: str) -> int:
+        return categories.setdefault(name, len(categories))
+
+    with storage.reader() as conn:
+        spendings = conn.execute('SELECT count(*) FROM spendings').fetchone()[0]
+        limit_rows = conn.execute('SELECT user_id, category, amount FROM limits ORDER BY user_id').fetchall()
+        versions = conn.execute('SELECT user_id, version FROM versions ORDER BY user_id').fetchall()
+        offsets = _layout(spendings, len(limit_rows))
+        with open(temp, 'wb+') as out:
+            out.truncate(offsets['index'])
+            spending_users, starts = [], []
+            if spendings:
+                with mmap.mmap(out.fileno(), offsets['index']) as buffer:
+                    ts = np.frombuffer(buffer, '<i8', spendings, offsets['ts'])
+                    amounts = np.frombuffer(buffer, '<i8', spendings, offsets['amounts'])
+                    codes = np.frombuffer(buffer, 'u1', spendings, offsets['codes'])
+                    cursor = conn.execute('SELECT user_id, ts, category, amount FROM spendings ORDER BY user_id, ts')
+                    position, last = 0, None
+                    for rows in iter(lambda: cursor.fetchmany(CHUNK), []):
+                        users, stamps, names, values = zip(*rows)
+                        high = position + len(rows)
+                        users = np.array(users, dtype=np.int64)
+                        ts[position:high] = stamps
+                        amounts[position:high] = values
+                        try:
+                            codes[position:high] = list(map(categories.__getitem__, names))
+                        except KeyError:
+                            for name in dict.fromkeys(names):
+                                code(name)
+                            codes[position:high] = list(map(categories.__getitem__, names))
+                        changes = np.flatnonzero(users[1:] != users[:-1]) + 1
+                        if users[0] != last:
+                            changes = np.concatenate(([0], changes))
+                        spending_users.extend(users[changes].tolist())
+                        starts.extend((changes + position).tolist())
+                        position, last = high, users[-1]
+                    del ts, amounts, codes
+                    buffer.flush()
+            limit_users = [row[0] for row in limit_rows]
+            version_users = [row[0] for row in versions]
+            ids = np.union1d(np.union1d(spending_users, limit_users), version_users).astype(np.int64)
+            index = np.zeros(len(ids), dtype=INDEX_DTYPE)
+            index['user_id'] = ids
+            positions = np.searchsorted(ids, spending_users)
+            index['start'][positions] = starts
+            index['count'][positions] = np.diff(np.append(starts, spendings))
+            index['version'][np.searchsorted(ids, version_users)] = [row[1] for row in versions]
+            if limit_rows:
+                limit_ids, limit_starts, limit_counts = np.unique(limit_users, return_index=True, return_counts=True)
+                positions = np.searchsorted(ids, limit_ids)
+                index['limit_start'][positions] = limit_starts
+                index['limit_count'][positions] = limit_counts
+                out.seek(offsets['limit_amounts'])
+                out.write(np.array([row[2] for row in limit_rows], dtype='<i8').tobytes())
+                out.seek(offsets['limit_codes'])
+                out.write(np.array([code(row[1]) for row in limit_rows], dtype='u1').tobytes())
+            out.seek(offsets['index'])
+            out.write(index.tobytes())
+            names = json.dumps(list(categories)).encode()
+            out.seek(0)
+            out.write(HEADER.pack(MAGIC, len(index), spendings, len(limit_rows), offsets['index'],
+                                  offsets['index'] + index.nbytes, time.time()))
+            out.seek(offsets['index'] + index.nbytes)
+            out.write(names)
+            out.flush()
+            os.fsync(out.fileno())
+    os.replace(temp, path)
+    return {'users': len(index), 'spendings': spendings, 'seconds': time.perf_counter() - started}
+
+
+class Snapshot:
+    """Memory mapped snapshot file the users are loaded from one at a time."""
+
+    def __init__(self, path: str):
+        """Map the file and read its header, raise ValueError if it is not a snapshot."""
+        self.path = path
+        with open(path, 'rb') as source:
+            self._buffer = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < HEADER.size or self._buffer[:len(MAGIC)] != MAGIC:
+            self._buffer.close()
+            raise ValueError(f'{path} is not a snapshot')
+        _, users, spendings, limits, index, names, self.created = HEADER.unpack_from(self._buffer)
+        offsets = _layout(spendings, limits)
+        self.index = np.frombuffer(self._buffer, INDEX_DTYPE, users, index)
+        self.ts = np.frombuffer(self._buffer, '<i8', spendings, offsets['ts'])
+        self.amounts = np.frombuffer(self._buffer, '<i8', spendings, offsets['amounts'])
+        self.codes = np.frombuffer(self._buffer, 'u1', spendings, offsets['codes'])
+        self.limit_amounts = np.frombuffer(self._buffer, '<i8', limits, offsets['limit_amounts'])
+        self.limit_codes = np.frombuffer(self._buffer, 'u1', limits, offsets['limit_codes'])
+        self.categories: list[str] = json.loads(self._buffer[names:])
+        self.restored = self.stale = 0
+
+    def __len__(self) -> int:
+        """Return number of users in the snapshot."""
+        return len(self.index)
+
+    def find(self, user_id: int) -> Optional[np.void]:
+        """Return index record of the user, None if the snapshot has no data of the user."""
+        position = int(np.searchsorted(self.index['user_id'], user_id))
+        if position < len(self.index) and self.index[position]['user_id'] == user_id:
+            return self.index[position]
+        return None
+
+    def load(self, user_id: int, version: Optional[int] = None) -> Optional[tuple[Ledger, dict[str, int]]]:
+        """Return ledger and limits of the user, None if the version given differs from the snapshot one."""
+        record = self.find(user_id)
+        if version is not None and version != (0 if record is None else record['version']):
+            self.stale += 1
+            return None
+        self.restored += 1
+        if record is None:
+            return Ledger(), {}
+        low, high = record['start'], record['start'] + record['count']
+        ledger = Ledger.from_arrays(self.ts[low:high], self.codes[low:high], self.amounts[low:high], self.categories)
+        low, high = record['limit_start'], record['limit_start'] + record['limit_count']
+        codes, amounts = self.limit_codes[low:high].tolist(), self.limit_amounts[low:high].tolist()
+        limits = {self.categories[code]: amount for code, amount in zip(codes, amounts)}
+        return ledger, limits
+
+    def close(self) -> None:
+        """Unmap the file."""
+        del self.index, self.ts, self.amounts, self.codes, self.limit_amounts, self.limit_codes
+        self._buffer.close()
+
+
+class SnapshotWriter:
+    """Background thread writing a snapshot of the storage every ``interval`` seconds."""
+
+    def __init__(self, storage: Storage, path: str, interval: float = 3600.0):
+        """Start the writer thread."""
+        self.storage = storage
+        self.path = path
+        self.interval = interval
+        self.written = 0
+        self.last: dict[str, float] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='acc_bot snapshot', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to write snapshot %s', self.path)
+
+    def write(self) -> dict[str, float]:
+        """Write a snapshot now."""
+        self.last = write_snapshot(self.storage, self.path)
+        self.written += 1
+        logger.info('snapshot: %s', self.last)
+        return self.last
+
+    def close(self) -> None:
+        """Stop the writer thread."""
+        self._stop.set()
+        self._thread.join()
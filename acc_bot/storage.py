@@ -0,0 +1,413 @@
+"""Persistent storage of user spendings and limits."""
+
+import sqlite3
+import logging
+import threading
+import time
+import contextlib
+import collections
+import datetime
+from typing import TYPE_CHECKING, Iterable, Iterator, Optional
+
+from acc_bot.ledger import Ledger, to_ticks
+
+if TYPE_CHECKING:
+    from acc_bot.snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS spendings (
+    user_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spendings_user_ts ON spendings (user_id, ts);
+CREATE TABLE IF NOT EXISTS limits (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (user_id, category)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    user_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    level INTEGER NOT NULL,
+    PRIMARY KEY (user_id, category)
+);
+'''
+# Milliseconds a write waits for the writes of other processes sharing the database
+BUSY_TIMEOUT = 30000
+BUMP_VERSION = ('INSERT INTO versions VALUES (?, 1) '
+                'ON CONFLICT (user_id) DO UPDATE SET version = version + 1')
+
+
+class Storage:
+    """SQLite database in WAL mode holding spendings and limits of all users.
+
+    Every write bumps the version of the users it touches, so copies of user
+    data made elsewhere, like snapshots, can tell whether they are current.
+    Several processes may write the same database, a write waits up to
+    ``BUSY_TIMEOUT`` milliseconds for the others to commit.
+    """
+
+    def __init__(self, path: str):
+        """Open (and create if needed) the database."""
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def load(self, user_id: int) -> tuple[Ledger, dict[str, int]]:
+        """Read ledger and limits of the user."""
+        with self._lock:
+            ledger = Ledger.from_rows(self._conn.execute(
+                'SELECT ts, category, amount FROM spendings WHERE user_id = ? ORDER BY ts', (user_id,)))
+            limits = dict(self._conn.execute(
+                'SELECT category, amount FROM limits WHERE user_id = ?', (user_id,)))
+        return ledger, limits
+
+    def version(self, user_id: int) -> int:
+        """Return version of the user data, 0 if it was never written."""
+        with self._lock:
+            row = self._conn.execute('SELECT version FROM versions WHERE user_id = ?', (user_id,)).fetchone()
+        return 0 if row is None else row[0]
+
+    @contextlib.contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Open a separate connection reading one consistent state of the database while writes go on."""
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        try:
+            conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+            conn.execute('BEGIN')
+            yield conn
+        finally:
+            conn.close()
+
+    def period_totals(self, low: int, high: int, shard: int = 0, shards: int = 1,
+                      limited: bool = False) -> list[tuple[int, str, int]]:
+        """Return ``(user_id, category, sum)`` of spendings within ticks [low, high) of all users.
+
+        Only users with ``user_id % shards == shard`` are summed and, if
+        ``limited``, only those having limits.
+        """
+        query = 'SELECT user_id, category, sum(amount) FROM spendings WHERE ts >= ? AND ts < ? AND user_id % ? = ?'
+        if limited:
+            query += ' AND user_id IN (SELECT user_id FROM limits)'
+        with self.reader() as conn:
+            return conn.execute(query + ' GROUP BY user_id, category', (low, high, shards, shard)).fetchall()
+
+    def limit_rows(self, shard: int = 0, shards: int = 1) -> list[tuple[int, str, int]]:
+        """Return ``(user_id, category, amount)`` limits of all users of the shard."""
+        with self.reader() as conn:
+            return conn.execute('SELECT user_id, category, amount FROM limits WHERE user_id % ? = ?',
+                                (shards, shard)).fetchall()
+
+    def alert_levels(self, shard: int = 0, shards: int = 1) -> list[tuple[int, str, int]]:
+        """Return ``(user_id, category, level)`` limit alert levels last reached by the users of the shard."""
+        with self.reader() as conn:
+            return conn.execute('SELECT user_id, category, level FROM alerts WHERE user_id % ? = ?',
+                                (shards, shard)).fetchall()
+
+    def set_alert_levels(self, levels: Iterable[tuple[int, str, int]], shard: int = 0, shards: int = 1) -> None:
+        """Replace alert levels of all users of the shard with the ``(user_id, category, level)`` rows."""
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('DELETE FROM alerts WHERE user_id % ? = ?', (shards, shard))
+            self._conn.executemany('INSERT INTO alerts VALUES (?, ?, ?)', levels)
+
+    def write(self, spendings: Iterable[tuple[int, int, str, int]] = (),
+              limits: Iterable[tuple[int, str, int]] = ()) -> None:
+        """Store spendings and limits in one transaction.
+
+        Spendings are ``(user_id, ts, category, amount)`` rows, limits are ``(user_id, category, amount)`` rows.
+        """
+        spendings, limits = list(spendings), list(limits)
+        users = {row[0] for row in spendings} | {row[0] for row in limits}
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.executemany('INSERT INTO spendings VALUES (?, ?, ?, ?)', spendings)
+            self._conn.executemany('INSERT OR REPLACE INTO limits VALUES (?, ?, ?)', limits)
+            self._conn.executemany(BUMP_VERSION, ((user_id,) for user_id in users))
+
+    def replace(self, user_id: int, ledger: Ledger) -> None:
+        """Replace all spendings of the user with the ledger."""
+        with self._lock, self._conn:
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._conn.execute('DELETE FROM spendings WHERE user_id = ?', (user_id,))
+            self._conn.executemany('INSERT INTO spendings VALUES (?, ?, ?, ?)',
+                                   ((user_id, *row) for row in ledger.rows()))
+            self._conn.execute(BUMP_VERSION, (user_id,))
+
+    def close(self) -> None:
+        """Close the database."""
+        with self._lock:
+            self._conn.close()
+
+
+class WriteBehind:
+    """Queue of pending writes committed to storage in batches by a background thread.
+
+    A batch is flushed once ``batch_size`` rows are pending or ``interval`` seconds
+    have passed, whichever comes first. A failed batch stays queued and is retried
+    after a delay doubling up to ``max_backoff`` seconds. ``stats`` reports queue
+    depth and flush latency.
+    """
+
+    def __init__(self, storage: Storage, batch_size: int = 500, interval: float = 1.0, max_backoff: float = 60.0):
+        """Start the flusher thread."""
+        self.storage = storage
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._spendings: list[tuple[int, int, str, int]] = []
+        self._limits: dict[tuple[int, str], int] = {}
+        self._users: set[int] = set()
+        # Users of the batch being committed
+        self._flushing: set[int] = set()
+        self.failures = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+        self._thread = threading.Thread(target=self._run, name='acc_bot write-behind', daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """Return number of pending rows."""
+        return len(self._spendings) + len(self._limits)
+
+    def pending(self, user_id: int) -> bool:
+        """Check if the user has writes not yet committed, including those being committed now."""
+        with self._cond:
+            return user_id in self._users or user_id in self._flushing
+
+    def put(self, spendings: Iterable[tuple[int, int, str, int]] = (),
+            limits: Iterable[tuple[int, str, int]] = ()) -> None:
+        """Queue rows in the ``Storage.write`` format."""
+        with self._cond:
+            for row in spendings:
+                self._spendings.append(row)
+                self._users.add(row[0])
+            for user_id, category, amount in limits:
+                self._limits[user_id, category] = amount
+                self._users.add(user_id)
+            if self.depth >= self.batch_size:
+                self._cond.notify()
+
+    def _run(self) -> None:
+        backoff = 0.0
+        while True:
+            with self._cond:
+                if not self._stopped and (backoff or self.depth < self.batch_size):
+                    self._cond.wait(backoff or self.interval)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+            except Exception:  # pylint: disable=broad-except
+                self.failures += 1
+                backoff = min(self.max_backoff, max(self.interval, 2 * backoff))
+                logger.exception('Failed to commit %d queued rows, retrying in %.1f s', self.depth, backoff)
+            else:
+                backoff = 0.0
+
+    def flush(self) -> None:
+        """Commit all pending rows now."""
+        with self._flush_lock:
+            with self._cond:
+                spendings, self._spendings = self._spendings, []
+                limits, self._limits = self._limits, {}
+                users, self._users = self._users, set()
+                self._flushing = users
+            if not spendings and not limits:
+                return
+            start = time.perf_counter()
+            try:
+                self.storage.write(spendings, [(*key, amount) for key, amount in limits.items()])
+            except Exception:
+                with self._cond:
+                    self._spendings[:0] = spendings
+                    self._limits = {**limits, **self._limits}
+                    self._users |= users
+                raise
+            finally:
+                with self._cond:
+                    self._flushing = set()
+            elapsed = time.perf_counter() - start
+            self.flushes += 1
+            self.flushed_rows += len(spendings) + len(limits)
+            self.flush_time += elapsed
+            self.last_flush_time = elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    def stats(self) -> dict[str, float]:
+        """Return queue depth and flush metrics."""
+        return {
+            'queue_depth': self.depth,
+            'flushes': self.flushes,
+            'flushed_rows': self.flushed_rows,
+            'last_flush_seconds': self.last_flush_time,
+            'avg_flush_seconds': self.flush_time / self.flushes if self.flushes else 0.0,
+            'max_flush_seconds': self.max_flush_time,
+            'failures': self.failures,
+        }
+
+    def close(self) -> None:
+        """Stop the flusher thread and commit what is left."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join()
+        self.flush()
+
+
+class UserStore:
+    """In-memory cache of user ledgers and limits backed by optional storage.
+
+    Users are loaded on first access and kept as ``{'data': Ledger, 'limits': dict}``
+    records. With storage configured, the least recently used users are evicted
+    once there are more than ``capacity`` of them, and ``evict_idle`` drops users
+    inactive for longer than ``idle``, so memory follows the number of active users.
+    Without storage nothing is ever evicted. If ``writer`` is given, changes are
+    queued to it instead of being written synchronously. If ``snapshot`` is
+    given, users are loaded from it unless storage has a newer version of them.
+    """
+
+    def __init__(self, storage: Optional[Storage] = None, capacity: int = 10000,
+                 idle: datetime.timedelta = datetime.timedelta(hours=1),
+                 writer: Optional[WriteBehind] = None, snapshot: Optional['Snapshot'] = None):
+        """Create empty cache."""
+        self.storage = storage
+        self.writer = writer
+        self.snapshot = snapshot
+        self.capacity = capacity
+        self.idle = idle.total_seconds()
+        self._users: collections.OrderedDict = collections.OrderedDict()
+        self._seen: dict[int, float] = {}
+        self._lock = threading.RLock()
+        # Number of blocks eviction is suspended for
+        self._pins = 0
+
+    def __len__(self) -> int:
+        """Return number of users in memory."""
+        return len(self._users)
+
+    def get(self, user_id: int) -> dict:
+        """Return the record of the user, loading it if needed."""
+        with self._lock:
+            record = self._users.get(user_id)
+            if record is None:
+                record = {'data': Ledger(), 'limits': {}}
+                restored = None
+                if self.storage is not None:
+                    if self.writer is not None and self.writer.pending(user_id):
+                        self.writer.flush()
+                    if self.snapshot is not None:
+                        restored = self.snapshot.load(user_id, self.storage.version(user_id))
+                    if restored is None:
+                        restored = self.storage.load(user_id)
+                elif self.snapshot is not None:
+                    restored = self.snapshot.load(user_id)
+                if restored is not None:
+                    record['data'], record['limits'] = restored
+                self._users[user_id] = record
+                self._evict_overflow()
+            else:
+                self._users.move_to_end(user_id)
+            self._seen[user_id] = time.monotonic()
+            return record
+
+    @contextlib.contextmanager
+    def pinned(self) -> Iterator[None]:
+        """Keep every user loaded while the block runs, users are evicted only after it."""
+        with self._lock:
+            self._pins += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins -= 1
+
+    @contextlib.contextmanager
+    def frozen(self) -> Iterator[list[tuple[int, dict]]]:
+        """Hold all changes while the block reads the ``(user_id, record)`` pairs in memory."""
+        with self._lock:
+            yield list(self._users.items())
+
+    def history_size(self, user_id: int) -> Optional[int]:
+        """Return number of spendings of the user in memory, None if the user is not loaded."""
+        record = self._users.get(user_id)
+        return None if record is None else len(record['data'])
+
+    def _evict_overflow(self) -> None:
+        if self.storage is None or self._pins:
+            return
+        while len(self._users) > self.capacity:
+            user_id, _ = self._users.popitem(last=False)
+            del self._seen[user_id]
+
+    def evict_idle(self) -> int:
+        """Drop users inactive for too long and return how many were dropped."""
+        if self.storage is None:
+            return 0
+        deadline = time.monotonic() - self.idle
+        with self._lock:
+            if self._pins:
+                return 0
+            stale = [user_id for user_id, seen in self._seen.items() if seen < deadline]
+            for user_id in stale:
+                del self._users[user_id]
+                del self._seen[user_id]
+        return len(stale)
+
+    def add_spending(self, user_id: int, moment: datetime.datetime, category: str, amount: int) -> None:
+        """Record the spending of the user."""
+        with self._lock:
+            self.get(user_id)['data'].add(moment, category, amount)
+            self._write(spendings=[(user_id, to_ticks(moment), category, amount)])
+
+    def extend(self, user_id: int, rows: list[tuple[int, str, int]]) -> None:
+        """Record a batch of ``(ticks, category, amount)`` spendings of the user."""
+        with self._lock:
+            self.get(user_id)['data'].extend(rows)
+            self._write(spendings=[(user_id, *row) for row in rows])
+
+    def set_limit(self, user_id: int, category: str, amount: int) -> None:
+        """Set weekly limit of the user for the category."""
+        with self._lock:
+            self.get(user_id)['limits'][category] = amount
+            self._write(limits=[(user_id, category, amount)])
+
+    def replace(self, user_id: int, ledger: Ledger) -> None:
+        """Replace the whole spending history of the user."""
+        with self._lock:
+            self.get(user_id)['data'] = ledger
+            if self.storage is not None:
+                if self.writer is not None:
+                    self.writer.flush()
+                self.storage.replace(user_id, ledger)
+
+    def _write(self, spendings: list = (), limits: list = ()) -> None:
+        if self.writer is not None:
+            self.writer.put(spendings, limits)
+        elif self.storage is not None:
+            self.storage.write(spendings, limits)
+
+    def close(self) -> None:
+        """Commit queued changes and stop the writer."""
+        if self.writer is not None:
+            self.writer.close()
@@ -2,21 +2,18 @@
 Test data loaders. The module uses random data generator
 with fixed state for reproducible tests.
 """
-import os
 import datetime
 import random
-import gettext
+from typing import Optional, Sequence
 
-gettext.install("bot", os.path.dirname(__file__), names=("ngettext",))
+import numpy as np
+
+from acc_bot.i18n import CATEGORIES_FLAT
+from acc_bot.ledger import TICK, Ledger, to_ticks
 
 random.seed(a=42)
 fix_state = random.getstate()
 
-CATEGORIES_FLAT = [
-    _('restaurants'), _('transport'), _('supermarkets'),
-    _('pharmacy'), _('entertainment'), _('other')
-]
-
 
 def load_test_data_1() -> dict:
     """Generates test data with 1 week span"""
@@ -49,3 +46,36 @@ def load_test_data_2() -> dict:
             (CATEGORIES_FLAT[i % len(CATEGORIES_FLAT)], costs[i])
 
     return res
+
+
+def generate_arrays(users: int = 1, entries: int = 1000,
+                    span: datetime.timedelta = datetime.timedelta(weeks=8),
+                    weights: Optional[Sequence[float]] = None, seed: int = 42,
+                    end: Optional[datetime.datetime] = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Generates spendings of many users in bulk.
+
+    Returns ``(ts, codes, amounts)`` arrays of shape ``(users, entries)``:
+    timestamps in ticks sorted along each row and spread over ``span`` before ``end``,
+    codes into ``CATEGORIES_FLAT`` drawn with ``weights`` and amounts from 5 to 2000.
+    """
+    rng = np.random.default_rng(seed)
+    high = to_ticks(end or datetime.datetime.now())
+    low = high - span // TICK
+    probs = None
+    if weights is not None:
+        probs = np.asarray(weights, dtype=np.float64)
+        probs = probs / probs.sum()
+    ts = rng.integers(low, high, size=(users, entries), dtype=np.int64)
+    ts.sort(axis=1)
+    codes = rng.choice(len(CATEGORIES_FLAT), size=(users, entries), p=probs).astype(np.uint8)
+    amounts = rng.integers(5, 2001, size=(users, entries), dtype=np.int64)
+    return ts, codes, amounts
+
+
+def generate_ledgers(users: int = 1, entries: int = 1000,
+                     span: datetime.timedelta = datetime.timedelta(weeks=8),
+                     weights: Optional[Sequence[float]] = None, seed: int = 42,
+                     end: Optional[datetime.datetime] = None) -> list[Ledger]:
+    """Generates ledgers of many users, see ``generate_arrays`` for parameters."""
+    ts, codes, amounts = generate_arrays(users, entries, span, weights, seed, end)
+    return [Ledger.from_arrays(ts[user], codes[user], amounts[user], CATEGORIES_FLAT) for user in range(users)]
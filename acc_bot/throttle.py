@@ -0,0 +1,160 @@
+"""Per-user rate limiting and coalescing of repeated expensive requests."""
+
+import time
+import threading
+import functools
+from typing import Any, Callable, Hashable, Optional
+
+# Rate in requests per second and burst size
+Limit = tuple[float, int]
+
+
+class TokenBucket:
+    """Bucket refilled with ``rate`` tokens per second up to ``burst`` tokens."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp', 'denied')
+
+    def __init__(self, rate: float, burst: int, now: float):
+        """Create full bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = now
+        self.denied = 0
+
+    def refill(self, now: float) -> None:
+        """Add tokens accumulated since the last refill."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def take(self, now: float) -> bool:
+        """Take a token if there is one."""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.denied = 0
+            return True
+        self.denied += 1
+        return False
+
+
+class RateLimiter:
+    """Token buckets per user and command.
+
+    Commands missing from ``limits`` share the ``default`` limit. Buckets that
+    have refilled completely are indistinguishable from new ones, so they are
+    dropped once there are more than ``capacity`` buckets.
+    """
+
+    def __init__(self, limits: Optional[dict[str, Limit]] = None, default: Limit = (2.0, 10),
+                 capacity: int = 100000):
+        """Create limiter with no buckets."""
+        self.limits = limits or {}
+        self.default = default
+        self.capacity = capacity
+        self._buckets: dict[tuple[int, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return number of buckets in memory."""
+        return len(self._buckets)
+
+    def allow(self, user_id: int, command: str, now: Optional[float] = None) -> bool:
+        """Take a token of the user for the command, return False if the user is over the limit."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            bucket = self._buckets.get((user_id, command))
+            if bucket is None:
+                if len(self._buckets) >= self.capacity:
+                    self._prune(now)
+                bucket = self._buckets[user_id, command] = TokenBucket(*self.limits.get(command, self.default), now)
+            return bucket.take(now)
+
+    def denied(self, user_id: int, command: str) -> int:
+        """Return number of requests denied in a row since the last allowed one."""
+        bucket = self._buckets.get((user_id, command))
+        return 0 if bucket is None else bucket.denied
+
+    def _prune(self, now: float) -> None:
+        full = []
+        for key, bucket in self._buckets.items():
+            bucket.refill(now)
+            if bucket.tokens >= bucket.burst:
+                full.append(key)
+        for key in full:
+            del self._buckets[key]
+
+    def wrap(self, callback: Callable, limited: Callable) -> Callable:
+        """Wrap the handler callback to call ``limited(update, context, denied)`` instead when over the limit.
+
+        ``denied`` is the number of requests denied in a row, so the user can
+        be warned only once per flood.
+        """
+        command = callback.__name__
+
+        @functools.wraps(callback)
+        def wrapper(update, context):
+            user = getattr(update, 'effective_user', None)
+            if user is None or self.allow(user.id, command):
+                return callback(update, context)
+            return limited(update, context, self.denied(user.id, command))
+        return wrapper
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.finished = 0.0
+
+
+class Coalescer:
+    """Single flight execution of identical requests.
+
+    Calls with the same key while one is running wait for it and share its
+    result, as do calls within ``ttl`` seconds after it finished. Keys should
+    include everything the result depends on, like the ledger version.
+    """
+
+    def __init__(self, ttl: float = 2.0):
+        """Create coalescer with nothing in flight."""
+        self.ttl = ttl
+        self.shared = 0
+        self._flights: dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, func: Callable, *args) -> Any:
+        """Return func(*args), or the result of the identical call in flight or just finished."""
+        now = time.monotonic()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and (not flight.done.is_set() or now - flight.finished < self.ttl):
+                self.shared += 1
+                owner = False
+            else:
+                self._expire(now)
+                flight = self._flights[key] = _Flight()
+                owner = True
+        if owner:
+            try:
+                flight.result = func(*args)
+            except Exception as exc:  # pylint: disable=broad-except
+                flight.error = exc
+                with self._lock:
+                    self._flights.pop(key, None)
+            flight.finished = time.monotonic()
+            flight.done.set()
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def _expire(self, now: float) -> None:
+        stale = [key for key, flight in self._flights.items()
+                 if flight.done.is_set() and now - flight.finished >= self.ttl]
+        for key in stale:
+            del self._flights[key]
@@ -1,37 +1,45 @@
-"""Module implements a number of tools used all across the project."""
+"""Module implements a number of tools used all across the project.
 
+NumPy and the plotting stack are imported on first use, keeping bot startup fast.
+"""
 
-import os
+
+import io
 import datetime
-import numpy as np
+import functools
+from typing import Optional, Union
+
+from acc_bot.ledger import TICK, WEEK, Ledger, as_ledger, to_ticks
+from acc_bot.metrics import timed
 
 
-def accumulate_by_span(data: dict, span: datetime.timedelta) -> list:
+@timed
+def accumulate_by_span(data: Union[Ledger, dict], span: datetime.timedelta) -> list:
     """Gater data(spendings) grouped by aforementioned time span."""
+    ledger = as_ledger(data)
+    if not ledger:
+        return []
     res = []
-    date_initial = datetime.datetime.now()
-    tmp = sorted(data.items(), key=lambda x: x[0])
-    for item in reversed(tmp):
-        while date_initial > item[0]:
-            res.append(0)
-            date_initial -= span
-        res[-1] += item[1][1]
+    index = ledger.buckets()
+    step = span // TICK
+    lower = to_ticks(datetime.datetime.now()) - step
+    upper = max(lower + step, ledger.ts[-1] + 1)
+    while True:
+        res.append(index.total(lower, upper))
+        if lower <= ledger.ts[0]:
+            break
+        upper, lower = lower, lower - step
 
     return res[::-1]
 
 
-def gater_week(data: dict) -> dict[str, int]:
+@timed
+def gater_week(data: Union[Ledger, dict]) -> dict[str, int]:
     """Gater categorial data(spendings) for the last week."""
-    date_initial = datetime.datetime.now() - datetime.timedelta(days=7)
-    week_spendings = {}
-    for key, val in data.items():
-        if key >= date_initial:
-            if val[0] not in week_spendings:
-                week_spendings[val[0]] = 0
-            week_spendings[val[0]] += val[1]
-    return week_spendings
+    return as_ledger(data).trailing(WEEK).sums(datetime.datetime.now())
 
 
+@timed
 def check_limit(data: dict, category: str) -> tuple[int, int]:
     """Check if category spendings for the last week exceeds the limit."""
     week_spendings = gater_week(data['data'])
@@ -40,27 +48,41 @@ def check_limit(data: dict, category: str) -> tuple[int, int]:
     return (cat_spent, cat_lim)
 
 
-def make_spending_prediction(data: dict) -> int:
-    """Make spending prediction based on avalible data."""
-    res = accumulate_by_span(data, datetime.timedelta(days=7))
+@timed
+def make_spending_prediction(data: Union[Ledger, dict], week_totals: Optional[list] = None) -> int:
+    """Make spending prediction based on avalible data.
+
+    Already computed ``accumulate_by_span`` weekly totals may be passed to avoid gathering them again.
+    """
+    res = accumulate_by_span(data, WEEK) if week_totals is None else week_totals
     if len(res) == 0:
         return -1
-    x_data = np.c_[np.ones(len(res), dtype=np.float32), np.arange(len(res))]
-    y_data = np.c_[np.array(res)]
-    w_matr = np.linalg.inv(x_data.T@x_data)@x_data.T@y_data
-    return int((np.array([1, len(res)])@w_matr)[0])
-
-
-def make_pie(data: dict) -> None:
-    """Plot pie chart of weekly spendings."""
-    res = gater_week(data)
-    data, labels = [*res.values()], [*res.keys()]
-    os.system('echo "import matplotlib.pyplot as plt" >> tmp.py')
-    os.system('echo "import seaborn as sns" >> tmp.py')
-    os.system('echo ' + f'"data = {data}" >> tmp.py')
-    os.system('echo ' + f'"labels = {labels}" >> tmp.py')
-    os.system('echo "colors = sns.color_palette(\'pastel\')[0:len(data)]" >> tmp.py')
-    os.system('echo "plt.pie(data, labels = labels, colors = colors,  autopct=\'%.0f%%\')" >> tmp.py')
-    os.system('echo "plt.savefig(\'tmp.png\')" >> tmp.py')
-    os.system('python tmp.py')
-    os.remove('tmp.py')
+    from acc_bot.analytics import trend_prediction  # pylint: disable=import-outside-toplevel
+    return trend_prediction(res)
+
+
+@functools.lru_cache(maxsize=128)
+@timed
+def render_pie(week_spendings: tuple[tuple[str, int], ...]) -> bytes:
+    """Render pie chart of ``(category, amount)`` pairs to PNG bytes."""
+    # pylint: disable=import-outside-toplevel
+    import seaborn as sns
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    labels, data = [item[0] for item in week_spendings], [item[1] for item in week_spendings]
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.gca().pie(data, labels=labels, colors=sns.color_palette('pastel')[0:len(data)], autopct='%.0f%%')
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+@timed
+def make_pie(data: Union[Ledger, dict]) -> bytes:
+    """Plot pie chart of weekly spendings and return it as PNG bytes.
+
+    Charts are cached by the weekly aggregate, so unchanged data is not rendered twice.
+    """
+    return render_pie(tuple(gater_week(data).items()))
@@ -0,0 +1,182 @@
+"""Webhook runtime receiving updates with an embedded HTTP server."""
+
+import json
+import queue
+import logging
+import threading
+import http.server
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Dispatcher
+
+from acc_bot.aio import update_key
+from acc_bot.metrics import CONTENT_TYPE, REGISTRY, Registry
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    # Keep connections open between updates, Telegram reuses them
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    server: '_HTTPServer'
+
+    def _reply(self, status: int, body: Optional[dict] = None) -> None:
+        payload = json.dumps(body or {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        if self.path == '/health':
+            self._reply(200, self.server.webhook.health())
+        elif self.path == '/metrics':
+            payload = self.server.webhook.registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self._reply(404)
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            self._reply(404)
+            return
+        if webhook.secret is not None and self.headers.get(SECRET_HEADER) != webhook.secret:
+            self._reply(403)
+            return
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            update = Update.de_json(data, webhook.dispatcher.bot)
+        except (ValueError, TypeError, KeyError):
+            self._reply(400)
+            return
+        self._reply(200 if webhook.submit(update) else 503)
+
+    def log_message(self, format: str, *args) -> None:  # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+
+class _HTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    webhook: 'WebhookServer'
+
+
+class WebhookServer:
+    """Accept updates posted by Telegram and pass them to the dispatcher handlers.
+
+    Accepted updates are queued to one of ``workers`` threads chosen by user,
+    so updates of the same user are processed in arrival order while different
+    users are served concurrently. A queue holds at most ``backlog`` updates,
+    beyond that the post is answered with 503 and Telegram delivers it again
+    later. ``GET /health`` reports queue depths and counters, ``GET /metrics``
+    the handler metrics of the registry.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, host: str = '127.0.0.1', port: int = 8080,
+                 path: str = '/webhook', workers: int = 4, backlog: int = 1000, secret: Optional[str] = None,
+                 registry: Registry = REGISTRY):
+        """Bind the server, it does not serve until started."""
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret = secret
+        self.registry = registry
+        self.received = self.processed = self.rejected = self.failed = 0
+        self._lock = threading.Lock()
+        self._queues: list[queue.Queue] = [queue.Queue(backlog) for _ in range(workers)]
+        self._threads: list[threading.Thread] = []
+        self._httpd = _HTTPServer((host, port), _RequestHandler)
+        self._httpd.webhook = self
+
+    @property
+    def url(self) -> str:
+        """Local URL updates are posted to."""
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}{self.path}'
+
+    def health(self) -> dict:
+        """Return queue depths and update counters."""
+        with self._lock:
+            return {
+                'status': 'ok',
+                'workers': len(self._queues),
+                'queued': [work.qsize() for work in self._queues],
+                'received': self.received,
+                'processed': self.processed,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
+
+    def submit(self, update: Update) -> bool:
+        """Queue the update to the worker of its user, return False if the queue is full."""
+        key = update_key(update)
+        work = self._queues[hash(key) % len(self._queues)]
+        try:
+            work.put_nowait(update)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.received += 1
+        return True
+
+    def _work(self, work: queue.Queue) -> None:
+        while True:
+            update = work.get()
+            if update is None:
+                work.task_done()
+                return
+            try:
+                self.dispatcher.process_update(update)
+                failed = False
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Failed to process update %s', update.update_id)
+                failed = True
+            with self._lock:
+                self.processed += 1
+                self.failed += failed
+            work.task_done()
+
+    def start(self) -> None:
+        """Start the workers and serve requests in a background thread."""
+        for number, work in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(work,), name=f'acc_bot webhook {number}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._httpd.serve_forever, name='acc_bot webhook server', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def drain(self) -> None:
+        """Wait until all queued updates are processed."""
+        for work in self._queues:
+            work.join()
+
+    def stop(self) -> None:
+        """Stop accepting updates, process the queued ones and stop the workers."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        for work in self._queues:
+            work.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def run(self) -> None:
+        """Serve updates until interrupted."""
+        self.start()
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
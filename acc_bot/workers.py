@@ -0,0 +1,149 @@
+"""Process pool that renders images away from the update dispatcher."""
+
+import collections
+import concurrent.futures
+import multiprocessing
+import threading
+from typing import Any, Callable, Optional
+
+
+class PoolBusy(Exception):
+    """Raised when all rendering slots are taken."""
+
+
+def warm_up() -> None:
+    """Import the plotting stack in a worker before its first task."""
+    # pylint: disable=import-outside-toplevel,unused-import
+    import seaborn  # noqa: F401
+    from matplotlib.backends import backend_agg  # noqa: F401
+    from acc_bot import util  # noqa: F401
+
+
+class RenderPool:
+    """Bounded pool of warm worker processes for CPU-heavy rendering.
+
+    Tasks are accepted while there are free slots (running plus queued),
+    otherwise ``PoolBusy`` is raised so the caller can reply at once.
+    A task identical to one in flight takes no slot, its callback gets the
+    outcome of the running one.
+    Results are delivered to a callback from a pool thread, either with the
+    rendered value or with the error, including ``TimeoutError`` when the
+    task did not finish in time.
+    A task out of time frees its slot and the workers are replaced with fresh
+    ones, failing the other tasks they were running. Workers are replaced as
+    well when one of them dies.
+    """
+
+    def __init__(self, workers: int = 2, backlog: int = 8, timeout: float = 10.0, cache_size: int = 128):
+        """Start worker processes."""
+        self.timeout = timeout
+        self.workers = workers
+        self.recycled = 0
+        self._executor = self._start()
+        self._slots = threading.BoundedSemaphore(workers + backlog)
+        self._cache: collections.OrderedDict = collections.OrderedDict()
+        self._cache_size = cache_size
+        self._pending: dict[tuple, list] = {}
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def _start(self) -> concurrent.futures.ProcessPoolExecutor:
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=warm_up
+        )
+
+    def _recycle(self, executor: concurrent.futures.ProcessPoolExecutor) -> None:
+        """Replace the executor with a fresh one and kill its workers, unless it is replaced already."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = self._start()
+            self.recycled += 1
+        # The executor cannot stop a running task, only its process can be stopped
+        processes = list((getattr(executor, '_processes', None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def _remember(self, key: tuple, value: Any) -> None:
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def submit(self, callback: Callable[[Any, Optional[BaseException]], None],
+               func: Callable, *args) -> None:
+        """Run func(*args) in a worker and pass the outcome to callback(result, error)."""
+        key = (func, args)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                result = self._cache[key]
+                hit = True
+            elif key in self._pending:
+                self._pending[key].append(callback)
+                self.coalesced += 1
+                return
+            elif not self._slots.acquire(blocking=False):
+                raise PoolBusy()
+            else:
+                waiters = self._pending[key] = [callback]
+                executor = self._executor
+                hit = False
+        if hit:
+            callback(result, None)
+            return
+        held = [True]
+
+        def release() -> None:
+            with self._lock:
+                if not held:
+                    return
+                held.clear()
+            self._slots.release()
+
+        def deliver(result: Any, error: Optional[BaseException]) -> None:
+            with self._lock:
+                if self._pending.get(key) is not waiters:
+                    return
+                del self._pending[key]
+            for waiter in waiters:
+                waiter(result, error)
+
+        def finished(future: concurrent.futures.Future) -> None:
+            timer.cancel()
+            release()
+            if future.cancelled():
+                # Tasks still queued when the workers are replaced
+                deliver(None, concurrent.futures.CancelledError())
+                return
+            error = future.exception()
+            if error is None:
+                self._remember(key, future.result())
+            elif isinstance(error, concurrent.futures.BrokenExecutor):
+                self._recycle(executor)
+            deliver(None if error else future.result(), error)
+
+        def expired() -> None:
+            release()
+            self._recycle(executor)
+            deliver(None, TimeoutError())
+
+        timer = threading.Timer(self.timeout, expired)
+        timer.daemon = True
+        timer.start()
+        try:
+            future = executor.submit(func, *args)
+        except concurrent.futures.BrokenExecutor as exc:
+            timer.cancel()
+            release()
+            self._recycle(executor)
+            deliver(None, exc)
+            return
+        future.add_done_callback(finished)
+
+    def shutdown(self) -> None:
+        """Stop worker processes, dropping queued tasks."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -21,6 +21,14 @@ def task_test():
     yield {'actions': ['coverage report'], 'verbosity': 2, 'name': "report"}
 
 
+def task_bench():
+    """Replay synthetic traffic through the handlers."""
+    return {
+        'actions': ['python -m acc_bot.loadtest'],
+        'verbosity': 2,
+    }
+
+
 def task_coverage():
     """Produce HTML coverage table"""
     return {
@@ -0,0 +1,88 @@
+"""Testing module"""
+
+import time
+import asyncio
+import unittest
+from telegram import Bot, Update
+from telegram.ext import Dispatcher, Filters, MessageHandler
+from acc_bot.aio import AsyncRuntime
+
+
+def make_update(update_id: int, user_id: int, text: str) -> Update:
+    """Build text message update from the user."""
+    bot = Bot('123:test')
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'test'},
+            'text': text
+        }
+    }, bot)
+
+
+class AsyncRuntimeTest(unittest.TestCase):
+    """Main class for asyncio runtime testing."""
+
+    def setUp(self):
+        """Create dispatcher recording handled messages."""
+        self.dispatcher = Dispatcher(Bot('123:test'), None, workers=0, use_context=True)
+        self.handled = []
+
+    def record(self, update, context):
+        """Blocking handler sleeping for the number of centiseconds in the message."""
+        time.sleep(int(update.message.text) / 100)
+        context.user_data.setdefault('seen', []).append(update.message.text)
+        self.handled.append((update.effective_user.id, update.message.text))
+
+    def run_updates(self, runtime, updates):
+        """Process updates and wait for all of them."""
+        async def process():
+            for update in updates:
+                await runtime.submit(update)
+            await runtime.drain()
+        asyncio.run(process())
+
+    def test_per_user_order(self):
+        """Test slow update delays only later updates of the same user."""
+        self.dispatcher.add_handler(MessageHandler(Filters.text, self.record))
+        runtime = AsyncRuntime(self.dispatcher, concurrency=4)
+        self.run_updates(runtime, [make_update(1, 1, '30'), make_update(2, 1, '1'), make_update(3, 2, '1')])
+        self.assertEqual(self.handled, [(2, '1'), (1, '30'), (1, '1')])
+        self.assertEqual(self.dispatcher.user_data[1]['seen'], ['30', '1'])
+
+    def test_concurrency(self):
+        """Test updates of different users are processed at the same time."""
+        self.dispatcher.add_handler(MessageHandler(Filters.text, self.record))
+        runtime = AsyncRuntime(self.dispatcher, concurrency=8)
+        start = time.perf_counter()
+        self.run_updates(runtime, [make_update(i, i, '20') for i in range(8)])
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(len(self.handled), 8)
+
+    def test_back_pressure(self):
+        """Test no more than ``concurrency`` updates are scheduled at a time."""
+        self.dispatcher.add_handler(MessageHandler(Filters.text, self.record))
+        runtime = AsyncRuntime(self.dispatcher, concurrency=2)
+        handled = []
+
+        async def process():
+            for i in range(4):
+                await runtime.submit(make_update(i, i, '10'))
+                handled.append(len(self.handled))
+            await runtime.drain()
+        asyncio.run(process())
+        self.assertEqual(handled[:2], [0, 0])
+        self.assertGreaterEqual(handled[3], 2)
+        self.assertEqual(len(self.handled), 4)
+
+    def test_coroutine_handler(self):
+        """Test coroutine handlers are awaited in the loop."""
+        async def handler(update, context):
+            await asyncio.sleep(0)
+            self.handled.append(update.message.text)
+        self.dispatcher.add_handler(MessageHandler(Filters.text, handler))
+        self.run_updates(AsyncRuntime(self.dispatcher), [make_update(1, 1, 'hi')])
+        self.assertEqual(self.handled, ['hi'])
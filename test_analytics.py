@@ -0,0 +1,94 @@
+"""Testing module"""
+
+import unittest
+import datetime
+import numpy as np
+from acc_bot import analytics
+from acc_bot.ledger import TICK, to_ticks
+from acc_bot.test_data import generate_ledgers
+from acc_bot.util import accumulate_by_span, gater_week
+
+
+def reference_accumulate(data: dict, span: datetime.timedelta, now: datetime.datetime) -> list:
+    """Original pure Python span bucketing."""
+    res = []
+    date_initial = now
+    for item in reversed(sorted(data.items(), key=lambda x: x[0])):
+        while date_initial > item[0]:
+            res.append(0)
+            date_initial -= span
+        res[-1] += item[1][1]
+    return res[::-1]
+
+
+def reference_prediction(res: list) -> int:
+    """Original normal equations trend fit."""
+    x_data = np.c_[np.ones(len(res), dtype=np.float32), np.arange(len(res))]
+    y_data = np.c_[np.array(res)]
+    w_matr = np.linalg.inv(x_data.T@x_data)@x_data.T@y_data
+    return int((np.array([1, len(res)])@w_matr)[0])
+
+
+class AnalyticsTest(unittest.TestCase):
+    """Main class for analytics testing."""
+
+    def setUp(self):
+        """Generate a few months of spendings."""
+        self.now = datetime.datetime.now()
+        self.ledger = generate_ledgers(entries=5000, span=datetime.timedelta(weeks=20), seed=3,
+                                       end=self.now - datetime.timedelta(days=2))[0]
+
+    def test_span_totals(self):
+        """Test vectorized span totals match the original loop."""
+        data = dict(self.ledger.items())
+        stamps, _, amounts = analytics.columns(self.ledger)
+        for days in (1, 7, 30):
+            span = datetime.timedelta(days=days)
+            self.assertEqual(analytics.span_totals(stamps, amounts, to_ticks(self.now), span // TICK),
+                             reference_accumulate(data, span, self.now))
+
+    def test_util_matches_reference(self):
+        """Test util functions backed by the ledger indexes match the original loops."""
+        data = dict(self.ledger.items())
+        span = datetime.timedelta(days=7)
+        expected = reference_accumulate(data, span, datetime.datetime.now())
+        self.assertEqual(accumulate_by_span(self.ledger, span), expected)
+        week_start = datetime.datetime.now() - span
+        expected = {}
+        for moment, (category, amount) in data.items():
+            if moment >= week_start:
+                expected[category] = expected.get(category, 0) + amount
+        self.assertEqual(gater_week(self.ledger), expected)
+
+    def test_category_stats(self):
+        """Test category sums and counts."""
+        codes = np.array([0, 2, 2, 5], dtype=np.uint8)
+        amounts = np.array([1, 2, 3, 0], dtype=np.int64)
+        self.assertEqual(analytics.category_stats(codes, amounts), {0: (1, 1), 2: (5, 2), 5: (0, 1)})
+
+    def test_bucket_sums(self):
+        """Test bucket sums add up to category totals."""
+        stamps, codes, amounts = analytics.columns(self.ledger)
+        buckets = analytics.bucket_sums(stamps, codes, amounts, datetime.timedelta(days=1) // TICK)
+        totals = {}
+        for bucket in buckets.values():
+            for code, val in bucket.items():
+                totals[code] = totals.get(code, 0) + val
+        self.assertEqual(totals, {code: total for code, (total, _) in analytics.category_stats(codes, amounts).items()})
+
+    def test_grouped_totals(self):
+        """Test amounts are summed exactly into the cells present, sorted by group and code."""
+        groups = np.array([2, 0, 2, 0, 5], dtype=np.int64)
+        codes = np.array([0, 1, 0, 1, 3], dtype=np.uint8)
+        amounts = np.array([7, 5, 3, 2 ** 60 + 1, 1], dtype=np.int64)
+        cells = analytics.grouped_totals(groups, codes, amounts)
+        self.assertEqual([column.tolist() for column in cells], [[0, 2, 5], [1, 0, 3], [2 ** 60 + 6, 10, 1]])
+        empty = np.array([], dtype=np.int64)
+        self.assertEqual([len(column) for column in analytics.grouped_totals(empty, empty, empty)], [0, 0, 0])
+
+    def test_trend_prediction(self):
+        """Test least squares fit agrees with normal equations."""
+        rng = np.random.default_rng(1)
+        for size in range(2, 60):
+            series = rng.integers(0, 200000, size).tolist()
+            self.assertAlmostEqual(analytics.trend_prediction(series), reference_prediction(series), delta=1)
@@ -0,0 +1,171 @@
+"""Testing module"""
+
+import os
+import tempfile
+import unittest
+import datetime
+from types import SimpleNamespace
+from telegram.error import RetryAfter, Unauthorized
+from acc_bot.digest import Digests, Outbox, collect
+from acc_bot.i18n import DEFAULT_LOCALE
+from acc_bot.loadtest import digest_run
+from acc_bot.ledger import CATEGORY_TABLE, to_ticks
+from acc_bot.session import UserSession
+from acc_bot.storage import Storage, UserStore, WriteBehind
+
+NOW = datetime.datetime(2022, 5, 18, 12)
+DAY = datetime.timedelta(days=1)
+
+
+def cells(batch, found):
+    """Return the cells as a dict by user ID and category."""
+    return {(batch.user_ids[row], CATEGORY_TABLE.names[code]): amount
+            for row, code, amount in zip(found.rows.tolist(), found.codes.tolist(), found.amounts.tolist())}
+
+
+class FakeBot:
+    """Bot recording sent messages, failing as told first."""
+
+    def __init__(self, errors=()):
+        """Create bot raising the errors on the first sends."""
+        self.errors = list(errors)
+        self.sent = []
+
+    def send_message(self, chat_id, text):
+        """Record the message or raise the next error."""
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+
+
+class DigestTest(unittest.TestCase):
+    """Main class for digests and alerts testing."""
+
+    def setUp(self):
+        """Create store backed by a database in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = Storage(os.path.join(self.tmp.name, 'test.db'))
+        self.users = UserStore(self.storage, writer=WriteBehind(self.storage))
+        self.sent = []
+        self.outbox = SimpleNamespace(put=lambda *message: self.sent.append(message))
+        self.user_data = {}
+        self.digests = Digests(SimpleNamespace(user_data=self.user_data), self.users, self.outbox)
+
+    def tearDown(self):
+        """Remove temporary database."""
+        self.users.close()
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_collect(self):
+        """Test users in memory and only in the database are summed alike."""
+        self.users.add_spending(1, NOW - DAY, 'transport', 10)
+        self.users.add_spending(1, NOW - 2 * DAY, 'transport', 5)
+        self.users.add_spending(2, NOW - DAY, 'pharmacy', 7)
+        self.users.add_spending(2, NOW - 9 * DAY, 'pharmacy', 100)
+        self.users.set_limit(2, 'pharmacy', 50)
+        self.users.writer.flush()
+        self.users.evict_idle()
+        self.users.idle = 0
+        self.assertEqual(self.users.evict_idle(), 2)
+        self.users.add_spending(3, NOW - DAY, 'transport', 1)
+        batch = collect(self.users, [(to_ticks(NOW - 7 * DAY), to_ticks(NOW)),
+                                     (to_ticks(NOW - 14 * DAY), to_ticks(NOW))])
+        self.assertEqual(batch.user_ids.tolist(), [1, 2, 3])
+        self.assertEqual([cells(batch, totals) for totals in batch.totals], [
+            {(1, 'transport'): 15, (2, 'pharmacy'): 7, (3, 'transport'): 1},
+            {(1, 'transport'): 15, (2, 'pharmacy'): 107, (3, 'transport'): 1},
+        ])
+        self.assertEqual(cells(batch, batch.limits), {(2, 'pharmacy'): 50})
+        self.assertEqual(collect(self.users, [(0, to_ticks(NOW))], shard=1, shards=2).user_ids.tolist(), [1, 3])
+        self.assertEqual(collect(self.users, [(0, to_ticks(NOW))], limited=True).user_ids.tolist(), [2])
+
+    def test_collect_pins_users(self):
+        """Test users are not evicted while they are collected."""
+        self.users.add_spending(1, NOW - DAY, 'transport', 10)
+        self.users.idle = 0
+        with self.users.pinned():
+            self.assertEqual(self.users.evict_idle(), 0)
+        self.assertEqual(self.users.evict_idle(), 1)
+
+    def test_alerts(self):
+        """Test alerts are sent once per level and again after spendings fall below the share."""
+        self.users.set_limit(1, 'transport', 100)
+        self.users.add_spending(1, NOW - DAY, 'transport', 50)
+        self.assertEqual(self.digests.send_alerts(NOW), 0)
+        self.users.add_spending(1, NOW - DAY, 'transport', 30)
+        self.assertEqual(self.digests.send_alerts(NOW), 1)
+        self.assertEqual(self.digests.send_alerts(NOW), 0)
+        self.users.add_spending(1, NOW - DAY, 'transport', 30)
+        self.assertEqual(self.digests.send_alerts(NOW), 1)
+        self.assertEqual(self.digests.send_alerts(NOW + 7 * DAY), 0)
+        self.assertEqual(self.digests.send_alerts(NOW), 1)
+        self.assertEqual([user_id for user_id, _ in self.sent], [1, 1, 1])
+        self.assertIn('80', self.sent[0][1])
+        self.assertIn('110', self.sent[1][1])
+
+    def test_alerts_after_restart(self):
+        """Test levels reached before a restart are not alerted again."""
+        self.users.set_limit(1, 'transport', 100)
+        self.users.set_limit(2, 'other', 10)
+        self.users.add_spending(1, NOW - DAY, 'transport', 90)
+        self.users.add_spending(2, NOW - DAY, 'other', 20)
+        self.assertEqual(self.digests.send_alerts(NOW), 2)
+        self.assertEqual(self.storage.alert_levels(), [(1, 'transport', 1), (2, 'other', 2)])
+        restarted = Digests(SimpleNamespace(user_data={}), self.users, self.outbox)
+        self.assertEqual(restarted.send_alerts(NOW), 0)
+        shard = Digests(SimpleNamespace(user_data={}), self.users, self.outbox, shard=1, shards=3)
+        self.assertEqual(shard.send_alerts(NOW + 7 * DAY), 0)
+        self.assertEqual(self.storage.alert_levels(), [(2, 'other', 2)])
+        self.assertEqual(restarted.send_alerts(NOW), 1)
+
+    def test_digests(self):
+        """Test digests cover the last calendar week in the language of the user."""
+        self.users.add_spending(1, datetime.datetime(2022, 5, 9), 'transport', 10)
+        self.users.add_spending(1, datetime.datetime(2022, 5, 15, 23), 'other', 20)
+        self.users.add_spending(1, datetime.datetime(2022, 5, 2), 'other', 5)
+        self.users.add_spending(1, datetime.datetime(2022, 5, 16), 'other', 1000)
+        self.users.add_spending(2, datetime.datetime(2022, 5, 3), 'other', 5)
+        self.user_data[1] = {'session': UserSession('ru')}
+        self.assertEqual(self.digests.send_digests(NOW), 1)
+        user_id, text = self.sent[0]
+        self.assertEqual(user_id, 1)
+        self.assertLess(text.index('20'), text.index('10'))
+        self.assertIn('30', text)
+        self.assertIn(': 5)', text)
+        self.assertEqual(self.digests.catalog(1).code, 'ru')
+        self.assertEqual(self.digests.catalog(2).code, DEFAULT_LOCALE)
+
+    def test_bench(self):
+        """Test the benchmark checks every limit and digests every user who spent last week."""
+        stats = digest_run(users=50, entries=200, weeks=4)
+        self.assertGreater(stats['alerts'], 0)
+        self.assertLessEqual(stats['alerts'], 100)
+        self.assertEqual(stats['digests'], 50)
+
+
+class OutboxTest(unittest.TestCase):
+    """Main class for paced sending testing."""
+
+    def test_send(self):
+        """Test messages are sent in order, retried when asked to and dropped on errors."""
+        bot = FakeBot([RetryAfter(0.01), Unauthorized('blocked')])
+        outbox = Outbox(bot, rate=1000)
+        for chat_id in range(3):
+            outbox.put(chat_id, 'hi')
+        self.assertTrue(outbox.drain(5))
+        self.assertEqual(bot.sent, [(1, 'hi'), (2, 'hi')])
+        self.assertEqual((outbox.sent, outbox.failed), (2, 1))
+        self.assertEqual(outbox.close(), 0)
+
+    def test_rate(self):
+        """Test the send rate is kept."""
+        bot = FakeBot()
+        outbox = Outbox(bot, rate=50)
+        for chat_id in range(6):
+            outbox.put(chat_id, 'hi')
+        self.assertFalse(outbox.drain(0.05))
+        self.assertTrue(outbox.drain(5))
+        self.assertEqual(len(bot.sent), 6)
+        outbox.put(0, 'late')
+        outbox.close()
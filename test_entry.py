@@ -0,0 +1,83 @@
+"""Testing module"""
+
+import time
+import unittest
+from acc_bot import bot
+from acc_bot.entry import EntryParser, is_batch
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.session import State, get_session
+from acc_bot.test_data import CATEGORIES_FLAT
+
+
+class EntryTest(unittest.TestCase):
+    """Main class for one-shot entry testing."""
+
+    def setUp(self):
+        """Create parser of test categories."""
+        self.parser = EntryParser(CATEGORIES_FLAT)
+
+    def test_both_orders(self):
+        """Test amount may go before or after the category."""
+        self.assertEqual(self.parser.parse_line('120 restaurants'), ('restaurants', 120))
+        self.assertEqual(self.parser.parse_line(' Transport   45 '), ('transport', 45))
+
+    def test_huge_amount(self):
+        """Test amounts above the limit are not understood, in the scenario too."""
+        self.assertIsNone(self.parser.parse_line('100000000000000000000 transport'))
+        context = FakeContext({})
+        bot.add(make_update(1, '/add'), context)
+        bot.category_chooser(make_update(1, 'transport'), context)
+        update = make_update(1, '100000000000000000000')
+        bot.category_upd(update, context)
+        self.assertEqual(update.message.replies, ['Wrong input'])
+        update = make_update(1, '100000000000000000000 transport')
+        bot.quick_add(update, context)
+        self.assertEqual(update.message.replies, ['The amount is too large, at most 1000000000000 is allowed'])
+        self.assertIs(get_session(context.user_data).state, State.FREE)
+        self.assertEqual(len(bot.get_user(update, context)['data']), 0)
+
+    def test_prefixes(self):
+        """Test unambiguous prefixes resolve and ambiguous ones do not."""
+        self.assertEqual(self.parser.category('rest'), 'restaurants')
+        self.assertEqual(self.parser.category('ph'), 'pharmacy')
+        self.assertIsNone(self.parser.category('casino'))
+        parser = EntryParser(['taxi', 'transport', 'tram'])
+        self.assertIsNone(parser.category('t'))
+        self.assertIsNone(parser.category('tra'))
+        self.assertEqual(parser.category('tram'), 'tram')
+        self.assertEqual(parser.category('Ta'), 'taxi')
+
+    def test_batch(self):
+        """Test several lines are parsed and unknown lines are reported."""
+        text = '120 rest\n\n45 transport\nphar 7\n10 casino'
+        self.assertTrue(is_batch(text))
+        entries, rejected = self.parser.parse(text)
+        self.assertEqual(entries, [('restaurants', 120), ('transport', 45), ('pharmacy', 7)])
+        self.assertEqual(rejected, ['10 casino'])
+
+    def test_batch_pattern(self):
+        """Test plain numbers, categories and chatter are left to the other handlers."""
+        for text in ('120', 'pharmacy', 'hello there', '/add 5 other'):
+            self.assertFalse(is_batch(text), text)
+
+    def test_crafted_lines(self):
+        """Test long runs of spaces do not make matching quadratic."""
+        start = time.perf_counter()
+        for text in ('1 a' + ' ' * 4000 + 'x', 'a 1' + ' ' * 4000 + 'x', 'a' + ' \t' * 2000 + '1\nq'):
+            is_batch(text)
+            self.parser.parse(text)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+    def test_handlers(self):
+        """Test one message spendings through the handlers."""
+        context = FakeContext({})
+        update = make_update(1, '120 restaurants\n30 tr')
+        bot.quick_add(update, context)
+        self.assertTrue(update.message.replies[0].startswith('Added 2 spendings'))
+        update = make_update(1, '/add other 5')
+        bot.add(update, context)
+        self.assertEqual(bot.get_user(update, context)['data'].totals(),
+                         {'restaurants': 120, 'transport': 30, 'other': 5})
+        update = make_update(1, '/add')
+        bot.add(update, context)
+        self.assertIs(get_session(context.user_data).state, State.CHOOSE_SPENDING)
@@ -0,0 +1,107 @@
+"""Testing module"""
+
+import io
+import unittest
+import datetime
+from types import SimpleNamespace
+from acc_bot import bot
+from acc_bot.exchange import SpendingReader, format_of, write_spendings
+from acc_bot.ledger import Ledger, to_ticks
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.storage import UserStore
+from acc_bot.test_data import CATEGORIES_FLAT, load_test_data_2
+
+
+class ExchangeTest(unittest.TestCase):
+    """Main class for import/export testing."""
+
+    def test_format_of(self):
+        """Test format is guessed from the extension."""
+        self.assertEqual(format_of('bank.CSV'), 'csv')
+        self.assertEqual(format_of('bank.jsonl'), 'jsonl')
+        self.assertIsNone(format_of('bank.xls'))
+        self.assertIsNone(format_of(None))
+
+    def test_reader_chunks(self):
+        """Test rows are validated and yielded in bounded chunks."""
+        text = 'time,category,amount\n' + ''.join(f'2022-05-{day:02},pharmacy,{day}\n' for day in range(1, 26))
+        text += '2022-05-26,casino,10\nyesterday,pharmacy,1\n2022-05-27,pharmacy,-5\n'
+        reader = SpendingReader(io.StringIO(text), 'csv', CATEGORIES_FLAT, chunk=10)
+        chunks = list(reader.chunks())
+        self.assertEqual([len(chunk) for chunk in chunks], [10, 10, 5])
+        self.assertEqual(chunks[0][0], (to_ticks(datetime.datetime(2022, 5, 1)), 'pharmacy', 1))
+        self.assertEqual(reader.skipped, 3)
+        self.assertTrue(reader.errors[0].startswith('27: '))
+
+    def test_reader_edge_values(self):
+        """Test aware times are converted to local time and huge amounts are skipped."""
+        text = '2022-05-01T10:00+03:00,pharmacy,1\n2022-05-02T10:00,pharmacy,100000000000000000000\n'
+        reader = SpendingReader(io.StringIO(text), 'csv', CATEGORIES_FLAT)
+        moment = datetime.datetime(2022, 5, 1, 7, tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None)
+        self.assertEqual(list(reader.chunks()), [[(to_ticks(moment), 'pharmacy', 1)]])
+        self.assertEqual(reader.skipped, 1)
+
+    def test_roundtrip(self):
+        """Test exported history is imported back unchanged in both formats."""
+        ledger = Ledger.from_dict(load_test_data_2())
+        for fmt in ('csv', 'jsonl'):
+            buffer = io.BytesIO()
+            write_spendings(buffer, ledger, fmt, chunk=64)
+            buffer.seek(0)
+            reader = SpendingReader(io.TextIOWrapper(buffer, encoding='utf-8'), fmt, CATEGORIES_FLAT)
+            imported = Ledger()
+            for rows in reader.chunks():
+                imported.extend(rows)
+            self.assertEqual(reader.skipped, 0)
+            self.assertEqual(list(imported.items()), list(ledger.items()))
+
+    def test_extend_keeps_indexes(self):
+        """Test batch merge keeps order and indexes consistent."""
+        ledger = Ledger.from_dict(load_test_data_2())
+        now = datetime.datetime.now()
+        ledger.buckets()
+        ledger.trailing(datetime.timedelta(days=7)).sums(now)
+        base = to_ticks(now)
+        ledger.extend([(base - 10, 'other', 5), (base - 20, 'pharmacy', 7)])
+        ledger.extend([(base - 10 ** 12, 'other', 3), (base - 10 ** 10, 'transport', 1)])
+        size = len(ledger)
+        with self.assertRaises(OverflowError):
+            ledger.extend([(base, 'other', 1), (base + 1, 'other', 2 ** 63)])
+        self.assertEqual((len(ledger.ts), len(ledger.codes), len(ledger.amounts)), (size, size, size))
+        self.assertEqual(list(ledger.ts), sorted(ledger.ts))
+        expected = Ledger.from_rows(sorted(ledger.rows()))
+        week_ago = now - datetime.timedelta(days=7)
+        self.assertEqual(ledger.trailing(datetime.timedelta(days=7)).sums(now), expected.totals(week_ago))
+        self.assertEqual(ledger.buckets().totals(base - 10 ** 13, base),
+                         expected.buckets().totals(base - 10 ** 13, base))
+
+    def test_handlers(self):
+        """Test document import and export handlers."""
+        content = b'time,category,amount\n2022-05-01T10:00,pharmacy,10\n2022-05-02T10:00,transport,20\n'
+        file = SimpleNamespace(download=lambda out: out.write(content))
+        context = FakeContext({})
+        context.bot = SimpleNamespace(get_file=lambda file_id: file)
+        update = make_update(1, '')
+        update.message.document = SimpleNamespace(file_name='bank.csv', file_id='1')
+        bot.import_document(update, context)
+        self.assertEqual(update.message.replies, ['Imported 2 spendings'])
+        update = make_update(1, '/export csv')
+        context.args = ['csv']
+        bot.export(update, context)
+        self.assertEqual(update.message.replies[0], content.replace(b'T10:00,', b'T10:00:00,'))
+
+    def test_import_merged_once(self):
+        """Test a document of many chunks is merged into the history in one batch."""
+        moments = [datetime.datetime(2022, 5, 1) - datetime.timedelta(minutes=minute) for minute in range(25000)]
+        content = ''.join(f'{moment.isoformat()},transport,1\n' for moment in moments).encode()
+        file = SimpleNamespace(download=lambda out: out.write(content))
+        users = UserStore()
+        batches = []
+        users.extend = lambda user_id, rows: batches.append(len(rows))
+        context = FakeContext({'users': users})
+        context.bot = SimpleNamespace(get_file=lambda file_id: file)
+        update = make_update(1, '')
+        update.message.document = SimpleNamespace(file_name='bank.csv', file_id='1')
+        bot.import_document(update, context)
+        self.assertEqual(update.message.replies, ['Imported 25000 spendings'])
+        self.assertEqual(batches, [25000])
@@ -0,0 +1,63 @@
+"""Testing module"""
+
+import unittest
+import datetime
+import numpy as np
+from acc_bot.forecast import CategoryModel, Forecaster
+from acc_bot.ledger import TICK, WEEK, Ledger, from_ticks
+
+
+def week_start(number: int) -> datetime.datetime:
+    """Return start of the epoch aligned week."""
+    return from_ticks(number * (WEEK // TICK))
+
+
+class ForecastTest(unittest.TestCase):
+    """Main class for forecast testing."""
+
+    def test_trend_matches_lstsq(self):
+        """Test running trend agrees with a least squares fit."""
+        series = [120, 80, 150, 170, 160, 210, 190]
+        model = CategoryModel()
+        for val in series:
+            model.update(val)
+        x_data = np.c_[np.ones(len(series)), np.arange(len(series))]
+        weights = np.linalg.lstsq(x_data, np.array(series, dtype=float), rcond=None)[0]
+        self.assertEqual(model.trend().value, round(weights[0] + weights[1] * len(series)))
+        self.assertLess(model.trend().low, model.trend().value)
+
+    def test_average_and_smoothing(self):
+        """Test moving average uses the last weeks and smoothing follows the level."""
+        model = CategoryModel(window=2, alpha=0.5)
+        for val in (100, 200, 300):
+            model.update(val)
+        self.assertEqual(model.moving_average().value, 250)
+        self.assertEqual(model.smoothing().value, 225)
+
+    def test_incremental(self):
+        """Test models are updated without refit when weeks close and refitted on backdated spendings."""
+        ledger = Ledger()
+        for week in range(100, 106):
+            ledger.add(week_start(week) + datetime.timedelta(days=1), 'transport', 10 * week)
+        ledger.add(week_start(102), 'pharmacy', 5)
+        forecaster = Forecaster(ledger)
+        first = forecaster.forecasts(week_start(104))
+        self.assertEqual(set(first), {'transport', 'pharmacy'})
+        self.assertEqual(forecaster.models[ledger.code('pharmacy')].count, 4)
+        ledger.add(week_start(105), 'other', 1)
+        forecaster.forecasts(week_start(104) + datetime.timedelta(days=3))
+        forecaster.forecasts(week_start(106))
+        self.assertEqual(forecaster.refits, 1)
+        self.assertEqual(forecaster.models[ledger.code('other')].count, 6)
+        fresh = Forecaster(ledger).forecasts(week_start(106))
+        self.assertEqual(forecaster.forecasts(week_start(106)), fresh)
+        ledger.add(week_start(101), 'other', 7)
+        forecaster.forecasts(week_start(106))
+        self.assertEqual(forecaster.refits, 2)
+
+    def test_empty(self):
+        """Test no forecasts without closed weeks."""
+        ledger = Ledger()
+        self.assertEqual(Forecaster(ledger).forecasts(datetime.datetime.now()), {})
+        ledger.add(datetime.datetime.now(), 'other', 1)
+        self.assertEqual(Forecaster(ledger).forecasts(datetime.datetime.now()), {})
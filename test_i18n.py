@@ -0,0 +1,74 @@
+"""Testing module"""
+
+import gettext
+import unittest
+from acc_bot import bot, i18n
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.session import get_session
+
+
+class FakeTranslations(gettext.NullTranslations):
+    """Translations from a dictionary."""
+
+    def __init__(self, messages: dict):
+        """Remember translated messages."""
+        super().__init__()
+        self.messages = messages
+
+    def gettext(self, message: str) -> str:
+        """Translate the message if it is known."""
+        return self.messages.get(message, message)
+
+
+class I18nTest(unittest.TestCase):
+    """Main class for locale catalogs testing."""
+
+    def test_choose_locale(self):
+        """Test language codes are reduced to supported locales."""
+        self.assertEqual(i18n.choose_locale('ru-RU'), 'ru')
+        self.assertEqual(i18n.choose_locale('EN'), 'en')
+        self.assertEqual(i18n.choose_locale('de'), i18n.DEFAULT_LOCALE)
+        self.assertEqual(i18n.choose_locale(None), i18n.DEFAULT_LOCALE)
+
+    def test_default_locale(self):
+        """Test the default locale follows the bot setting, then the system locale variables."""
+        self.assertEqual(i18n.default_locale({}), 'en')
+        self.assertEqual(i18n.default_locale({'LC_ALL': 'ru'}), 'ru')
+        self.assertEqual(i18n.default_locale({'LANG': 'ru_RU.UTF-8'}), 'ru')
+        self.assertEqual(i18n.default_locale({'LC_ALL': 'C', 'LANG': 'ru_RU.UTF-8'}), 'en')
+        self.assertEqual(i18n.default_locale({'ACC_BOT_LANG': 'en', 'LC_ALL': 'ru'}), 'en')
+
+    def test_cached(self):
+        """Test catalogs and their keyboards are built once per locale."""
+        catalog = i18n.get_catalog('ru')
+        self.assertIs(i18n.get_catalog('ru_RU'), catalog)
+        self.assertIs(i18n.get_catalog('ru').keyboard, catalog.keyboard)
+        self.assertIs(catalog.join(*bot.HELP), catalog.join(*bot.HELP))
+
+    def test_translated_names(self):
+        """Test translated names are shown and resolved back to canonical keys."""
+        catalog = i18n.Catalog('ru', FakeTranslations({'pharmacy': 'аптека', 'other': 'другое'}))
+        self.assertEqual(catalog.name('pharmacy'), 'аптека')
+        self.assertEqual(catalog.category('аптека'), 'pharmacy')
+        self.assertEqual(catalog.category('pharmacy'), 'pharmacy')
+        self.assertIsNone(catalog.category('casino'))
+        self.assertTrue(catalog.category_pattern.match('другое'))
+        self.assertEqual(catalog.parser.parse('120 апт\nдруг 5\nph 1'),
+                         ([('pharmacy', 120), ('other', 5), ('pharmacy', 1)], []))
+        self.assertEqual(catalog.keyboard.keyboard[1][1].text, 'аптека')
+
+    def test_lang(self):
+        """Test users choose the language and it is kept between commands."""
+        context = FakeContext({})
+        update = make_update(1, '/lang')
+        update.effective_user.language_code = 'ru-RU'
+        bot.lang(update, context)
+        self.assertEqual(get_session(context.user_data).lang, 'ru')
+        context.args = ['EN']
+        bot.lang(update, context)
+        self.assertEqual(get_session(context.user_data).lang, 'en')
+        context.args = ['xx']
+        bot.lang(update, context)
+        self.assertEqual(get_session(context.user_data).lang, 'en')
+        bot.bot_help(update, context)
+        self.assertIn('/lang', update.message.replies[-1])
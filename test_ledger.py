@@ -0,0 +1,104 @@
+"""Testing module"""
+
+import unittest
+import datetime
+from acc_bot.test_data import load_test_data_2
+from acc_bot.ledger import Ledger, from_ticks, to_ticks
+
+
+class LedgerTest(unittest.TestCase):
+    """Main class for ledger testing."""
+
+    def test_ticks_roundtrip(self):
+        """Test datetime survives conversion to ticks and back."""
+        moment = datetime.datetime(2022, 5, 10, 14, 39, 34, 123456)
+        self.assertEqual(from_ticks(to_ticks(moment)), moment)
+
+    def test_add_keeps_order(self):
+        """Test out of order spendings are inserted in time order."""
+        ledger = Ledger()
+        base = datetime.datetime(2022, 5, 1)
+        ledger.add(base + datetime.timedelta(days=2), 'transport', 2)
+        ledger.add(base, 'pharmacy', 1)
+        ledger.add(base + datetime.timedelta(days=1), 'transport', 3)
+        self.assertEqual(list(ledger.amounts), [1, 3, 2])
+        self.assertEqual(list(ledger.ts), sorted(ledger.ts))
+        self.assertEqual([ledger.categories[code] for code in ledger.codes], ['pharmacy', 'transport', 'transport'])
+
+    def test_add_overflow(self):
+        """Test an amount out of the 64-bit range is rejected without touching the columns."""
+        ledger = Ledger()
+        ledger.add(datetime.datetime(2022, 5, 1), 'transport', 2)
+        with self.assertRaises(OverflowError):
+            ledger.add(datetime.datetime(2022, 5, 2), 'transport', 2 ** 63)
+        self.assertEqual((len(ledger.ts), len(ledger.codes), len(ledger.amounts)), (1, 1, 1))
+        self.assertEqual(ledger.total(), 2)
+
+    def test_totals_range(self):
+        """Test category totals within a time range."""
+        ledger = Ledger()
+        base = datetime.datetime(2022, 5, 1)
+        for day in range(10):
+            ledger.add(base + datetime.timedelta(days=day), 'other' if day % 2 else 'transport', day)
+        start, end = base + datetime.timedelta(days=3), base + datetime.timedelta(days=6)
+        self.assertEqual(ledger.totals(start, end), {'other': 8, 'transport': 4})
+        self.assertEqual(ledger.total(start, end), 12)
+
+    def test_from_dict(self):
+        """Test ledger built from legacy dict keeps every spending."""
+        data = load_test_data_2()
+        self.assertEqual(list(Ledger.from_dict(data).items()), sorted(data.items()))
+
+    def test_trailing_window(self):
+        """Test trailing window follows appends and evicts expired spendings."""
+        ledger = Ledger()
+        base = datetime.datetime(2022, 5, 1)
+        window = ledger.trailing(datetime.timedelta(days=7))
+        for day in range(10):
+            ledger.add(base + datetime.timedelta(days=day), 'other' if day % 2 else 'transport', day)
+        self.assertEqual(window.sums(base + datetime.timedelta(days=10)), {'other': 24, 'transport': 18})
+        self.assertEqual(window.sums(base + datetime.timedelta(days=16)), {'other': 9})
+        ledger.add(base + datetime.timedelta(days=15), 'pharmacy', 5)
+        ledger.add(base + datetime.timedelta(days=1), 'pharmacy', 7)
+        self.assertEqual(window.sums(base + datetime.timedelta(days=16)), {'other': 9, 'pharmacy': 5})
+        self.assertEqual(window.sums(base + datetime.timedelta(days=8)),
+                         ledger.totals(base + datetime.timedelta(days=1)))
+
+    def test_trailing_shared(self):
+        """Test windows of the same span are shared."""
+        ledger = Ledger()
+        self.assertIs(ledger.trailing(datetime.timedelta(days=7)), ledger.trailing(datetime.timedelta(weeks=1)))
+
+    def test_buckets_match_slices(self):
+        """Test rollup range totals agree with raw ledger totals."""
+        ledger = Ledger.from_dict(load_test_data_2())
+        index = ledger.buckets()
+        ledger.add(datetime.datetime.now() - datetime.timedelta(days=20), 'pharmacy', 77)
+        first, last = ledger.ts[0], ledger.ts[-1]
+        step = (last - first) // 13
+        for low in range(first - step, last, step):
+            for high in range(low, last + 2 * step, 3 * step):
+                expected = ledger.slice_totals(*ledger.bounds(from_ticks(low), from_ticks(high)))
+                self.assertEqual(index.totals(low, high), expected)
+
+    def test_prefixes_match_slices(self):
+        """Test running sum range totals agree with raw ledger slices after appends and insertions."""
+        ledger = Ledger.from_dict(load_test_data_2())
+        index = ledger.prefixes()
+        now = datetime.datetime.now()
+        ledger.add(now + datetime.timedelta(hours=1), 'pharmacy', 77)
+        ledger.extend((to_ticks(now) + hour * 3600 * 10 ** 6, 'other', hour) for hour in range(2, 400))
+        self.assertIs(ledger.prefixes(), index)
+        ledger.add(now - datetime.timedelta(days=20), 'transport', 5)
+        self.assertIsNot(ledger.prefixes(), index)
+        first, last = ledger.ts[0], ledger.ts[-1]
+        step = (last - first) // 13
+        for low in range(first - step, last, step):
+            for high in range(low, last + 2 * step, 3 * step):
+                start, end = from_ticks(low), from_ticks(high)
+                expected = ledger.slice_totals(*ledger.bounds(start, end))
+                self.assertEqual(ledger.prefixes().totals(low, high), expected)
+                self.assertEqual(ledger.total(start, end), sum(expected.values()))
+                self.assertEqual(ledger.total(start, end, 'pharmacy'), expected.get(ledger.code('pharmacy'), 0))
+        self.assertEqual(ledger.total(), sum(ledger.amounts))
+        self.assertEqual(ledger.total(category='unknown category'), 0)
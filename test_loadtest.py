@@ -0,0 +1,31 @@
+"""Testing module"""
+
+import unittest
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.loadtest import run, transport_run
+from acc_bot import bot
+
+
+class LoadTestTest(unittest.TestCase):
+    """Main class for load test harness testing."""
+
+    def test_fake_update(self):
+        """Test handlers reply through fake updates."""
+        update = make_update(1, '/help')
+        bot.bot_help(update, FakeContext({}))
+        self.assertEqual(len(update.message.replies), 1)
+
+    def test_report(self):
+        """Test report covers every command sent."""
+        report = run(users=5, commands=4, weights={'add': 1, 'week': 1, 'weeks': 1})
+        self.assertEqual(report['total']['count'], 20)
+        self.assertEqual(sum(report[name]['count'] for name in report if name != 'total'), 20)
+        for name in report.keys() - {'total'}:
+            self.assertLessEqual(report[name]['p50'], report[name]['p99'])
+
+    def test_transport(self):
+        """Test quick entries are answered through polling and the webhook."""
+        for transport in ('polling', 'webhook'):
+            stats = transport_run(transport, users=3, messages=2, workers=2)
+            self.assertEqual(stats['count'], 6)
+            self.assertLessEqual(stats['p50'], stats['p99'])
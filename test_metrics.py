@@ -0,0 +1,96 @@
+"""Testing module"""
+
+import json
+import unittest
+import urllib.request
+from telegram.ext import Dispatcher
+from acc_bot import bot, metrics
+from acc_bot.fakes import FakeContext, RecordingBot, make_update, update_json
+from acc_bot.storage import UserStore
+from acc_bot.test_data import load_test_data_1
+from acc_bot.util import gater_week
+from acc_bot.webhook import WebhookServer
+
+
+class MetricsTest(unittest.TestCase):
+    """Main class for instrumentation testing."""
+
+    def test_histogram(self):
+        """Test bucket counts are rendered cumulatively."""
+        histogram = metrics.Histogram((1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.lines('x', 'a="b"')), [
+            'x_bucket{a="b",le="1"} 2', 'x_bucket{a="b",le="10"} 3', 'x_bucket{a="b",le="+Inf"} 4',
+            'x_sum{a="b"} 56.5', 'x_count{a="b"} 4'])
+
+    def test_instrument(self):
+        """Test handler latency, errors and user history sizes are recorded."""
+        registry = metrics.Registry(top_users=1)
+        context = FakeContext({'users': UserStore()})
+
+        def broken(_update, _context):
+            raise RuntimeError('boom')
+
+        handler = metrics.instrument(bot.quick_add, registry)
+        handler(make_update(1, '10 rest\n5 ph'), context)
+        for _ in range(3):
+            handler(make_update(2, '7 other'), context)
+        with self.assertRaises(RuntimeError):
+            metrics.instrument(broken, registry)(make_update(1, 'x'), context)
+        self.assertEqual(registry.handlers['quick_add'].count, 4)
+        self.assertEqual(registry.errors, {'broken': 1})
+        self.assertEqual(registry.sizes, {1: 2, 2: 3})
+        text = registry.render()
+        self.assertIn('acc_bot_handler_errors_total{handler="broken"} 1', text)
+        self.assertIn('acc_bot_busiest_user_updates_total{user="2"} 3', text)
+        self.assertIn('acc_bot_history_size_bucket{le="10"} 5', text)
+        self.assertIn('quick_add: 4 calls', registry.summary())
+
+    def test_tracked_users(self):
+        """Test per-user counts are pruned to the largest ones."""
+        registry = metrics.Registry(top_users=2, tracked=3)
+        for _ in range(5):
+            registry.observe_user(1, 100)
+        for user_id in range(2, 20):
+            registry.observe_user(user_id, user_id)
+        self.assertLessEqual(len(registry.updates), 6)
+        self.assertLessEqual(len(registry.sizes), 6)
+        self.assertEqual(registry.updates.most_common(1), [(1, 5)])
+        self.assertEqual(registry.history.count, 23)
+        text = registry.render()
+        self.assertIn('acc_bot_largest_history_size{user="1"} 100', text)
+        self.assertIn('acc_bot_largest_history_size{user="19"} 19', text)
+        self.assertNotIn('user="18"} 18', text)
+
+    def test_util_timed(self):
+        """Test util functions are timed into the default registry."""
+        before = metrics.REGISTRY.functions['gater_week'].count
+        gater_week(load_test_data_1())
+        self.assertEqual(metrics.REGISTRY.functions['gater_week'].count, before + 1)
+
+    def test_endpoints(self):
+        """Test metrics are served by the webhook and the standalone server."""
+        registry = metrics.Registry()
+        fake = RecordingBot()
+        dispatcher = Dispatcher(fake, None, workers=0, use_context=True)
+        dispatcher.bot_data['users'] = UserStore()
+        bot.register_handlers(dispatcher, registry)
+        server = WebhookServer(dispatcher, port=0, workers=1, registry=registry)
+        server.start()
+        try:
+            fake.sent(1)
+            request = urllib.request.Request(server.url, json.dumps(update_json(1, 1, '/lang')).encode())
+            urllib.request.urlopen(request).close()
+            server.drain()
+            with urllib.request.urlopen(server.url.replace('/webhook', '/metrics')) as response:
+                self.assertIn('acc_bot_handler_seconds_count{handler="lang"} 1', response.read().decode())
+        finally:
+            server.stop()
+        standalone = metrics.serve(port=0, registry=registry)
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{standalone.server_address[1]}/metrics') as response:
+                self.assertIn('handler="lang"', response.read().decode())
+        finally:
+            standalone.shutdown()
+            standalone.server_close()
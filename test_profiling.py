@@ -0,0 +1,85 @@
+"""Testing module"""
+
+import os
+import time
+import pstats
+import tempfile
+import unittest
+from unittest import mock
+from acc_bot import bot
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.profiling import PROFILER, Profiler
+from acc_bot.storage import UserStore
+
+
+def busy(_update, _context):
+    """Handler spinning for a while."""
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTest(unittest.TestCase):
+    """Main class for profiler testing."""
+
+    def setUp(self):
+        """Create profiler writing to a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.profiler = Profiler(self.tmp.name)
+        self.context = FakeContext({'users': UserStore()})
+
+    def tearDown(self):
+        """Remove written profiles."""
+        self.tmp.cleanup()
+
+    def test_disabled(self):
+        """Test nothing is profiled until enabled."""
+        self.profiler.wrap(busy)(make_update(1, 'x'), self.context)
+        self.assertFalse(os.listdir(self.tmp.name))
+        self.assertEqual(self.profiler.status(), 'Profiling is off')
+
+    def test_deterministic_user(self):
+        """Test all calls of the chosen user are written as labeled pstats files."""
+        self.profiler.enable(user_id=1)
+        bot.quick_add(make_update(1, '10 rest\n5 ph'), self.context)
+        handler = self.profiler.wrap(bot.week)
+        handler(make_update(1, '/week'), self.context)
+        handler(make_update(2, '/week'), self.context)
+        names = os.listdir(self.tmp.name)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('week-2-1-') and names[0].endswith('.prof'))
+        stats = pstats.Stats(os.path.join(self.tmp.name, names[0]))
+        self.assertTrue(any(func[2] == 'week' for func in stats.stats))
+
+    def test_sampling_fraction(self):
+        """Test sampled stacks are written in collapsed format for the fraction of calls."""
+        self.profiler.enable(1.0, mode='sampling')
+        self.profiler.wrap(busy)(make_update(3, 'x'), self.context)
+        self.profiler.enable(0.0, mode='sampling')
+        self.profiler.wrap(busy)(make_update(3, 'x'), self.context)
+        names = os.listdir(self.tmp.name)
+        self.assertEqual(len(names), 1)
+        self.assertTrue(names[0].startswith('busy-0-3-') and names[0].endswith('.folded'))
+        with open(os.path.join(self.tmp.name, names[0]), encoding='utf-8') as folded:
+            lines = folded.read().splitlines()
+        self.assertTrue(lines)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+        self.assertIn('busy (test_profiling.py', lines[0])
+
+    def test_admin_command(self):
+        """Test only admins switch profiling."""
+        update = make_update(7, '/profile')
+        context = FakeContext({})
+        with mock.patch.object(bot, 'ADMINS', frozenset({7})):
+            context.args = ['user', '42', 'sampling']
+            bot.profile(update, context)
+            self.assertEqual((PROFILER.user_id, PROFILER.mode), (42, 'sampling'))
+            context.args = ['2']
+            bot.profile(update, context)
+            self.assertIn('between 0 and 1', update.message.replies[-1])
+            context.args = ['off']
+            bot.profile(update, context)
+            self.assertFalse(PROFILER.enabled)
+        context.args = ['1']
+        bot.profile(update, context)
+        self.assertFalse(PROFILER.enabled)
@@ -0,0 +1,63 @@
+"""Testing module"""
+
+import datetime
+import unittest
+from acc_bot import bot
+from acc_bot.entry import EntryParser
+from acc_bot.i18n import CATEGORIES_FLAT
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.report import parse_report, period
+
+
+class ReportTest(unittest.TestCase):
+    """Main class for period reports testing."""
+
+    now = datetime.datetime(2022, 5, 18, 15, 30)
+    parser = EntryParser(CATEGORIES_FLAT)
+
+    def test_period(self):
+        """Test days, months, ISO weeks and keywords."""
+        day = datetime.datetime
+        self.assertEqual(period('2022-05-16', self.now), (day(2022, 5, 16), day(2022, 5, 17)))
+        self.assertEqual(period('2022-12', self.now), (day(2022, 12, 1), day(2023, 1, 1)))
+        self.assertEqual(period('2022-W20', self.now), (day(2022, 5, 16), day(2022, 5, 23)))
+        self.assertEqual(period('week', self.now), (day(2022, 5, 16), day(2022, 5, 23)))
+        self.assertEqual(period('month', self.now), (day(2022, 5, 1), day(2022, 6, 1)))
+        self.assertEqual(period('today', self.now), (day(2022, 5, 18), day(2022, 5, 19)))
+        for word in ('2022-13', 'transport', '2022-W60'):
+            with self.assertRaises(ValueError):
+                period(word, self.now)
+
+    def test_parse_report(self):
+        """Test ranges span from the first period to the second and end with an optional category."""
+        day = datetime.datetime
+        self.assertEqual(parse_report([], self.now, self.parser), (day(2022, 5, 1), day(2022, 6, 1), None))
+        self.assertEqual(parse_report(['2022-04', '2022-05-02', 'tr'], self.now, self.parser),
+                         (day(2022, 4, 1), day(2022, 5, 3), 'transport'))
+        self.assertEqual(parse_report(['week', 'pharmacy'], self.now, self.parser),
+                         (day(2022, 5, 16), day(2022, 5, 23), 'pharmacy'))
+        for args in (['2022-05', '2022-04'], ['month', 'casino'], ['2022-05-01', '2022-05-02', '2022-05-03']):
+            with self.assertRaises(ValueError):
+                parse_report(args, self.now, self.parser)
+
+    def test_handler(self):
+        """Test reports of a range, of one category and the usage hint."""
+        context = FakeContext({})
+        ledger = bot.get_user(make_update(1, '/start'), context)['data']
+        for day, category in ((1, 'transport'), (2, 'pharmacy'), (3, 'transport'), (40, 'other')):
+            ledger.add(datetime.datetime(2022, 3, 1) + datetime.timedelta(days=day), category, day)
+        update = make_update(1, '/report 2022-03-01 2022-03-31')
+        context.args = ['2022-03-01', '2022-03-31']
+        bot.report(update, context)
+        self.assertEqual(update.message.replies[0],
+                         'Spendings from 2022-03-01 to 2022-03-31:\n\n1. transport: 4\n2. pharmacy: 2\n'
+                         '\nAnd the total is: 6 moneys!💸')
+        context.args = ['2022-W09', 'transport']
+        bot.report(update, context)
+        self.assertEqual(update.message.replies[1], 'transport from 2022-02-28 to 2022-03-06: 4 moneys')
+        context.args = ['2021']
+        bot.report(update, context)
+        self.assertTrue(update.message.replies[2].startswith('Usage: /report'))
+        context.args = ['2021-01']
+        bot.report(update, context)
+        self.assertEqual(update.message.replies[3], 'No spendings from 2021-01-01 to 2021-01-31 😢')
@@ -0,0 +1,51 @@
+"""Testing module"""
+
+import unittest
+from acc_bot import bot
+from acc_bot.ledger import CATEGORY_TABLE, Ledger
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.loadtest import memory_run
+from acc_bot.session import State, UserSession, get_session
+
+
+class SessionTest(unittest.TestCase):
+    """Main class for compact user state testing."""
+
+    def test_session(self):
+        """Test session is created once, reset keeps the language and has no instance dict."""
+        user_data = {}
+        session = get_session(user_data)
+        self.assertIs(get_session(user_data), session)
+        session.lang, session.state, session.category, session.aggression = 'ru', State.LIMIT_AMOUNT, 'other', 2
+        session.reset()
+        self.assertEqual((session.state, session.category, session.aggression, session.lang),
+                         (State.FREE, None, 0, 'ru'))
+        with self.assertRaises(AttributeError):
+            session.context = 'free'
+        self.assertFalse(hasattr(UserSession(), '__dict__'))
+
+    def test_scenario(self):
+        """Test the add scenario walks through the states."""
+        context = FakeContext({})
+        bot.add(make_update(1, '/add'), context)
+        self.assertIs(get_session(context.user_data).state, State.CHOOSE_SPENDING)
+        bot.category_chooser(make_update(1, 'transport'), context)
+        session = get_session(context.user_data)
+        self.assertEqual((session.state, session.category), (State.SPENDING_AMOUNT, 'transport'))
+        bot.category_upd(make_update(1, '12'), context)
+        self.assertIs(session.state, State.FREE)
+        self.assertEqual(len(context.bot_data['users'].get(1)['data']), 1)
+
+    def test_interned(self):
+        """Test ledgers share one interned category table."""
+        first, second = Ledger(), Ledger()
+        self.assertIs(first.categories, second.categories)
+        self.assertFalse(hasattr(first, '__dict__'))
+        code = CATEGORY_TABLE.code(''.join(['trans', 'port']))
+        self.assertIs(CATEGORY_TABLE.names[code], CATEGORY_TABLE.names[CATEGORY_TABLE.code('transport')])
+
+    def test_memory(self):
+        """Test histories take less memory than the legacy dict encoding."""
+        stats = memory_run(users=50, entries=20, sample=10)
+        self.assertEqual(stats['spendings'], 1000)
+        self.assertLess(stats['bytes_per_spending'], stats['legacy_bytes_per_spending'] / 2)
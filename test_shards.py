@@ -0,0 +1,95 @@
+"""Testing module"""
+
+import os
+import tempfile
+import unittest
+import multiprocessing
+from telegram import Update
+from acc_bot.config import parse_config
+from acc_bot.fakes import SilentBot, update_json
+from acc_bot.loadtest import shard_run
+from acc_bot.shards import ShardPool, shard_of
+from acc_bot.storage import Storage
+
+
+def write_rows(path: str, shard: int, batches: int, start) -> None:
+    """Write batches of spendings of the shard's user as a shard process does."""
+    storage = Storage(path)
+    start.wait()
+    for number in range(batches):
+        storage.write([(shard, number * 100 + row, 'transport', 1) for row in range(100)])
+    storage.close()
+
+
+class ShardsTest(unittest.TestCase):
+    """Main class for multi-process mode testing."""
+
+    def test_shard_of(self):
+        """Test users are spread by ID and updates without one go to the first shard."""
+        self.assertEqual([shard_of(user_id, 3) for user_id in range(6)], [0, 1, 2, 0, 1, 2])
+        self.assertEqual(shard_of(None, 3), 0)
+
+    def test_scenarios(self):
+        """Test multi-step scenarios of users complete in their shards and reach the shared database."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.db')
+            Storage(path).close()
+            pool = ShardPool(2, parse_config(['--db', path, '--token', '123:test'], {}), bot_factory=SilentBot)
+            pool.start()
+            bot = SilentBot()
+            number = 0
+            for text in ('/add', 'transport', '12', '30 pharmacy'):
+                for user_id in range(1, 5):
+                    number += 1
+                    pool.submit(Update.de_json(update_json(number, user_id, text), bot))
+            pool.stop()
+            self.assertEqual(pool.health()['routed'], [8, 8])
+            self.assertEqual(pool.done(), 16)
+            storage = Storage(path)
+            for user_id in range(1, 5):
+                self.assertEqual(storage.load(user_id)[0].totals(), {'transport': 12, 'pharmacy': 30})
+            storage.close()
+
+    def test_dead_worker(self):
+        """Test a dead worker is restarted on its queue and one dying too often fails loudly."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.db')
+            config = parse_config(['--db', path, '--token', '123:test'], {})
+            pool = ShardPool(2, config, bot_factory=SilentBot, max_restarts=1)
+            pool.start()
+            bot = SilentBot()
+            pool._processes[0].kill()  # pylint: disable=protected-access
+            pool._processes[0].join()  # pylint: disable=protected-access
+            pool.submit(Update.de_json(update_json(1, 2, '30 pharmacy'), bot))
+            pool.submit(Update.de_json(update_json(2, 1, '30 pharmacy'), bot))
+            self.assertEqual(pool.health()['restarts'], [1, 0])
+            pool._processes[0].kill()  # pylint: disable=protected-access
+            pool._processes[0].join()  # pylint: disable=protected-access
+            with self.assertRaises(RuntimeError):
+                pool.submit(Update.de_json(update_json(3, 2, '30 pharmacy'), bot))
+            pool.stop()
+            self.assertEqual(pool.processed[1].value, 1)
+
+    def test_concurrent_writes(self):
+        """Test shard processes writing the same database at once wait for each other instead of failing."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.db')
+            Storage(path).close()
+            context = multiprocessing.get_context('spawn')
+            start = context.Event()
+            processes = [context.Process(target=write_rows, args=(path, shard, 200, start)) for shard in range(2)]
+            for process in processes:
+                process.start()
+            start.set()
+            for process in processes:
+                process.join(60)
+            self.assertEqual([process.exitcode for process in processes], [0, 0])
+            storage = Storage(path)
+            self.assertEqual([len(storage.load(shard)[0]) for shard in range(2)], [20000, 20000])
+            self.assertEqual([storage.version(shard) for shard in range(2)], [200, 200])
+            storage.close()
+
+    def test_bench(self):
+        """Test the benchmark gets every message processed."""
+        stats = shard_run(shards=2, users=10, messages=2, entries=50)
+        self.assertEqual(stats['count'], 20)
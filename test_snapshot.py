@@ -0,0 +1,81 @@
+"""Testing module"""
+
+import os
+import tempfile
+import unittest
+import datetime
+from acc_bot.loadtest import snapshot_run
+from acc_bot.snapshot import Snapshot, SnapshotWriter, write_snapshot
+from acc_bot.storage import Storage, UserStore
+
+
+class SnapshotTest(unittest.TestCase):
+    """Main class for snapshot testing."""
+
+    def setUp(self):
+        """Create database with a few users in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.snapshot')
+        self.storage = Storage(os.path.join(self.tmp.name, 'test.db'))
+        self.moment = datetime.datetime(2022, 5, 10, 12)
+        users = UserStore(self.storage)
+        users.add_spending(5, self.moment, 'pharmacy', 10)
+        users.add_spending(5, self.moment - datetime.timedelta(days=1), 'transport', 20)
+        users.set_limit(5, 'pharmacy', 100)
+        users.set_limit(7, 'other', 5)
+        users.add_spending(2, self.moment, 'other', 30)
+
+    def tearDown(self):
+        """Remove temporary files."""
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        """Test ledgers and limits of every user are restored."""
+        self.assertEqual(write_snapshot(self.storage, self.path)['users'], 3)
+        snapshot = Snapshot(self.path)
+        self.assertEqual(len(snapshot), 3)
+        for user_id in (2, 5, 7, 9):
+            ledger, limits = snapshot.load(user_id, self.storage.version(user_id))
+            expected_ledger, expected_limits = self.storage.load(user_id)
+            self.assertEqual(list(ledger.items()), list(expected_ledger.items()))
+            self.assertEqual(limits, expected_limits)
+        snapshot.close()
+
+    def test_stale_users(self):
+        """Test users changed after the snapshot are loaded from storage."""
+        write_snapshot(self.storage, self.path)
+        snapshot = Snapshot(self.path)
+        users = UserStore(self.storage, snapshot=snapshot)
+        UserStore(self.storage).add_spending(5, self.moment, 'other', 1)
+        self.assertEqual(len(users.get(5)['data']), 3)
+        self.assertEqual(users.get(7)['limits'], {'other': 5})
+        self.assertEqual((snapshot.restored, snapshot.stale), (1, 1))
+        snapshot.close()
+
+    def test_atomic_replace(self):
+        """Test snapshots replace the old file and the open one keeps working."""
+        write_snapshot(self.storage, self.path)
+        snapshot = Snapshot(self.path)
+        UserStore(self.storage).add_spending(8, self.moment, 'other', 1)
+        writer = SnapshotWriter(self.storage, self.path, interval=3600)
+        writer.write()
+        writer.close()
+        self.assertEqual(len(Snapshot(self.path)), 4)
+        self.assertEqual(len(snapshot), 3)
+        self.assertEqual(os.listdir(self.tmp.name).count('test.snapshot'), 1)
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if name.endswith('.tmp')])
+        snapshot.close()
+
+    def test_not_snapshot(self):
+        """Test other files are refused."""
+        with open(self.path, 'wb') as out:
+            out.write(b'\0' * 100)
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+    def test_bench(self):
+        """Test the benchmark restores users."""
+        stats = snapshot_run(users=200, entries=5, sample=20)
+        self.assertEqual(stats['spendings'], 1000)
+        self.assertGreater(stats['snapshot_bytes'], 1000 * 17)
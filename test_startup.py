@@ -0,0 +1,29 @@
+"""Testing module"""
+
+import unittest
+from acc_bot.config import parse_config
+from acc_bot.loadtest import import_run
+
+# Modules the bot import must leave for later, the import time is checked by loadtest --import-time
+DEFERRED = ('numpy', 'matplotlib', 'seaborn', 'acc_bot.test_data', 'acc_bot.aio', 'acc_bot.webhook')
+
+
+class StartupTest(unittest.TestCase):
+    """Main class for startup testing."""
+
+    def test_deferred_imports(self):
+        """Test the bot import leaves the heavy modules for later."""
+        stats = import_run(repeat=1)
+        self.assertFalse(stats['modules'].intersection(DEFERRED))
+
+    def test_config(self):
+        """Test options come from the command line first, then the environment."""
+        environ = {'ACC_BOT_TOKEN': 'env', 'ACC_BOT_RUNTIME': 'webhook', 'ACC_BOT_METRICS_PORT': '9100'}
+        config = parse_config(['--token', 'cli', '--port', '8443'], environ)
+        self.assertEqual((config.token, config.runtime, config.port, config.metrics_port),
+                         ('cli', 'webhook', 8443, 9100))
+        config = parse_config([], {})
+        self.assertEqual((config.token, config.runtime, config.db, config.metrics_port),
+                         (None, 'polling', 'acc_bot.db', None))
+        with self.assertRaises(SystemExit):
+            parse_config(['--runtime', 'carrier-pigeon'], {})
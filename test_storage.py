@@ -0,0 +1,155 @@
+"""Testing module"""
+
+import os
+import time
+import sqlite3
+import threading
+import tempfile
+import unittest
+import datetime
+from acc_bot.test_data import load_test_data_1
+from acc_bot.ledger import Ledger
+from acc_bot.storage import Storage, UserStore, WriteBehind
+
+
+class SlowStorage:
+    """Storage failing the first writes and holding every write until released."""
+
+    def __init__(self, storage, failures=0):
+        """Wrap the storage."""
+        self.storage = storage
+        self.failures = failures
+        self.release = threading.Event()
+        self.writing = threading.Event()
+
+    def write(self, *args):
+        """Fail or write once released."""
+        self.writing.set()
+        self.release.wait(10)
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        self.storage.write(*args)
+
+
+class StorageTest(unittest.TestCase):
+    """Main class for storage testing."""
+
+    def setUp(self):
+        """Create database in a temporary directory."""
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'test.db')
+        self.storage = Storage(self.path)
+
+    def tearDown(self):
+        """Remove temporary database."""
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_roundtrip(self):
+        """Test spendings and limits survive reopening the database."""
+        users = UserStore(self.storage)
+        moment = datetime.datetime(2022, 5, 10, 12)
+        users.add_spending(1, moment, 'pharmacy', 10)
+        users.add_spending(1, moment - datetime.timedelta(days=1), 'transport', 20)
+        users.add_spending(2, moment, 'other', 30)
+        users.set_limit(1, 'pharmacy', 100)
+        self.storage.close()
+        self.storage = Storage(self.path)
+        ledger, limits = self.storage.load(1)
+        self.assertEqual(list(ledger.items()), [(moment - datetime.timedelta(days=1), ('transport', 20)),
+                                                (moment, ('pharmacy', 10))])
+        self.assertEqual(limits, {'pharmacy': 100})
+
+    def test_replace(self):
+        """Test the whole history is replaced."""
+        users = UserStore(self.storage)
+        users.add_spending(1, datetime.datetime(2022, 5, 10), 'pharmacy', 10)
+        ledger = Ledger.from_dict(load_test_data_1())
+        users.replace(1, ledger)
+        self.assertEqual(list(self.storage.load(1)[0].items()), list(ledger.items()))
+
+    def test_eviction(self):
+        """Test least recently used and idle users are evicted and reloaded."""
+        users = UserStore(self.storage, capacity=2, idle=datetime.timedelta(0))
+        users.add_spending(1, datetime.datetime(2022, 5, 10), 'pharmacy', 10)
+        users.get(2)
+        users.get(3)
+        self.assertEqual(len(users), 2)
+        self.assertEqual(users.evict_idle(), 2)
+        self.assertEqual(len(users), 0)
+        self.assertEqual(len(users.get(1)['data']), 1)
+
+    def test_memory_only(self):
+        """Test users are never evicted without storage."""
+        users = UserStore(capacity=1, idle=datetime.timedelta(0))
+        users.add_spending(1, datetime.datetime(2022, 5, 10), 'pharmacy', 10)
+        users.get(2)
+        self.assertEqual(users.evict_idle(), 0)
+        self.assertEqual(len(users.get(1)['data']), 1)
+
+    def test_write_behind(self):
+        """Test queued changes are committed in batches and on close."""
+        writer = WriteBehind(self.storage, batch_size=1000, interval=60)
+        users = UserStore(self.storage, writer=writer)
+        moment = datetime.datetime(2022, 5, 10, 12)
+        for i in range(10):
+            users.add_spending(1, moment + datetime.timedelta(minutes=i), 'pharmacy', i)
+        users.set_limit(1, 'pharmacy', 5)
+        users.set_limit(1, 'pharmacy', 50)
+        self.assertEqual(writer.stats()['queue_depth'], 11)
+        self.assertEqual(len(self.storage.load(1)[0]), 0)
+        users.close()
+        ledger, limits = self.storage.load(1)
+        self.assertEqual(list(ledger.amounts), list(range(10)))
+        self.assertEqual(limits, {'pharmacy': 50})
+        self.assertEqual(writer.stats()['flushes'], 1)
+        self.assertEqual(writer.stats()['queue_depth'], 0)
+
+    def test_write_behind_batch_size(self):
+        """Test flusher commits as soon as the batch is full."""
+        writer = WriteBehind(self.storage, batch_size=3, interval=60)
+        writer.put(spendings=[(1, i, 'other', i) for i in range(3)])
+        for _ in range(100):
+            if writer.flushes:
+                break
+            time.sleep(0.05)
+        self.assertEqual(len(self.storage.load(1)[0]), 3)
+        writer.close()
+
+    def test_reload_pending(self):
+        """Test evicted user with queued changes is reloaded with them."""
+        users = UserStore(self.storage, idle=datetime.timedelta(0),
+                          writer=WriteBehind(self.storage, batch_size=1000, interval=60))
+        users.add_spending(1, datetime.datetime(2022, 5, 10), 'pharmacy', 10)
+        users.evict_idle()
+        self.assertEqual(len(users.get(1)['data']), 1)
+        users.close()
+
+    def test_write_behind_retry(self):
+        """Test a failed batch stays queued and the flusher retries it."""
+        storage = SlowStorage(self.storage, failures=2)
+        storage.release.set()
+        writer = WriteBehind(storage, batch_size=1, interval=0.01)
+        writer.put(spendings=[(1, 1, 'other', 5)])
+        for _ in range(200):
+            if writer.flushes:
+                break
+            time.sleep(0.01)
+        self.assertEqual(writer.failures, 2)
+        self.assertEqual(len(self.storage.load(1)[0]), 1)
+        writer.close()
+
+    def test_pending_while_committing(self):
+        """Test users of the batch being committed stay pending until it is committed."""
+        storage = SlowStorage(self.storage)
+        writer = WriteBehind(storage, batch_size=1000, interval=60)
+        writer.put(spendings=[(1, 1, 'other', 5)])
+        flusher = threading.Thread(target=writer.flush)
+        flusher.start()
+        self.assertTrue(storage.writing.wait(5))
+        self.assertTrue(writer.pending(1))
+        storage.release.set()
+        flusher.join()
+        self.assertFalse(writer.pending(1))
+        writer.close()
@@ -0,0 +1,44 @@
+"""Testing module"""
+
+import unittest
+import datetime
+import numpy as np
+from acc_bot.test_data import CATEGORIES_FLAT, generate_arrays, generate_ledgers, load_test_data_1
+
+
+class TestDataTest(unittest.TestCase):
+    """Main class for synthetic data testing."""
+
+    END = datetime.datetime(2022, 5, 10)
+
+    def test_arrays_shape(self):
+        """Test bulk arrays are sorted in time and lie within the span."""
+        ts, codes, amounts = generate_arrays(users=3, entries=500, end=self.END)
+        self.assertEqual(ts.shape, (3, 500))
+        self.assertTrue((np.diff(ts, axis=1) >= 0).all())
+        self.assertTrue((codes < len(CATEGORIES_FLAT)).all())
+        self.assertTrue(((amounts >= 5) & (amounts <= 2000)).all())
+
+    def test_seed(self):
+        """Test same seed gives the same data."""
+        first, second = generate_arrays(seed=7, end=self.END), generate_arrays(seed=7, end=self.END)
+        for left, right in zip(first, second):
+            self.assertTrue((left == right).all())
+
+    def test_weights(self):
+        """Test category distribution follows the weights."""
+        _, codes, _ = generate_arrays(entries=1000, weights=[1, 0, 0, 0, 0, 1], end=self.END)
+        self.assertEqual(set(np.unique(codes)), {0, 5})
+
+    def test_ledgers(self):
+        """Test ledgers hold generated spendings."""
+        ledgers = generate_ledgers(users=2, entries=100, span=datetime.timedelta(days=1), end=self.END)
+        self.assertEqual([len(ledger) for ledger in ledgers], [100, 100])
+        self.assertEqual(ledgers[0].categories, CATEGORIES_FLAT)
+        first = min(moment for moment, _ in ledgers[1].items())
+        self.assertGreaterEqual(first, self.END - datetime.timedelta(days=1))
+
+    def test_legacy_loader_unchanged(self):
+        """Test the fixed loader still reproduces the same costs."""
+        costs = [cost for _, cost in sorted(load_test_data_1().items())]
+        self.assertEqual([amount for _, amount in costs[:3]], [1314, 233, 56])
@@ -0,0 +1,94 @@
+"""Testing module"""
+
+import time
+import threading
+import unittest
+from acc_bot import bot
+from acc_bot.fakes import FakeContext, make_update
+from acc_bot.throttle import Coalescer, RateLimiter, TokenBucket
+
+
+class ThrottleTest(unittest.TestCase):
+    """Main class for rate limiting and coalescing testing."""
+
+    def test_bucket(self):
+        """Test burst is allowed and tokens come back with time."""
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([bucket.take(0) for _ in range(4)], [True, True, True, False])
+        self.assertEqual(bucket.denied, 1)
+        self.assertFalse(bucket.take(0.25))
+        self.assertTrue(bucket.take(0.5))
+        self.assertEqual(bucket.denied, 0)
+
+    def test_limiter(self):
+        """Test limits are kept per user and per command and full buckets are pruned."""
+        limiter = RateLimiter({'weeks': (1, 1)}, default=(10, 2), capacity=2)
+        self.assertTrue(limiter.allow(1, 'weeks', now=0))
+        self.assertFalse(limiter.allow(1, 'weeks', now=0.5))
+        self.assertTrue(limiter.allow(2, 'weeks', now=0.5))
+        self.assertTrue(limiter.allow(1, 'week', now=0.5))
+        self.assertEqual(len(limiter), 3)
+        self.assertTrue(limiter.allow(3, 'weeks', now=5))
+        self.assertEqual(len(limiter), 1)
+
+    def test_flood(self):
+        """Test flooding user is warned once and others are served."""
+        limited = []
+        limiter = RateLimiter({'weeks': (0.01, 2)})
+        handler = limiter.wrap(bot.weeks, lambda update, context, denied: limited.append(denied))
+        context = FakeContext({})
+        updates = [make_update(1, '/weeks') for _ in range(5)]
+        for update in updates:
+            handler(update, context)
+        handler(make_update(2, '/weeks'), FakeContext(context.bot_data))
+        self.assertEqual(limited, [1, 2, 3])
+        update = make_update(1, '/weeks')
+        bot.rate_limited(update, context, 1)
+        bot.rate_limited(update, context, 2)
+        self.assertEqual(len(update.message.replies), 1)
+
+    def test_coalescer(self):
+        """Test concurrent identical calls run once and share the result."""
+        calls = []
+
+        def slow(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return [value]
+
+        coalescer = Coalescer(ttl=0.2)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(coalescer.run('key', slow, 1))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertTrue(all(result is results[0] for result in results))
+        self.assertEqual(coalescer.shared, 3)
+        self.assertEqual(coalescer.run('other', slow, 2), [2])
+        time.sleep(0.2)
+        coalescer.run('key', slow, 1)
+        self.assertEqual(calls, [1, 2, 1])
+
+    def test_coalescer_error(self):
+        """Test failed call is not remembered."""
+        coalescer = Coalescer()
+        with self.assertRaises(ZeroDivisionError):
+            coalescer.run('key', lambda: 1 // 0)
+        self.assertEqual(coalescer.run('key', lambda: 1), 1)
+
+    def test_weeks_shared(self):
+        """Test repeated /weeks reuses the report until the history changes."""
+        context = FakeContext({})
+        bot.load_test_2(make_update(1, '/load_test_2'), context)
+        first, second = make_update(1, '/weeks'), make_update(1, '/weeks')
+        shared = bot.COALESCER.shared
+        bot.weeks(first, context)
+        bot.weeks(second, context)
+        self.assertIs(first.message.replies[0], second.message.replies[0])
+        self.assertEqual(bot.COALESCER.shared, shared + 1)
+        bot.quick_add(make_update(1, '5 other'), context)
+        third = make_update(1, '/weeks')
+        bot.weeks(third, context)
+        self.assertIsNot(third.message.replies[0], first.message.replies[0])
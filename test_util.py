@@ -9,7 +9,8 @@ from acc_bot.util import (
     gater_week,
     check_limit,
     make_spending_prediction,
-    make_pie
+    make_pie,
+    render_pie
 )
 
 class UtilTest(unittest.TestCase):
@@ -81,8 +82,14 @@ class UtilTest(unittest.TestCase):
         self.assertEqual(make_spending_prediction(data), expected_res)
 
     def test_make_pie(self):
-        """Test make_pie functionality."""
+        """Test make_pie renders PNG in memory."""
         data = load_test_data_1()
-        make_pie(data)
-        self.assertIn('tmp.png', os.listdir())
-        os.remove('tmp.png')
\ No newline at end of file
+        self.assertTrue(make_pie(data).startswith(b'\x89PNG'))
+        self.assertNotIn('tmp.png', os.listdir())
+
+    def test_make_pie_cached(self):
+        """Test make_pie reuses the chart for unchanged weekly data."""
+        data = load_test_data_1()
+        render_pie.cache_clear()
+        self.assertIs(make_pie(data), make_pie(data))
+        self.assertEqual(render_pie.cache_info().hits, 1)
\ No newline at end of file
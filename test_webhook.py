@@ -0,0 +1,77 @@
+"""Testing module"""
+
+import json
+import time
+import unittest
+import urllib.error
+import urllib.request
+from telegram import Bot, Update
+from telegram.ext import Dispatcher, Filters, MessageHandler
+from acc_bot.fakes import update_json
+from acc_bot.webhook import SECRET_HEADER, WebhookServer
+
+
+def post(url: str, body: bytes, headers: dict = None) -> int:
+    """Post the body and return response status."""
+    request = urllib.request.Request(url, body, {'Content-Type': 'application/json', **(headers or {})})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+class WebhookTest(unittest.TestCase):
+    """Main class for webhook server testing."""
+
+    def setUp(self):
+        """Create dispatcher recording handled messages."""
+        self.dispatcher = Dispatcher(Bot('123:test'), None, workers=0, use_context=True)
+        self.dispatcher.add_handler(MessageHandler(Filters.text, self.record))
+        self.handled = []
+
+    def record(self, update, _context):
+        """Blocking handler sleeping for the number of centiseconds in the message."""
+        time.sleep(int(update.message.text) / 100)
+        self.handled.append((update.effective_user.id, update.message.text))
+
+    def test_post_updates(self):
+        """Test posted updates are processed in order per user and counted."""
+        server = WebhookServer(self.dispatcher, port=0, workers=4)
+        server.start()
+        try:
+            for update_id, (user_id, text) in enumerate([(1, '20'), (1, '1'), (2, '1')], 1):
+                self.assertEqual(post(server.url, json.dumps(update_json(update_id, user_id, text)).encode()), 200)
+            server.drain()
+            self.assertEqual([text for user_id, text in self.handled if user_id == 1], ['20', '1'])
+            self.assertEqual(post(server.url, b'not json'), 400)
+            self.assertEqual(post(server.url.replace('/webhook', '/other'), b'{}'), 404)
+            with urllib.request.urlopen(server.url.replace('/webhook', '/health')) as response:
+                health = json.load(response)
+            self.assertEqual(health['status'], 'ok')
+            self.assertEqual((health['received'], health['processed'], health['failed']), (3, 3, 0))
+        finally:
+            server.stop()
+
+    def test_secret(self):
+        """Test updates without the configured secret token are refused."""
+        server = WebhookServer(self.dispatcher, port=0, workers=1, secret='s3cret')
+        server.start()
+        try:
+            body = json.dumps(update_json(1, 1, '0')).encode()
+            self.assertEqual(post(server.url, body), 403)
+            self.assertEqual(post(server.url, body, {SECRET_HEADER: 's3cret'}), 200)
+        finally:
+            server.stop()
+        self.assertEqual(self.handled, [(1, '0')])
+
+    def test_backlog(self):
+        """Test updates beyond the backlog are rejected."""
+        server = WebhookServer(self.dispatcher, port=0, workers=1, backlog=2)
+        bot = self.dispatcher.bot
+        accepted = [server.submit(Update.de_json(update_json(i, 1, '0'), bot)) for i in range(3)]
+        self.assertEqual(accepted, [True, True, False])
+        self.assertEqual(server.health()['rejected'], 1)
+        server.start()
+        server.stop()
+        self.assertEqual(len(self.handled), 2)
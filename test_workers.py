@@ -0,0 +1,78 @@
+"""Testing module"""
+
+import os
+import time
+import queue
+import unittest
+import concurrent.futures
+from acc_bot.util import render_pie
+from acc_bot.workers import PoolBusy, RenderPool
+
+
+class RenderPoolTest(unittest.TestCase):
+    """Main class for render pool testing."""
+
+    def setUp(self):
+        """Start a single worker pool without backlog."""
+        self.pool = RenderPool(workers=1, backlog=0, timeout=30)
+        self.results = queue.Queue()
+
+    def tearDown(self):
+        """Stop worker processes."""
+        self.pool.shutdown()
+
+    def deliver(self, result, error):
+        """Collect outcome of a task."""
+        self.results.put((result, error))
+
+    def test_render(self):
+        """Test chart is rendered in a worker and then served from cache."""
+        args = (('restaurants', 10), ('transport', 20))
+        self.pool.submit(self.deliver, render_pie, args)
+        photo, error = self.results.get(timeout=30)
+        self.assertIsNone(error)
+        self.assertTrue(photo.startswith(b'\x89PNG'))
+        self.pool.submit(self.deliver, render_pie, args)
+        self.assertIs(self.results.get_nowait()[0], photo)
+
+    def test_busy(self):
+        """Test pool refuses tasks when all slots are taken."""
+        self.pool.submit(self.deliver, time.sleep, 1)
+        self.assertRaises(PoolBusy, self.pool.submit, self.deliver, time.sleep, 0.5)
+        self.assertEqual(self.results.get(timeout=30), (None, None))
+
+    def test_coalesced(self):
+        """Test identical tasks in flight take no slot and share the outcome."""
+        args = (('pharmacy', 5),)
+        for _ in range(3):
+            self.pool.submit(self.deliver, render_pie, args)
+        outcomes = [self.results.get(timeout=30) for _ in range(3)]
+        self.assertEqual(self.pool.coalesced, 2)
+        self.assertTrue(all(photo is outcomes[0][0] and error is None for photo, error in outcomes))
+
+    def test_timeout(self):
+        """Test slow task is reported as timed out."""
+        self.pool.timeout = 0.1
+        self.pool.submit(self.deliver, time.sleep, 2)
+        result, error = self.results.get(timeout=30)
+        self.assertIsNone(result)
+        self.assertIsInstance(error, TimeoutError)
+        self.pool.timeout = 30
+        self.pool.submit(self.deliver, time.sleep, 0)
+        self.assertEqual(self.results.get(timeout=30), (None, None))
+        self.assertEqual(self.pool.recycled, 1)
+
+    def test_broken(self):
+        """Test workers are replaced after one dies and a failed submission frees its slot."""
+        self.pool.submit(self.deliver, os._exit, 1)
+        self.assertIsInstance(self.results.get(timeout=30)[1], concurrent.futures.BrokenExecutor)
+
+        def broken(*_args):
+            raise concurrent.futures.process.BrokenProcessPool('dead')
+
+        self.pool._executor.submit = broken  # pylint: disable=protected-access
+        self.pool.submit(self.deliver, time.sleep, 0)
+        self.assertIsInstance(self.results.get_nowait()[1], concurrent.futures.BrokenExecutor)
+        self.pool.submit(self.deliver, time.sleep, 0)
+        self.assertEqual(self.results.get(timeout=30), (None, None))
+        self.assertEqual(self.pool.recycled, 2)